@@ -0,0 +1,104 @@
+"""
+Parallel processing of independent branches of a graph.
+
+Run with : python benchmarks/bench_graph.py
+"""
+
+import os
+import time
+
+from libdsp.graph import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+class SpectrumDSPModule(DSPModule):
+    """heavy per-channel work in numpy kernels releasing the GIL"""
+
+    def __init__(self, name="", caps=None):
+        super().__init__(name)
+        self.add_input(DSPInputPort("in", caps=caps))
+        self.add_output(DSPOutputPort("out"))
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self):
+        x = self.input("in").data
+        spectrum = np.fft.rfft(x * np.hanning(x.shape[-1]))
+        self.output("out").data[...] = np.fft.irfft(
+            spectrum * spectrum.conj(), n=x.shape[-1]
+        )
+        pass
+
+
+def build_graph(n_branches: int, block_size: int) -> DSPGraph:
+    graph = DSPGraph()
+    for i in range(n_branches):
+        module = graph.add_module(SpectrumDSPModule("branch%d" % i))
+        module.input("in").data = np.random.standard_normal(block_size)
+    graph.prepare(block_size)
+    return graph
+
+
+def bench_graph_executor(
+    n_branches: int = 32, block_size: int = 1 << 16, n_blocks: int = 20
+):
+    """Blocks per second with 1/2/4/8 threads."""
+
+    print("%d cores available" % os.cpu_count())
+
+    graph = build_graph(n_branches, block_size)
+
+    t = time.perf_counter()
+    for _ in range(n_blocks):
+        graph.process()
+    ref = (time.perf_counter() - t) / n_blocks
+    print("sequential : %.2f ms per block" % (1e3 * ref))
+
+    for workers in (1, 2, 4, 8):
+        with DSPGraphExecutor(graph, max_workers=workers) as executor:
+            executor.process()
+            t = time.perf_counter()
+            for _ in range(n_blocks):
+                executor.process()
+            dt = (time.perf_counter() - t) / n_blocks
+        print(
+            "%d threads : %.2f ms per block, speedup x%.2f"
+            % (workers, 1e3 * dt, ref / dt)
+        )
+
+    return
+
+
+def bench_negotiate(n_modules: int = 5000, block_size: int = 256):
+    """Time to negotiate the format of a chain of modules, some of them constrained."""
+
+    graph = DSPGraph()
+    previous = None
+    for i in range(n_modules):
+        caps = {}
+        if i % 7 == 0:
+            caps["samplerate"] = DSPVariable(float, set=(44100.0, 48000.0, 96000.0))
+        if i % 11 == 0:
+            caps["blocksize"] = DSPVariable(int, range=(32, 32, 4096, 256))
+        module = graph.add_module(SpectrumDSPModule("module%d" % i, caps))
+        if previous is not None:
+            graph.connect(previous, "out", module, "in")
+        previous = module
+
+    t = time.perf_counter()
+    graph.negotiate(samplerate=48000.0, blocksize=block_size)
+    print(
+        "negotiate %d modules : %.1f ms" % (n_modules, 1e3 * (time.perf_counter() - t))
+    )
+
+    return
+
+
+if __name__ == "__main__":
+    bench_graph_executor()
+    bench_negotiate()
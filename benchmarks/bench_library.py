@@ -0,0 +1,117 @@
+"""
+Throughput of the library modules.
+
+Run with : python benchmarks/bench_library.py
+"""
+
+import time
+
+from libdsp.library import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+def throughput(module: DSPModule, block_size: int, n_samples: int = 1 << 20) -> float:
+    """Samples per second processed block by block."""
+
+    module.prepare(block_size)
+    x = np.random.standard_normal(block_size)
+    n_blocks = max(1, n_samples // block_size)
+
+    module.process_block(x)
+    t = time.perf_counter()
+    for _ in range(n_blocks):
+        module.process_block(x)
+    dt = time.perf_counter() - t
+
+    return n_blocks * block_size / dt
+
+
+def bench_library():
+    """Samples per second for several block sizes."""
+
+    modules = {
+        "gain": DSPGain(gain=-6.0),
+        "biquad x4": DSPBiquad(cutoff=1000.0, stages=4),
+        "fir 256 taps": DSPFIRFilter(taps=np.hanning(256) / 128),
+    }
+
+    for name, module in modules.items():
+        for block_size in (64, 256, 1024, 4096):
+            print(
+                "%-14s block %5d : %8.2f Msamples/s"
+                % (name, block_size, 1e-6 * throughput(module, block_size))
+            )
+
+    return
+
+
+def bench_convolver(block_size: int = 256):
+    """Samples per second of the partitioned convolver for growing impulse responses."""
+
+    for n_taps in (1 << 10, 1 << 13, 1 << 16):
+        ir = np.random.standard_normal(n_taps)
+        rates = (
+            throughput(DSPFIRFilter(taps=ir), block_size, 1 << 16),
+            throughput(DSPConvolver(ir=ir), block_size, 1 << 16),
+        )
+        print(
+            "%6d taps, block %d : overlap-add %8.2f Msamples/s, partitioned %8.2f Msamples/s"
+            % ((n_taps, block_size) + tuple(1e-6 * r for r in rates))
+        )
+
+    return
+
+
+def bench_coefficient_cache(n_updates: int = 2000):
+    """Cost of a biquad update, coefficients computed or found in the cache."""
+
+    biquad = DSPBiquad(stages=4)
+    cutoffs = np.linspace(500.0, 2000.0, 16)
+
+    # the cache is shared by all the filters, restored for the other benchmarks
+    cache = DSPBiquad.cache
+    try:
+        for label, maxsize in (("no cache", 1), ("cached", 64)):
+            DSPBiquad.cache = DSPCoefficientCache(maxsize)
+            t = time.perf_counter()
+            for i in range(n_updates):
+                biquad.set_param("cutoff", float(cutoffs[i % len(cutoffs)]))
+            dt = (time.perf_counter() - t) / n_updates
+            print("biquad update, %-8s : %7.2f us" % (label, 1e6 * dt))
+    finally:
+        DSPBiquad.cache = cache
+
+    return
+
+
+def bench_precision(channels: int = 64, block_size: int = 1024, n_blocks: int = 50):
+    """Blocks of many channels in single and double precision."""
+
+    for name, module in (
+        ("gain", DSPGain(gain=-6.0)),
+        ("biquad x2", DSPBiquad(stages=2)),
+    ):
+        for dtype in (np.float64, np.float32):
+            module.prepare(block_size, dtype, channels)
+            x = np.random.standard_normal((channels, block_size)).astype(dtype)
+            module.process_block(x)
+            t = time.perf_counter()
+            for _ in range(n_blocks):
+                module.process_block(x)
+            dt = time.perf_counter() - t
+            print(
+                "%-10s %d channels, %-7s : %8.2f Msamples/s"
+                % (name, channels, np.dtype(dtype).name, 1e-6 * x.size * n_blocks / dt)
+            )
+
+    return
+
+
+if __name__ == "__main__":
+    bench_library()
+    bench_convolver()
+    bench_coefficient_cache()
+    bench_precision()
@@ -0,0 +1,64 @@
+"""
+Memory footprint of parameters.
+
+Run with : python benchmarks/bench_memory.py
+"""
+
+import tracemalloc
+
+from libdsp.parameters import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+def dict_layout(cls):
+    """Same class without __slots__ : attributes stored in a per-instance __dict__, the layout before slots were introduced."""
+    namespace = {
+        k: v for k, v in vars(cls).items() if k not in cls.__slots__ + ("__slots__",)
+    }
+    return type("Dict" + cls.__name__, (), namespace)
+
+
+# reference classes, same code as the library ones but dict-based
+DictDSPVariable = dict_layout(DSPVariable)
+DictDSPModuleParameter = dict_layout(DSPModuleParameter)
+
+
+def parameters_footprint(names: list, param_cls, var_cls):
+    """Memory allocated by one ranged float parameter per name, in bytes."""
+
+    tracemalloc.start()
+    ref, _ = tracemalloc.get_traced_memory()
+
+    params = [
+        param_cls(name=n, var=var_cls(float, range=(0.0, 0.1, 1.0))) for n in names
+    ]
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del params
+    return current - ref
+
+
+def bench_parameters_footprint(count: int = 100000):
+    """Memory allocated by <count> ranged float parameters, __slots__ layout against the dict-based reference."""
+
+    names = ["param%d" % i for i in range(count)]
+
+    slots = parameters_footprint(names, DSPModuleParameter, DSPVariable)
+    dicts = parameters_footprint(names, DictDSPModuleParameter, DictDSPVariable)
+
+    print("%d parameters :" % count)
+    print("%12s %10s %12s" % ("layout", "MB", "bytes/param"))
+    for layout, size in [("__dict__", dicts), ("__slots__", slots)]:
+        print("%12s %10.1f %12d" % (layout, size / 1e6, size / count))
+    print("__slots__ saves %.0f%%" % (100 * (1 - slots / dicts)))
+
+    return slots, dicts
+
+
+if __name__ == "__main__":
+    bench_parameters_footprint()
@@ -0,0 +1,85 @@
+"""
+Transport of small blocks of samples between two threads.
+
+Run with : python benchmarks/bench_streaming.py
+"""
+
+import queue
+import threading
+import time
+
+from libdsp.streaming import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+def transport_queue(x: np.ndarray, block_size: int) -> float:
+    """Seconds to move a signal through a queue of small arrays."""
+
+    q = queue.Queue(maxsize=64)
+
+    def produce():
+        for i in range(0, len(x), block_size):
+            q.put(x[i : i + block_size].copy())
+
+    producer = threading.Thread(target=produce)
+    t = time.perf_counter()
+    producer.start()
+    count = 0
+    while count < len(x):
+        count += len(q.get())
+    producer.join()
+
+    return time.perf_counter() - t
+
+
+def transport_ring(x: np.ndarray, block_size: int) -> float:
+    """Seconds to move a signal through a ring buffer."""
+
+    ring = DSPRingBuffer(64 * block_size)
+    out = np.empty(block_size)
+
+    def produce():
+        i = 0
+        while i < len(x):
+            n = ring.write(x[i : i + block_size])
+            if n < block_size:
+                time.sleep(0)  # full, let the consumer run
+            i += n
+
+    producer = threading.Thread(target=produce)
+    t = time.perf_counter()
+    producer.start()
+    count = 0
+    while count < len(x):
+        if ring.read(block_size, out) is None:
+            time.sleep(0)  # empty, let the producer run
+        else:
+            count += block_size
+    producer.join()
+
+    return time.perf_counter() - t
+
+
+def bench_transport(n_samples: int = 1 << 20):
+    """Samples per second moved from a producer thread to a consumer thread."""
+
+    x = np.random.standard_normal(n_samples)
+
+    for block_size in (16, 64, 256):
+        rates = (
+            n_samples / transport_queue(x, block_size),
+            n_samples / transport_ring(x, block_size),
+        )
+        print(
+            "block %4d : queue %7.2f Msamples/s, ring buffer %7.2f Msamples/s"
+            % ((block_size,) + tuple(1e-6 * r for r in rates))
+        )
+
+    return
+
+
+if __name__ == "__main__":
+    bench_transport()
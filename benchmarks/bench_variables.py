@@ -0,0 +1,41 @@
+"""
+Micro-benchmarks for DSPVariable.
+
+Run with : python benchmarks/bench_variables.py
+"""
+
+import timeit
+
+from libdsp.variables import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+def bench_scalar_setter(number: int = 200000):
+    """Scalar quantization of ranged variables : numpy ufuncs vs plain python fast path."""
+
+    for dtype, range, v in ((float, (0.0, 0.1, 1.0), 0.53), (int, (0, 3, 100), 37)):
+        var = DSPVariable(dtype, range=range)
+
+        t_numpy = timeit.timeit(lambda: var._quantize(v), number=number)
+        t_fast = timeit.timeit(lambda: var._quantize_scalar(v), number=number)
+        t_setter = timeit.timeit(lambda: setattr(var, "val", v), number=number)
+
+        print(
+            "%-6s numpy %.3f us | fast path %.3f us | setter %.3f us | speedup x%.1f"
+            % (
+                dtype.__name__,
+                1e6 * t_numpy / number,
+                1e6 * t_fast / number,
+                1e6 * t_setter / number,
+                t_numpy / t_fast,
+            )
+        )
+
+    return
+
+
+if __name__ == "__main__":
+    bench_scalar_setter()
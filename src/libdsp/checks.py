@@ -0,0 +1,173 @@
+import sys
+import tracemalloc
+
+from libdsp.modules import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+"""
+
+CHECKS are development helpers asserting that modules behave as expected in a streaming context.
+
+"""
+
+
+def measure_block_allocations(
+    module: DSPModule, inputs, n_blocks: int = 16, warmup: int = 4
+) -> int:
+    """Memory allocated while processing one block in steady state, with process_block().
+
+    The peak of memory traced by tracemalloc is measured for each block, the smallest one is kept : one-off allocations (warmup, caches) are ignored while per-block allocations show on every block. Trace functions (debuggers, coverage) allocate on their own and are suspended meanwhile.
+
+    Args:
+        module (DSPModule): prepared module.
+        inputs (np.ndarray): block of data.
+        n_blocks (int, optional): number of blocks measured. Defaults to 16.
+        warmup (int, optional): number of blocks processed before measuring. Defaults to 4.
+
+    Returns:
+        int: bytes allocated per block.
+    """
+
+    for _ in range(warmup):
+        module.process_block(inputs)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+
+    trace = sys.gettrace()
+    sys.settrace(None)
+
+    get = tracemalloc.get_traced_memory
+    reset = tracemalloc.reset_peak
+    allocated = None
+
+    try:
+        for _ in range(n_blocks):
+            reset()
+            current = get()[0]
+            module.process_block(inputs)
+            peak = get()[1] - current
+            allocated = peak if allocated is None else min(allocated, peak)
+    finally:
+        sys.settrace(trace)
+        if not tracing:
+            tracemalloc.stop()
+
+    return allocated
+
+
+def assert_no_allocations(
+    module: DSPModule, inputs, n_blocks: int = 16, tolerance: int = 256
+):
+    """Assert that processing a block with process_block() does not allocate memory in steady state.
+
+    Python itself allocates a few small objects on method calls : allocations below <tolerance> bytes are ignored, a temporary array allocated per block (header and data) is larger as soon as blocks have a few tens of samples.
+
+    Args:
+        module (DSPModule): prepared module.
+        inputs (np.ndarray): block of data.
+        n_blocks (int, optional): number of blocks measured. Defaults to 16.
+        tolerance (int, optional): bytes tolerated per block. Defaults to 256.
+    """
+
+    allocated = measure_block_allocations(module, inputs, n_blocks)
+    if allocated > tolerance:
+        raise AssertionError(
+            "DSPModule <%s> allocates %d bytes per block in steady state"
+            % (type(module).__name__, allocated)
+        )
+
+    return
+
+
+def output_dtype(module: DSPModule, inputs: np.ndarray) -> np.dtype:
+    """Datatype of the output of process() for a block of data.
+
+    process() is called directly : process_block() writes into the preallocated buffer of the module, which would hide a promotion.
+
+    Args:
+        module (DSPModule): module processing blocks of data (process(x)).
+        inputs (np.ndarray): block of data.
+
+    Returns:
+        np.dtype: datatype of the output.
+    """
+    return np.asarray(module.process(inputs)).dtype
+
+
+def find_promotions(
+    modules: list, block_size: int, dtype: np.dtype = np.float32, channels: int = None
+) -> list:
+    """Modules promoting blocks of a datatype to a wider one, typically float32 blocks computed and returned as float64.
+
+    Each module is prepared with the format and processes a block of noise :
+    - modules processing arrays (process(x), DSPSignalModule included) : datatype of the returned block
+    - modules reading and writing ports (process()) : unconnected inputs are fed, connected ones read the outputs of the checked modules, then the datatypes of the output buffers are checked (eg. a port declared float64). Temporaries promoted within process() and cast back on writing into the buffers do not show.
+
+    Modules whose connected inputs are fed by a module out of the list are skipped. The states of the checked modules are altered : reset or prepare them again before processing.
+
+    Args:
+        modules (list): modules to check (eg. DSPGraph.modules).
+        block_size (int): number of samples per block.
+        dtype (np.dtype, optional): datatype of the samples. Defaults to np.float32.
+        channels (int, optional): number of channels, None for single signals. Defaults to None.
+
+    Returns:
+        list: (module, datatype of its output) for each module promoting the samples.
+    """
+
+    dtype = np.dtype(dtype)
+    shape = (block_size,) if channels is None else (channels, block_size)
+    rng = np.random.default_rng(0)
+    inputs = rng.standard_normal(shape).astype(dtype)
+
+    # all the modules prepared first, connected inputs are bound to the outputs of their sources
+    for module in modules:
+        module.prepare(block_size, dtype, channels)
+
+    promotions = []
+    for module in modules:
+        if isinstance(module, DSPSignalModule) or not (module.inputs or module.outputs):
+            out = output_dtype(module, inputs)
+            if out != dtype:
+                promotions.append((module, out))
+            continue
+
+        for port in module.inputs:
+            if port.source is None:
+                port_shape = shape if port.shape is None else port.shape
+                port_shape = tuple(block_size if d is None else d for d in port_shape)
+                port_dtype = dtype if port.dtype is None else port.dtype
+                port.data = rng.standard_normal(port_shape).astype(port_dtype)
+        if any(port.data is None for port in module.inputs):
+            continue
+
+        module()
+        for port in module.outputs:
+            if port.data.dtype != dtype:
+                promotions.append((module, port.data.dtype))
+                break
+
+    return promotions
+
+
+def assert_no_promotion(module: DSPModule, inputs: np.ndarray):
+    """Assert that process() returns blocks of the datatype of its inputs.
+
+    Args:
+        module (DSPModule): module processing blocks of data (process(x)).
+        inputs (np.ndarray): block of data.
+    """
+
+    out = output_dtype(module, inputs)
+    if out != inputs.dtype:
+        raise AssertionError(
+            "DSPModule <%s> promotes %s blocks to %s"
+            % (type(module).__name__, inputs.dtype, out)
+        )
+
+    return
@@ -0,0 +1,367 @@
+import struct
+
+from libdsp.streaming import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+"""
+
+FILES are read and written through memory maps (np.memmap) : blocks are views on the file mapped in memory, only the pages being processed are loaded, so that memory usage does not depend on the length of the files.
+
+Supported formats :
+- raw : interleaved samples of any numpy datatype, with an optional header to skip
+- wav : PCM 8/16/32 bits and IEEE float 32/64 bits (24 bits PCM cannot be mapped on a numpy datatype)
+
+Samples are interleaved on disk (frames, channels) while blocks follow the convention of the modules (channels, samples), single channels being 1-D.
+
+"""
+
+# wav format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# numpy datatypes of the wav formats, by (format tag, bits per sample)
+_WAV_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+}
+
+
+def _read_wav_header(path: str) -> tuple:
+    """Parse the chunks of a wav file.
+
+    Returns:
+        tuple: (dtype, channels, samplerate, data offset, number of frames)
+    """
+
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError("DSPFileSource WAV : <%s> is not a wav file" % path)
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("DSPFileSource WAV : no data chunk in <%s>" % path)
+            chunk, size = struct.unpack("<4sI", header)
+
+            if chunk == b"fmt ":
+                body = f.read(size + size % 2)
+                tag, channels, samplerate, _, _, bits = struct.unpack(
+                    "<HHIIHH", body[:16]
+                )
+                if tag == WAVE_FORMAT_EXTENSIBLE:
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, bits, channels, samplerate)
+
+            elif chunk == b"data":
+                if fmt is None:
+                    raise ValueError(
+                        "DSPFileSource WAV : data chunk before fmt chunk in <%s>" % path
+                    )
+                offset = f.tell()
+                break
+
+            else:
+                f.seek(size + size % 2, 1)
+
+    tag, bits, channels, samplerate = fmt
+    dtype = _WAV_DTYPES.get((tag, bits))
+    if dtype is None:
+        raise ValueError(
+            "DSPFileSource WAV : format %d with %d bits per sample is not supported"
+            % (tag, bits)
+        )
+
+    return dtype, channels, samplerate, offset, size // (channels * dtype.itemsize)
+
+
+def _full_scale(dtype: np.dtype) -> tuple:
+    """Scale and offset mapping integer samples on [-1, 1)."""
+    if dtype.kind == "u":
+        return float(2 ** (8 * dtype.itemsize - 1)), float(
+            2 ** (8 * dtype.itemsize - 1)
+        )
+    return float(2 ** (8 * dtype.itemsize - 1)), 0.0
+
+
+class DSPFileSource:
+    """Memory-mapped file read block by block."""
+
+    def __init__(
+        self,
+        path: str,
+        dtype: np.dtype,
+        channels: int = 1,
+        offset: int = 0,
+        samplerate: int = None,
+        frames: int = None,
+    ):
+        """Initialisation of a source reading raw interleaved samples.
+
+        Args:
+            path (str): path of the file.
+            dtype (np.dtype): datatype of the samples on disk.
+            channels (int, optional): number of interleaved channels. Defaults to 1.
+            offset (int, optional): size of the header to skip, in bytes. Defaults to 0.
+            samplerate (int, optional): sample rate, for information. Defaults to None.
+            frames (int, optional): number of frames, None for the rest of the file. Defaults to None.
+        """
+        self._path = path
+        self._dtype = np.dtype(dtype)
+        self._channels = channels
+        self._samplerate = samplerate
+        self._map = np.memmap(
+            path,
+            dtype=self._dtype,
+            mode="r",
+            offset=offset,
+            shape=None if frames is None else (frames, channels),
+        ).reshape(-1, channels)
+
+        return
+
+    @classmethod
+    def wav(cls, path: str):
+        """Source reading a wav file.
+
+        Args:
+            path (str): path of the file.
+
+        Returns:
+            DSPFileSource: source on the samples of the file.
+        """
+        dtype, channels, samplerate, offset, frames = _read_wav_header(path)
+        return cls(path, dtype, channels, offset, samplerate, frames)
+
+    def __repr__(self) -> str:
+        return "DSPFileSource <%s> (%d frames, %d channels, %s)" % (
+            self._path,
+            len(self),
+            self._channels,
+            self._dtype,
+        )
+
+    def __len__(self) -> int:
+        return self._map.shape[0]
+
+    @property
+    def channels(self) -> int:
+        return self._channels
+
+    @property
+    def samplerate(self) -> int:
+        return self._samplerate
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    def blocks(self, block_size: int, as_float: bool = False):
+        """Read the file block by block.
+
+        Args:
+            block_size (int): number of frames per block (the last one may be shorter).
+            as_float (bool, optional): convert integer samples to float64 in [-1, 1), this copies each block. Defaults to False (views on the file).
+
+        Yields:
+            np.ndarray: (channels, samples) blocks, (samples,) for a single channel.
+        """
+
+        scale, zero = _full_scale(self._dtype)
+        convert = as_float and self._dtype.kind in "iu"
+
+        for i in range(0, len(self), block_size):
+            block = self._map[i : i + block_size].T
+            if self._channels == 1:
+                block = block[0]
+            if convert:
+                block = (block - zero) / scale
+            yield block
+
+        return
+
+
+class DSPFileSink:
+    """Memory-mapped file written block by block, its length is known beforehand."""
+
+    def __init__(
+        self,
+        path: str,
+        frames: int,
+        dtype: np.dtype,
+        channels: int = 1,
+        offset: int = 0,
+    ):
+        """Initialisation of a sink writing raw interleaved samples, the file is created (or overwritten after <offset> bytes).
+
+        Args:
+            path (str): path of the file.
+            frames (int): number of frames of the file.
+            dtype (np.dtype): datatype of the samples on disk.
+            channels (int, optional): number of interleaved channels. Defaults to 1.
+            offset (int, optional): size of the header preserved at the beginning of the file, in bytes. Defaults to 0.
+        """
+        self._path = path
+        self._dtype = np.dtype(dtype)
+        self._channels = channels
+        self._pos = 0  # frames written so far
+
+        # create the file at its final size
+        with open(path, "r+b" if offset else "wb") as f:
+            f.truncate(offset + frames * channels * self._dtype.itemsize)
+
+        self._map = np.memmap(
+            path, dtype=self._dtype, mode="r+", offset=offset, shape=(frames, channels)
+        )
+
+        return
+
+    @classmethod
+    def wav(
+        cls,
+        path: str,
+        frames: int,
+        samplerate: int,
+        channels: int = 1,
+        dtype: np.dtype = np.float32,
+    ):
+        """Sink writing a wav file.
+
+        Args:
+            path (str): path of the file.
+            frames (int): number of frames of the file.
+            samplerate (int): sample rate.
+            channels (int, optional): number of channels. Defaults to 1.
+            dtype (np.dtype, optional): datatype of the samples on disk, see the supported formats. Defaults to np.float32.
+
+        Returns:
+            DSPFileSink: sink on the samples of the file.
+        """
+
+        dtype = np.dtype(dtype)
+        tag = WAVE_FORMAT_IEEE_FLOAT if dtype.kind == "f" else WAVE_FORMAT_PCM
+        bits = 8 * dtype.itemsize
+        if _WAV_DTYPES.get((tag, bits)) != dtype.newbyteorder("<"):
+            raise ValueError(
+                "DSPFileSink WAV : datatype %s is not supported" % str(dtype)
+            )
+
+        size = frames * channels * dtype.itemsize
+        if size + 36 > 0xFFFFFFFF:
+            raise ValueError("DSPFileSink WAV : data too large for a wav file")
+
+        header = struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF",
+            size + 36,
+            b"WAVE",
+            b"fmt ",
+            16,
+            tag,
+            channels,
+            samplerate,
+            samplerate * channels * dtype.itemsize,
+            channels * dtype.itemsize,
+            bits,
+            b"data",
+            size,
+        )
+        with open(path, "wb") as f:
+            f.write(header)
+
+        return cls(path, frames, dtype.newbyteorder("<"), channels, len(header))
+
+    def __repr__(self) -> str:
+        return "DSPFileSink <%s> (%d frames, %d channels, %s)" % (
+            self._path,
+            len(self),
+            self._channels,
+            self._dtype,
+        )
+
+    def __len__(self) -> int:
+        return self._map.shape[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    @property
+    def position(self) -> int:
+        """Number of frames written so far."""
+        return self._pos
+
+    def write(self, block: np.ndarray):
+        """Write a block after the previous ones.
+
+        Float blocks written to integer files are considered in [-1, 1) : they are scaled and clipped to the full scale of the datatype.
+
+        Args:
+            block (np.ndarray): (channels, samples) block, (samples,) for a single channel.
+        """
+
+        block = np.asarray(block)
+        n = block.shape[-1]
+        if self._pos + n > len(self):
+            raise ValueError(
+                "DSPFileSink WRITE : %d frames overflow the file (%d/%d written)"
+                % (n, self._pos, len(self))
+            )
+
+        if block.dtype.kind == "f" and self._dtype.kind in "iu":
+            scale, zero = _full_scale(self._dtype)
+            info = np.iinfo(self._dtype)
+            block = np.clip(np.round(block * scale + zero), info.min, info.max)
+
+        self._map[self._pos : self._pos + n] = block.reshape(-1, n).T
+        self._pos += n
+
+        return
+
+    def flush(self):
+        self._map.flush()
+        return
+
+    def close(self):
+        self.flush()
+        return
+
+
+def process_file(
+    modules: list,
+    source: DSPFileSource,
+    sink: DSPFileSink,
+    block_size: int,
+    as_float: bool = True,
+):
+    """Stream a file through a chain of DSPModules into another file, block by block.
+
+    Args:
+        modules (list): chain of DSPModules, called as module(block).
+        source (DSPFileSource): input file.
+        sink (DSPFileSink): output file, as long as the input.
+        block_size (int): number of frames per block.
+        as_float (bool, optional): integer samples are converted to float64 in [-1, 1). Defaults to True.
+    """
+
+    blocks = source.blocks(block_size, as_float)
+    for module in modules:
+        blocks = stream(module, blocks, block_size)
+
+    for block in blocks:
+        sink.write(block)
+
+    sink.flush()
+
+    return
@@ -0,0 +1,470 @@
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from fractions import Fraction
+from functools import reduce
+
+from libdsp.modules import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+"""
+
+GRAPHS wire DSPModules together through their ports.
+
+The graph is compiled once : connections are checked for cycles and the modules are sorted in topological order (a module runs after all the modules it reads from). Processing a block then runs a flat list of calls, without any lookup nor traversal of the graph.
+
+The processing format (sample rate, block size, channels, datatype) is negotiated once as well : the capabilities of the ports bound together, through connections and within modules, must agree on a common value, which is locked before the modules are prepared.
+
+"""
+
+
+def _find(parent: list, i: int) -> int:
+    """Root of the set of <i> (union-find with path halving)."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _on_grid(values: np.ndarray, rng: tuple) -> np.ndarray:
+    """Mask of the values kept as they are by a ranged variable : multiples of the step within the bounds, and the bounds."""
+    minv, stepv, maxv, _ = rng
+    steps = np.round(values / stepv) * stepv
+    exact = np.abs(steps - values) <= 1e-9 * np.maximum(1.0, np.abs(values))
+    return (
+        (values >= minv)
+        & (values <= maxv)
+        & (exact | (values == minv) | (values == maxv))
+    )
+
+
+def _common_step(ranges: list, lo, hi):
+    """Lowest common multiple of the steps of the ranges within [lo, hi], None if there is none.
+
+    Steps are taken as fractions (eg. 0.1 as 1/10) : scaled to integers by the common denominator, their lcm is exact.
+    """
+
+    steps = [Fraction(float(r[1])).limit_denominator(10**6) for r in ranges]
+    scale = reduce(lambda a, b: a * b // math.gcd(a, b), [f.denominator for f in steps])
+    ints = [int(f * scale) for f in steps]
+    if not all(ints):
+        return None
+    lcm = Fraction(reduce(lambda a, b: a * b // math.gcd(a, b), ints), scale)
+
+    value = math.ceil(Fraction(float(lo)) / lcm) * lcm
+    return float(value) if value <= float(hi) else None
+
+
+def _agree(variables: list, preferred=None):
+    """Value allowed by all the variables : the preferred one if possible, then the defaults of the constrained variables, then any allowed value.
+
+    Returns:
+        the agreed value, None if the variables have no value in common (or if none of them is constrained and nothing is preferred).
+    """
+
+    sets = [v._set for v in variables if v._set is not None]
+    ranges = [v.range for v in variables if v.range is not None]
+    if not sets and not ranges:
+        return preferred
+
+    candidates = [] if preferred is None else [preferred]
+    candidates += [v._default for v in variables if v._default is not None]
+
+    # strings : sets only, in the order of the first one
+    if isinstance(sets[0] if sets else None, dict):
+        allowed = [e for e in sets[0] if all(e in s for s in sets[1:])]
+        for c in candidates:
+            if c in allowed:
+                return c
+        return allowed[0] if allowed else None
+
+    # numbers : candidates from the sets, or the bounds of the ranges
+    if sets:
+        allowed = sets[0]
+        for s in sets[1:]:
+            allowed = np.intersect1d(allowed, s)
+    else:
+        # bounds of the overlap, or the first common step within it
+        lo, hi = max(r[0] for r in ranges), min(r[2] for r in ranges)
+        allowed = [lo, hi] if lo > hi else [lo, _common_step(ranges, lo, hi), hi]
+        allowed = np.array([v for v in allowed if v is not None], dtype=np.float64)
+    candidates = np.concatenate([np.asarray(candidates, dtype=np.float64), allowed])
+
+    mask = np.ones(len(candidates), dtype=bool)
+    for s in sets:
+        mask &= np.isin(candidates, s)
+    for rng in {r[:3] + (None,) for r in ranges}:
+        mask &= _on_grid(candidates, rng)
+
+    if not np.any(mask):
+        return None
+
+    return candidates[np.argmax(mask)].item()
+
+
+class DSPGraph:
+    """Set of DSPModules connected through their ports, processed block by block in topological order."""
+
+    def __init__(self, name: str = ""):
+        """Initialisation of an empty graph.
+
+        Args:
+            name (str, optional): name of the graph. Defaults to "".
+        """
+        self._name = name  # name of the graph
+        self._modules = []  # registered modules, in order of registration
+        self._index = {}  # id(module) -> position in self._modules
+        self._connections = []  # (source module, output, sink module, input)
+        self._order = None  # modules in topological order, once compiled
+        self._schedule = None  # module calls in topological order, once compiled
+        self._levels = None  # groups of independent modules, once compiled
+        self._formats = None  # processing format of each module, once negotiated
+
+        return
+
+    def __repr__(self) -> str:
+        return "DSPGraph <%s> (%d modules, %d connections)" % (
+            self._name,
+            len(self._modules),
+            len(self._connections),
+        )
+
+    @property
+    def modules(self) -> list:
+        return list(self._modules)
+
+    @property
+    def connections(self) -> list:
+        return list(self._connections)
+
+    def add_module(self, module: DSPModule) -> DSPModule:
+        """Register a module in the graph.
+
+        Args:
+            module (DSPModule): module to register.
+
+        Returns:
+            DSPModule: the registered module, for chaining.
+        """
+
+        if id(module) in self._index:
+            print("module already registered, dismissing")
+            return module
+
+        self._index[id(module)] = len(self._modules)
+        self._modules.append(module)
+        self._order = None
+        self._schedule = None
+        self._levels = None
+
+        return module
+
+    def connect(self, source: DSPModule, output: str, sink: DSPModule, input: str):
+        """Connect an output of a module to an input of another one (both registered).
+
+        Args:
+            source (DSPModule): module writing the data.
+            output (str): name of the output port of the source.
+            sink (DSPModule): module reading the data.
+            input (str): name of the input port of the sink.
+        """
+
+        for module in (source, sink):
+            if id(module) not in self._index:
+                raise ValueError(
+                    "DSPGraph CONNECT : module %s is not registered in the graph"
+                    % repr(module)
+                )
+
+        sink.input(input).connect(source.output(output))
+
+        self._connections.append((source, output, sink, input))
+        self._order = None
+        self._schedule = None
+        self._levels = None
+
+        return
+
+    def _edges(self) -> list:
+        """Dependencies between modules, as lists of sink positions for each module."""
+
+        edges = [set() for _ in self._modules]
+        for source, _, sink, _ in self._connections:
+            edges[self._index[id(source)]].add(self._index[id(sink)])
+
+        return edges
+
+    def compile(self):
+        """Check the graph for cycles and compute the execution order, once and for all."""
+
+        edges = self._edges()
+        n_deps = [0] * len(self._modules)
+        for sinks in edges:
+            for j in sinks:
+                n_deps[j] += 1
+
+        # kahn's algorithm, modules without dependencies in order of registration
+        # the level of a module is the length of the longest chain of modules leading to it
+        ready = deque(i for i, n in enumerate(n_deps) if n == 0)
+        order = []
+        level = [0] * len(self._modules)
+        while ready:
+            i = ready.popleft()
+            order.append(i)
+            for j in sorted(edges[i]):
+                n_deps[j] -= 1
+                level[j] = max(level[j], level[i] + 1)
+                if n_deps[j] == 0:
+                    ready.append(j)
+
+        if len(order) != len(self._modules):
+            cycle = [repr(self._modules[i]) for i, n in enumerate(n_deps) if n > 0]
+            raise ValueError(
+                "DSPGraph COMPILE : cycle detected between modules %s"
+                % ", ".join(cycle)
+            )
+
+        self._order = [self._modules[i] for i in order]
+        self._schedule = tuple(module.__call__ for module in self._order)
+
+        levels = [[] for _ in range(max(level, default=-1) + 1)]
+        for i in order:
+            levels[level[i]].append(self._modules[i])
+        self._levels = [tuple(modules) for modules in levels]
+
+        return
+
+    @property
+    def order(self) -> list:
+        """Modules in execution order."""
+        if self._order is None:
+            self.compile()
+        return list(self._order)
+
+    @property
+    def levels(self) -> list:
+        """Modules grouped by dependency level : modules of a level only read from modules of previous levels and can run concurrently."""
+        if self._levels is None:
+            self.compile()
+        return [list(modules) for modules in self._levels]
+
+    def prepare(
+        self, block_size: int, dtype: np.dtype = np.float64, channels: int = None
+    ):
+        """Prepare all the modules for the given processing format (see DSPModule.prepare()).
+
+        Args:
+            block_size (int): number of samples per block.
+            dtype (np.dtype, optional): datatype of the samples. Defaults to np.float64.
+            channels (int, optional): number of channels, None for single signals. Defaults to None.
+        """
+
+        for module in self.order:
+            module.prepare(block_size, dtype, channels)
+
+        return
+
+    def negotiate(
+        self,
+        samplerate: float = None,
+        blocksize: int = None,
+        channels: int = None,
+        dtype: np.dtype = None,
+    ):
+        """Agree on the processing format of every module, lock the capabilities of the ports and prepare the modules.
+
+        Capabilities are bound together through connections, and between all the ports of a module except for the capabilities it converts (see DSPModule.converts). The variables bound together must agree on a common value : the preferred one (arguments) if allowed, else the default of a constrained variable, else any allowed value. Agreed values are locked (DSP_VAR_CONSTANT) and modules are prepared with them, so that no format is checked nor converted while processing.
+
+        Modules with a <samplerate> parameter get the agreed sample rate. Modules declaring the datatypes they support (see DSPModule.dtypes) take part in the negotiation of the datatype : preferring float32 (precision mode) processes in single precision every part of the graph where all the modules support it, the others fall back on a common datatype.
+
+        Args:
+            samplerate (float, optional): preferred sample rate, in Hz. Defaults to None.
+            blocksize (int, optional): preferred number of samples per block, required unless some ports constrain it. Defaults to None.
+            channels (int, optional): preferred number of channels, None for single signals. Defaults to None.
+            dtype (np.dtype, optional): preferred datatype of the samples, float64 if nothing is agreed. Defaults to None.
+
+        Raises:
+            ValueError: some capabilities have no value in common, or no block size is agreed.
+        """
+
+        preferred = {
+            "samplerate": samplerate,
+            "blocksize": blocksize,
+            "channels": channels,
+            "dtype": None if dtype is None else np.dtype(dtype).name,
+        }
+
+        # nodes : the modules first, then their ports
+        ports, owners, outputs = [], [], []
+        for i, module in enumerate(self._modules):
+            for port in module.outputs:
+                ports.append(port)
+                owners.append(i)
+                outputs.append(True)
+            for port in module.inputs:
+                ports.append(port)
+                owners.append(i)
+                outputs.append(False)
+        n_modules = len(self._modules)
+        node = {id(port): n_modules + k for k, port in enumerate(ports)}
+
+        links = [
+            (node[id(source.output(output))], node[id(sink.input(input))])
+            for source, output, sink, input in self._connections
+        ]
+
+        formats = [{} for _ in self._modules]
+        for cap in CAPABILITIES:
+
+            # bind the variables : connections, then ports to their module
+            parent = list(range(n_modules + len(ports)))
+            for a, b in links:
+                parent[_find(parent, a)] = _find(parent, b)
+            for k, i in enumerate(owners):
+                if outputs[k] or cap not in self._modules[i].converts:
+                    parent[_find(parent, n_modules + k)] = _find(parent, i)
+
+            # variables of the ports, and datatypes supported by the modules
+            groups = {}
+            for k, port in enumerate(ports):
+                groups.setdefault(_find(parent, n_modules + k), []).append(
+                    (port._name, port._caps[cap])
+                )
+            if cap == "dtype":
+                for i, module in enumerate(self._modules):
+                    if module.dtypes is not None:
+                        var = DSPVariable(str, set=tuple(module.dtypes))
+                        groups.setdefault(_find(parent, i), []).append(
+                            (repr(module), var)
+                        )
+
+            # agree on a value for each group, then lock it
+            agreed = {}
+            for root, members in groups.items():
+                variables = [var for _, var in members]
+                for var in variables:
+                    var.status = DSPVariableStatus.DSP_VAR_DYNAMIC
+                val = _agree(variables, preferred[cap])
+
+                if val is None and any(
+                    v._set is not None or v._ranged for v in variables
+                ):
+                    raise ValueError(
+                        "DSPGraph NEGOTIATE : no common <%s> for %s"
+                        % (cap, ", ".join(name for name, _ in members))
+                    )
+
+                if val is not None:
+                    val = CAPABILITIES[cap](val)
+                    for var in variables:
+                        var.val = val
+                        var.status = DSPVariableStatus.DSP_VAR_CONSTANT
+                agreed[root] = val
+
+            for i in range(n_modules):
+                formats[i][cap] = agreed.get(_find(parent, i), preferred[cap])
+
+        for module, fmt in zip(self._modules, formats):
+            fmt["dtype"] = fmt["dtype"] or "float64"
+            if fmt["blocksize"] is None:
+                raise ValueError(
+                    "DSPGraph NEGOTIATE : no block size agreed for module %s"
+                    % repr(module)
+                )
+
+        # the format is known at last, prepare the modules
+        for module, fmt in zip(self._modules, formats):
+            if fmt["samplerate"] is not None and "samplerate" in module.get_params():
+                module.set_param("samplerate", float(fmt["samplerate"]))
+            module.prepare(fmt["blocksize"], np.dtype(fmt["dtype"]), fmt["channels"])
+
+        self._formats = formats
+
+        return
+
+    def format(self, module: DSPModule) -> dict:
+        """Processing format of a module agreed by negotiate(), None if not negotiated yet.
+
+        Returns:
+            dict: samplerate, blocksize, channels and dtype of the module.
+        """
+        if self._formats is None:
+            return None
+        return dict(self._formats[self._index[id(module)]])
+
+    def process(self):
+        """Process one block : each module is called in topological order, reading its inputs and writing its outputs."""
+
+        if self._schedule is None:
+            self.compile()
+
+        for step in self._schedule:
+            step()
+
+        return
+
+
+class DSPGraphExecutor:
+    """Processes a DSPGraph with independent modules dispatched on a pool of threads.
+
+    Modules of a same dependency level run concurrently, levels run one after the other. Threads pay off when modules spend their time in numpy kernels releasing the GIL (FFTs, large vector operations) : for light modules the sequential DSPGraph.process() is faster.
+    """
+
+    def __init__(self, graph: DSPGraph, max_workers: int = None):
+        """Initialisation of the executor.
+
+        Args:
+            graph (DSPGraph): graph to process.
+            max_workers (int, optional): number of threads, see concurrent.futures.ThreadPoolExecutor. Defaults to None.
+        """
+        self._graph = graph
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._schedule = None  # module calls grouped by level
+        self._levels = None  # levels of the graph the schedule was compiled from
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        return
+
+    def compile(self):
+        """Group the calls of the modules by level, until the graph is modified."""
+        levels = self._graph.levels
+        self._levels = self._graph._levels
+        self._schedule = tuple(
+            tuple(module.__call__ for module in modules) for modules in levels
+        )
+        return
+
+    def process(self):
+        """Process one block of the graph."""
+
+        # the graph drops its levels when modules or connections are added
+        if self._levels is None or self._levels is not self._graph._levels:
+            self.compile()
+
+        submit = self._pool.submit
+        for steps in self._schedule:
+
+            # the calling thread takes its share of the work
+            futures = [submit(step) for step in steps[1:]]
+            try:
+                steps[0]()
+            finally:
+                # no module of the level left running when one of them fails
+                wait(futures)
+            for future in futures:
+                future.result()
+
+        return
+
+    def shutdown(self):
+        self._pool.shutdown()
+        return
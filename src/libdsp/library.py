@@ -0,0 +1,591 @@
+from libdsp.modules import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+"""
+
+LIBRARY of ready-to-use DSPModules.
+
+All modules process single signals (1-D blocks) or several channels at once ((channels, samples) blocks, see DSPModule.prepare()), keep their state from block to block for streaming, and are vectorized : no python loop runs over the samples.
+
+Blocks are passed as arrays, or flow through the "in" and "out" ports of the modules within a DSPGraph (see DSPSignalModule).
+
+"""
+
+
+class DSPGain(DSPSignalModule):
+    """Gain in dB, one value per channel, automated per sample when the gain has a lane (see DSPModule.automate())."""
+
+    dtypes = ("float32", "float64")
+
+    def __init__(self, name: str = "", gain: float = 0.0):
+        """Initialisation of the gain.
+
+        Args:
+            name (str, optional): name of the instance. Defaults to "".
+            gain (float, optional): initial gain, in dB. Defaults to 0.0.
+        """
+
+        super().__init__(name)
+
+        self._version = "0.1.0"
+        self._author = __author__
+        self._description = "Gain in dB, one value per channel"
+
+        self.add_parameter(
+            DSPModuleParameter(
+                name="gain",
+                var=DSPVectorVariable(float, range=(-120.0, 0.01, 24.0, gain)),
+                descp="gain in dB",
+            )
+        )
+
+        pass
+
+    @derived("gain")
+    def _gain_lin(self):
+        gain = 10 ** (self.get_param("gain") / 20)
+
+        # a python float or an array of the sample datatype, so that float32 blocks stay float32
+        if self._channels is None:
+            return float(gain[0])
+        return gain[:, None].astype(self._sample_dtype)
+
+    def configure(self):
+        pass
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        if self.automation("gain") is not None:
+            return x * self._gain_ramp(x)
+        return x * self._gain_lin
+
+    @derived("gain")
+    def _gain_block(self):
+        # gains repeated over a whole block : broadcasting a column makes numpy allocate a buffer on every product
+        return np.repeat(self._gain_lin, self._block_size, axis=-1)
+
+    def _gain_ramp(self, x: np.ndarray) -> np.ndarray:
+        # per-sample linear gains of the automated lane, (samples,) for a single signal or (channels, samples)
+        gain = 10 ** (self.control("gain", x.shape[-1]) / 20)
+        if x.ndim == 1:
+            gain = gain[0]
+        return gain.astype(np.result_type(x.dtype, np.float32), copy=False)
+
+    def process_into(self, inputs: np.ndarray, out: np.ndarray):
+        if self.automation("gain") is not None:
+            np.multiply(inputs, self._gain_ramp(inputs), out=out)
+        elif self._channels is None:
+            np.multiply(inputs, self._gain_lin, out=out)
+        else:
+            np.multiply(inputs, self._gain_block[:, : inputs.shape[-1]], out=out)
+        pass
+
+
+class DSPBiquad(DSPSignalModule):
+    """Cascade of identical biquad filters (RBJ audio EQ cookbook), one state per channel.
+
+    The cascade is processed as a single linear state-space system, in chunks of samples : the response of each chunk is a few matrix products with precomputed matrices, instead of a loop over the samples.
+    """
+
+    # types of filters
+    LOWPASS = 0
+    HIGHPASS = 1
+    BANDPASS = 2
+    PEAK = 3
+
+    # number of samples processed by each matrix product
+    CHUNK = 64
+
+    # matrices shared by all the filters, by values of the parameters
+    cache = DSPCoefficientCache(256)
+
+    dtypes = ("float32", "float64")
+
+    def __init__(
+        self,
+        name: str = "",
+        kind: int = 0,
+        cutoff: float = 1000.0,
+        q: float = 0.707,
+        gain: float = 0.0,
+        stages: int = 1,
+        samplerate: float = 48000.0,
+    ):
+        """Initialisation of the filter.
+
+        Args:
+            name (str, optional): name of the instance. Defaults to "".
+            kind (int, optional): type of filter (LOWPASS, HIGHPASS, BANDPASS, PEAK). Defaults to LOWPASS.
+            cutoff (float, optional): cutoff or center frequency, in Hz. Defaults to 1000.0.
+            q (float, optional): quality factor. Defaults to 0.707.
+            gain (float, optional): gain of the PEAK filter, in dB. Defaults to 0.0.
+            stages (int, optional): number of biquads in the cascade. Defaults to 1.
+            samplerate (float, optional): sample rate, in Hz. Defaults to 48000.0.
+        """
+
+        super().__init__(name)
+
+        self._version = "0.1.0"
+        self._author = __author__
+        self._description = "Cascade of biquad filters"
+
+        self._state = None  # (channels, order) state of the cascade
+        self._scratch = None  # buffers of the products, see _filter()
+
+        with self.batch_update():
+            self.add_parameter(
+                DSPModuleParameter(
+                    "kind", DSPVariable(int, range=(0, 1, 3, kind)), "type of filter"
+                )
+            )
+            self.add_parameter(
+                DSPModuleParameter(
+                    "cutoff",
+                    DSPVariable(float, range=(1.0, 0.01, 192000.0, cutoff)),
+                    "cutoff frequency in Hz",
+                )
+            )
+            self.add_parameter(
+                DSPModuleParameter(
+                    "q", DSPVariable(float, range=(0.1, 0.001, 100.0, q)), "quality"
+                )
+            )
+            self.add_parameter(
+                DSPModuleParameter(
+                    "gain",
+                    DSPVariable(float, range=(-48.0, 0.01, 48.0, gain)),
+                    "gain of the peak filter in dB",
+                )
+            )
+            self.add_parameter(
+                DSPModuleParameter(
+                    "stages",
+                    DSPVariable(int, range=(1, 1, 16, stages)),
+                    "number of biquads",
+                )
+            )
+            self.add_parameter(
+                DSPModuleParameter(
+                    "samplerate",
+                    DSPVariable(float, range=(1.0, 1.0, 768000.0, samplerate)),
+                    "sample rate in Hz",
+                )
+            )
+
+        self.configure()
+
+        pass
+
+    def coefficients(self) -> tuple:
+        """Coefficients of one biquad of the cascade.
+
+        Returns:
+            tuple: (b, a) numerators and denominators, normalized so that a[0] = 1.
+        """
+
+        fs = self.get_param("samplerate")
+        f0 = min(self.get_param("cutoff"), 0.49 * fs)
+        w0 = 2 * np.pi * f0 / fs
+        cos, alpha = np.cos(w0), np.sin(w0) / (2 * self.get_param("q"))
+        kind = self.get_param("kind")
+
+        if kind == DSPBiquad.LOWPASS:
+            b = [(1 - cos) / 2, 1 - cos, (1 - cos) / 2]
+            a = [1 + alpha, -2 * cos, 1 - alpha]
+        elif kind == DSPBiquad.HIGHPASS:
+            b = [(1 + cos) / 2, -(1 + cos), (1 + cos) / 2]
+            a = [1 + alpha, -2 * cos, 1 - alpha]
+        elif kind == DSPBiquad.BANDPASS:
+            b = [alpha, 0.0, -alpha]
+            a = [1 + alpha, -2 * cos, 1 - alpha]
+        else:
+            amp = 10 ** (self.get_param("gain") / 40)
+            b = [1 + alpha * amp, -2 * cos, 1 - alpha * amp]
+            a = [1 + alpha / amp, -2 * cos, 1 - alpha / amp]
+
+        b, a = np.array(b) / a[0], np.array(a) / a[0]
+
+        return b, a
+
+    def configure(self):
+        mats = DSPBiquad.cache.get(self, self._products, context=(DSPBiquad.CHUNK,))
+        self._mats = {np.dtype(np.float64): mats}
+        pass
+
+    def matrices(self) -> tuple:
+        """Matrices processing a chunk of samples through the whole cascade.
+
+        Returns:
+            tuple: (H, O, K, P) so that y = x @ H.T + s @ O.T and s' = s @ P[n].T + x @ K[:, -n:].T for a chunk x of n samples and the state s.
+        """
+
+        b, a = self.coefficients()
+        stages = self.get_param("stages")
+
+        # state-space of one biquad (transposed direct form II)
+        A1 = np.array([[-a[1], 1.0], [-a[2], 0.0]])
+        B1 = np.array([b[1] - a[1] * b[0], b[2] - a[2] * b[0]])
+        C1 = np.array([1.0, 0.0])
+        D1 = b[0]
+
+        # cascade : the output of each biquad feeds the next one
+        A, B, C, D = A1, B1, C1, D1
+        for _ in range(stages - 1):
+            n = len(B)
+            A = np.block([[A, np.zeros((n, 2))], [np.outer(B1, C), A1]])
+            B = np.concatenate([B, B1 * D])
+            C = np.concatenate([D1 * C, C1])
+            D = D1 * D
+
+        # powers of A, up to a whole chunk
+        m = DSPBiquad.CHUNK
+        powers = [np.eye(len(B))]
+        for _ in range(m):
+            powers.append(A @ powers[-1])
+
+        # impulse response (Toeplitz), observation, control and transition matrices
+        h = np.concatenate([[D], [C @ powers[k] @ B for k in range(m - 1)]])
+        idx = np.arange(m)[:, None] - np.arange(m)[None, :]
+        H = np.where(idx >= 0, h[np.maximum(idx, 0)], 0.0)
+        O = np.array([C @ powers[k] for k in range(m)])
+        K = np.array([powers[m - 1 - k] @ B for k in range(m)]).T
+        P = np.array(powers)
+
+        return H, O, K, P
+
+    def _products(self) -> tuple:
+        """Matrices of matrices(), followed by the transposed ones for whole chunks, contiguous for np.dot()."""
+
+        H, O, K, P = self.matrices()
+        full = (H.T, O.T, K.T, P[DSPBiquad.CHUNK].T)
+
+        return (H, O, K, P) + tuple(np.ascontiguousarray(a) for a in full)
+
+    def prepare(
+        self, block_size: int, dtype: np.dtype = np.float64, channels: int = None
+    ):
+        super().prepare(block_size, dtype, channels)
+        self.reset()
+        pass
+
+    def reset(self):
+        """Clear the state of the filter."""
+        self._state = None
+        return
+
+    def _mats_as(self, dtype: np.dtype) -> tuple:
+        """Chunk matrices cast to the datatype of the samples, once per configuration."""
+        mats = tuple(a.astype(dtype) for a in self._mats[np.dtype(np.float64)])
+        self._mats[dtype] = mats
+        return mats
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+
+        squeeze = x.ndim == 1
+        x = np.atleast_2d(x)
+
+        # float32 blocks are processed in single precision, anything else in double
+        y = np.empty(x.shape, dtype=np.result_type(x, np.float32))
+        self._filter(x, y)
+
+        return y[0] if squeeze else y
+
+    def process_into(self, inputs: np.ndarray, out: np.ndarray):
+        self._filter(np.atleast_2d(inputs), np.atleast_2d(out))
+        pass
+
+    def _filter(self, x: np.ndarray, y: np.ndarray):
+        """Filter the (channels, samples) block x into y, in the datatype of y.
+
+        Whole chunks are copied into scratch buffers kept from block to block and multiplied with np.dot() into them : blocks made of whole chunks are filtered without allocating memory.
+        """
+
+        dtype = y.dtype
+        H, O, K, P, HT, OT, KT, PT = self._mats.get(dtype) or self._mats_as(dtype)
+        shape = (x.shape[0], O.shape[-1])
+
+        if self._state is None or self._state.shape != shape:
+            self._state = np.zeros(shape, dtype=dtype)
+        elif self._state.dtype != dtype:
+            self._state = self._state.astype(dtype)
+
+        m = DSPBiquad.CHUNK
+        if (
+            self._scratch is None
+            or self._scratch[0].dtype != dtype
+            or self._scratch[0].shape != shape
+        ):
+            self._scratch = (
+                np.empty(shape, dtype),
+                np.empty(shape, dtype),
+                np.empty((shape[0], m), dtype),
+                np.empty((shape[0], m), dtype),
+                np.empty((shape[0], m), dtype),
+            )
+        s_next, s_in, xc, yc, tmp = self._scratch
+
+        s = self._state
+        for i in range(0, x.shape[-1], m):
+            n = min(m, x.shape[-1] - i)
+
+            # shorter last chunk
+            if n < m:
+                xs = x[:, i : i + n]
+                y[:, i : i + n] = xs @ H[:n, :n].T + s @ O[:n].T
+                s[...] = s @ P[n].T + xs @ K[:, m - n :].T
+                break
+
+            # y = x @ H.T + s @ O.T
+            np.copyto(xc, x[:, i : i + m])
+            np.dot(xc, HT, out=yc)
+            np.dot(s, OT, out=tmp)
+            yc += tmp
+            y[:, i : i + m] = yc
+
+            # s' = s @ P[m].T + x @ K.T
+            np.dot(s, PT, out=s_next)
+            np.dot(xc, KT, out=s_in)
+            np.add(s_next, s_in, out=s)
+
+        return
+
+
+class DSPFIRFilter(DSPSignalModule):
+    """FIR filter by FFT convolution (overlap-add), one state per channel.
+
+    FFTs are computed in double precision, float32 blocks are returned as float32.
+    """
+
+    dtypes = ("float32", "float64")
+
+    def __init__(self, name: str = "", taps: np.ndarray = None):
+        """Initialisation of the filter.
+
+        Args:
+            name (str, optional): name of the instance. Defaults to "".
+            taps (np.ndarray, optional): impulse response. Defaults to None (identity).
+        """
+
+        super().__init__(name)
+
+        self._version = "0.1.0"
+        self._author = __author__
+        self._description = "FIR filter by FFT convolution"
+
+        self._spectra = {}  # fft size -> spectrum of the taps
+        self._tail = None  # (channels, taps - 1) overlap of the previous blocks
+
+        self.add_parameter(
+            DSPModuleParameter("taps", DSPVariable(np.ndarray), "impulse response")
+        )
+        self.set_param("taps", np.ones(1) if taps is None else np.asarray(taps))
+
+        pass
+
+    def configure(self):
+        self._taps = np.asarray(self.get_param("taps"), dtype=np.float64)
+        self._spectra = {}
+        self._tail = None
+        pass
+
+    def prepare(
+        self, block_size: int, dtype: np.dtype = np.float64, channels: int = None
+    ):
+        super().prepare(block_size, dtype, channels)
+        self.reset()
+        pass
+
+    def reset(self):
+        """Clear the state of the filter."""
+        self._tail = None
+        return
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+
+        squeeze = x.ndim == 1
+        x = np.atleast_2d(x)
+
+        y = np.empty(x.shape, dtype=np.result_type(x, np.float32))
+        self._filter(x, y)
+
+        return y[0] if squeeze else y
+
+    def process_into(self, inputs: np.ndarray, out: np.ndarray):
+        self._filter(np.atleast_2d(inputs), np.atleast_2d(out))
+        pass
+
+    def _filter(self, x: np.ndarray, y: np.ndarray):
+        """Filter the (channels, samples) block x into y, the overlap is kept in place from block to block.
+
+        numpy FFTs have no output argument : their results are the only arrays allocated per block.
+        """
+
+        n_taps = len(self._taps)
+        n = x.shape[-1] + n_taps - 1
+        nfft = 1 << (n - 1).bit_length()
+
+        spectrum = self._spectra.get(nfft)
+        if spectrum is None:
+            spectrum = self._spectra[nfft] = np.fft.rfft(self._taps, nfft)
+
+        full = np.fft.rfft(x, nfft)
+        full *= spectrum
+        full = np.fft.irfft(full, nfft)
+
+        # overlap-add with the tail of the previous blocks
+        if self._tail is None or self._tail.shape[0] != x.shape[0]:
+            self._tail = np.zeros((x.shape[0], n_taps - 1))
+        full[:, : n_taps - 1] += self._tail
+        self._tail[...] = full[:, x.shape[-1] : n]
+
+        y[...] = full[:, : x.shape[-1]]
+
+        return
+
+
+class DSPConvolver(DSPSignalModule):
+    """Convolution with long impulse responses (uniformly partitioned overlap-save), one state per channel.
+
+    The impulse response is split into partitions of the block size, whose spectra are computed once in configure(). Each block costs one FFT, one inverse FFT and a product-sum with a frequency-domain delay line, whatever the length of the impulse response, and the latency is a single block.
+
+    FFTs are computed in double precision, float32 blocks are returned as float32.
+    """
+
+    dtypes = ("float32", "float64")
+
+    def __init__(self, name: str = "", ir: np.ndarray = None, partition: int = 256):
+        """Initialisation of the convolver.
+
+        Args:
+            name (str, optional): name of the instance. Defaults to "".
+            ir (np.ndarray, optional): impulse response. Defaults to None (identity).
+            partition (int, optional): size of the partitions, replaced by the block size in prepare(). Defaults to 256.
+        """
+
+        super().__init__(name)
+
+        self._version = "0.1.0"
+        self._author = __author__
+        self._description = "Uniformly partitioned convolution"
+
+        self._partition = partition
+        self._spectra = None  # (partitions, partition + 1) spectra of the IR
+        self._lanes = None  # reversed spectra, twice in a row
+        self._fdl = None  # (partitions, channels, partition + 1) input spectra
+        self._inbuf = None  # (channels, 2 * partition) last two input partitions
+        self._pos = 0  # position of the newest spectrum in the delay line
+        self._fill = 0  # samples already in the newest partition
+
+        self.add_parameter(
+            DSPModuleParameter("ir", DSPVariable(np.ndarray), "impulse response")
+        )
+        self.set_param("ir", np.ones(1) if ir is None else np.asarray(ir))
+
+        pass
+
+    def configure(self):
+
+        ir = np.asarray(self.get_param("ir"), dtype=np.float64)
+        p = self._partition
+
+        # spectra of the partitions, padded to twice their size for overlap-save
+        n = -(-len(ir) // p)
+        parts = np.zeros((n, p))
+        parts.flat[: len(ir)] = ir
+        self._spectra = np.fft.rfft(parts, 2 * p)
+        self._lanes = np.concatenate([self._spectra[::-1], self._spectra[::-1]])
+
+        self.reset()
+
+        pass
+
+    def prepare(
+        self, block_size: int, dtype: np.dtype = np.float64, channels: int = None
+    ):
+        super().prepare(block_size, dtype, channels)
+        if block_size != self._partition:
+            self._partition = block_size
+            self.configure()
+        self.reset()
+        pass
+
+    @property
+    def partition(self) -> int:
+        return self._partition
+
+    def reset(self):
+        """Clear the state of the convolver."""
+        self._fdl = None
+        self._inbuf = None
+        self._pos = 0
+        self._fill = 0
+        return
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """Convolve a block of data, of any size.
+
+        The stream is processed by partitions : blocks of partition samples cost one FFT each. A block ending within a partition is exact as well (the convolution is causal, the rest of the partition is zero until the next block fills it) but costs one more FFT.
+        """
+
+        squeeze = x.ndim == 1
+        x = np.atleast_2d(x)
+
+        y = np.empty(x.shape, dtype=np.result_type(x, np.float32))
+        self._convolve(x, y)
+
+        return y[0] if squeeze else y
+
+    def process_into(self, inputs: np.ndarray, out: np.ndarray):
+        self._convolve(np.atleast_2d(inputs), np.atleast_2d(out))
+        pass
+
+    def _convolve(self, x: np.ndarray, y: np.ndarray):
+        """Convolve the (channels, samples) block x into y.
+
+        The input partitions and the delay line are kept in place, numpy FFTs and the product-sum have no output argument : their results are the only arrays allocated per partition.
+        """
+
+        p, n = self._partition, x.shape[-1]
+
+        if self._inbuf is None or self._inbuf.shape[0] != x.shape[0]:
+            self._inbuf = np.zeros((x.shape[0], 2 * p))
+            self._fdl = np.zeros(
+                (len(self._spectra), x.shape[0], p + 1), dtype=np.complex128
+            )
+            self._pos = 0
+            self._fill = 0
+
+        k = len(self._spectra)
+
+        i = 0
+        while i < n:
+            f = self._fill
+            m = min(p - f, n - i)
+
+            # complete the current partition, the samples to come are still zero
+            self._inbuf[:, p + f : p + f + m] = x[:, i : i + m]
+
+            # newest spectrum in the delay line, then product-sum with the partitions :
+            # slot j is delayed by (pos - j) % k partitions, a contiguous slice of lanes
+            self._fdl[self._pos] = np.fft.rfft(self._inbuf)
+            start = k - 1 - self._pos
+            spectrum = np.einsum(
+                "kcf,kf->cf", self._fdl, self._lanes[start : start + k]
+            )
+
+            # the second half of the circular convolution is free of aliasing
+            y[:, i : i + m] = np.fft.irfft(spectrum, 2 * p)[:, p + f : p + f + m]
+
+            # full partition : slide the input, move on in the delay line
+            self._fill = f + m
+            if self._fill == p:
+                self._inbuf[:, :p] = self._inbuf[:, p:]
+                self._inbuf[:, p:] = 0.0
+                self._pos = (self._pos + 1) % k
+                self._fill = 0
+
+            i += m
+
+        return
@@ -1,4 +1,10 @@
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import partial
+
 from libdsp.parameters import *
+from libdsp.signals import *
 
 __author__ = "Rémy VINCENT"
 __copyright__ = "Aaah"
@@ -6,14 +12,205 @@ __license__ = "Copyright 2022"
 
 # todo : list of callbacks (process, display1, display2, ...) to be computed on process()
 # todo : repr
-# todo : signals (new file.py)
+
+
+class derived:
+    """Decorator declaring a quantity of a DSPModule derived from some of its parameters.
+
+    The quantity is computed lazily on first access, memoized, and invalidated only when one of the named parameters changes, so that a change on a parameter does not recompute unrelated quantities.
+
+    Example:
+        @derived("gain")
+        def _gain_lin(self):
+            return 10 ** (self.get_param("gain") / 20)
+    """
+
+    def __init__(self, *params: str):
+        """Initialisation of the decorator.
+
+        Args:
+            params (str): names of the parameters the quantity depends on.
+        """
+        self._params = frozenset(params)
+        self._fn = None
+        self._name = None
+        return
+
+    def __call__(self, fn):
+        self._fn = fn
+        self._name = fn.__name__
+        self.__doc__ = fn.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self._name = name
+        return
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        # memoized in the instance dict, next lookups do not reach the descriptor until invalidation
+        val = self._fn(instance)
+        instance.__dict__[self._name] = val
+        return val
+
+
+def _hashable(val):
+    """Key for a value of parameter, arrays are keyed on their content."""
+    if isinstance(val, np.ndarray):
+        return (val.dtype.str, val.shape, val.tobytes())
+    return val
+
+
+class DSPCoefficientCache:
+    """Least recently used cache of coefficients, keyed on the values of the parameters of a module.
+
+    Values of parameters are quantized by their DSPVariable (step and bounds), so modules whose parameters are swept back and forth keep asking for the same coefficients : the cache hands them back instead of computing them again in configure(). A cache can be shared by all the instances of a module class, and by modules configured on different threads : entries are keyed on the class of the module as well, lookups are guarded by a lock.
+
+    Example:
+        def configure(self):
+            self._coefs = self.cache.get(self, self._compute_coefs)
+    """
+
+    def __init__(self, maxsize: int = 128):
+        """Initialisation of the cache.
+
+        Args:
+            maxsize (int, optional): number of entries kept, the least recently used ones are dropped first. Defaults to 128.
+        """
+
+        if maxsize < 1:
+            raise ValueError(
+                "DSPCoefficientCache : size must be positive, got %d" % maxsize
+            )
+
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+        return
+
+    def __repr__(self) -> str:
+        return "DSPCoefficientCache (%d/%d entries, %d hits, %d misses)" % (
+            len(self._entries),
+            self._maxsize,
+            self._hits,
+            self._misses,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(module, names: list = None, context: tuple = ()) -> tuple:
+        """Key of the current values of the parameters of a module.
+
+        Args:
+            module (DSPModule): module.
+            names (list, optional): parameters the coefficients depend on. Defaults to None (all the parameters).
+            context (tuple, optional): other values the coefficients depend on (eg. class constants). Defaults to ().
+
+        Returns:
+            tuple: class of the module, context and values of the parameters.
+        """
+        params = module.get_params()
+        if names is None:
+            values = tuple(_hashable(v) for v in params.values())
+        else:
+            values = tuple(_hashable(params[name]) for name in names)
+        return (type(module),) + tuple(context) + values
+
+    def get(self, module, compute, names: list = None, context: tuple = ()):
+        """Coefficients for the current values of the parameters of a module.
+
+        The coefficients are computed out of the lock : modules missing the same entry at the same time may both compute it, the first one stored is kept.
+
+        Args:
+            module (DSPModule): module.
+            compute (callable): computes the coefficients on a miss, called without arguments.
+            names (list, optional): parameters the coefficients depend on. Defaults to None (all the parameters).
+            context (tuple, optional): other values the coefficients depend on (eg. class constants). Defaults to ().
+
+        Returns:
+            the cached coefficients, shared between hits : do not modify them in place.
+        """
+
+        key = self.key(module, names, context)
+
+        with self._lock:
+            coefs = self._entries.get(key)
+            if coefs is not None:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return coefs
+            self._misses += 1
+
+        coefs = compute()
+
+        with self._lock:
+            coefs = self._entries.setdefault(key, coefs)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+        return coefs
+
+    def clear(self):
+        """Drop all the entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+        return
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
 
 
 class DSPModule:
     """Template class for DSP algorithms.
-    Modules benefit from a set of parameters for their configuration : the configure() method is a callback triggered whenever a parameter is updated. Modules have a processing method called process() that can be called in an offline context (the whole data is passed to be processed) or in a streaming context (data is passed frame by frame).
+    Modules benefit from a set of parameters for their configuration : the configure() method is a callback triggered whenever a parameter is updated (once per batch when using batch_update() or set_params()). Modules have a processing method called process() that can be called in an offline context (the whole data is passed to be processed) or in a streaming context (data is passed frame by frame).
     """
 
+    # names of the derived quantities, by name of parameter
+    _derived = {}
+
+    # capabilities that may differ between the inputs and the outputs (eg. ("samplerate",) for a resampler), see DSPGraph.negotiate()
+    converts = ()
+
+    # names of the datatypes of samples the module processes without promotion, None for any
+    dtypes = None
+
+    def __init_subclass__(cls, **kwds):
+        super().__init_subclass__(**kwds)
+
+        # collect derived quantities, the most derived class wins on name conflicts
+        quantities = {}
+        for klass in reversed(cls.__mro__):
+            for attr, obj in vars(klass).items():
+                quantities.pop(attr, None)
+                if isinstance(obj, derived):
+                    quantities[attr] = obj
+
+        cls._derived = {}
+        for attr, obj in quantities.items():
+            for name in obj._params:
+                cls._derived.setdefault(name, []).append(attr)
+
+        return
+
     def __init__(self, name=""):
         """Initialisation of the DSPModule instance.
 
@@ -22,90 +219,448 @@ class DSPModule:
         """
 
         # parameters
-        self._name = ""  # name of the instance
+        self._name = name  # name of the instance
         self._version = ""  # version of the algorithm
         self._author = ""  # author of the algorithm
         self._description = ""  # short brief about the module
 
         # internals
-        self.__params = []
-        self.__inputs = []
-        self.__outputs = []
+        self.__params = {}  # name -> index, insertion order kept for GUI generation
+        self.__params_list = []  # index -> parameter
+        self.__changed = set()  # names of the parameters changed, until configure()
+        self.__batch_depth = 0  # nested batch_update() contexts
+        self.__pending = deque()  # parameter updates posted by other threads
+        self.__inputs = {}  # name -> input port
+        self.__outputs = {}  # name -> output port
+        self.__lanes = {}  # name -> automation lane
+
+        # processing format, see prepare()
+        self._block_size = None  # number of samples per block
+        self._sample_dtype = None  # datatype of the samples
+        self._channels = (
+            None  # number of channels, None for single signals (1-D blocks)
+        )
+        self._out = None  # preallocated output buffer
 
         return
 
+    def __repr__(self) -> str:
+        return "%s <%s>" % (type(self).__name__, self._name)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
     def add_parameter(self, param: DSPModuleParameter):
 
         # check that the parameter does not exist yet
-        for p in self.__params:
-            if p._name == param._name:
-                print("parameter with same name already exists, dismissing")
-                return
+        if param._name in self.__params:
+            print("parameter with same name already exists, dismissing")
+            return
 
         # set the callback to the configure() function
-        param._callbacks.append(self.configure)
+        param._callbacks.append(partial(self.__on_param_changed, param._name))
 
         # add to list of parameters
-        self.__params.append(param)
+        self.__params[param._name] = len(self.__params_list)
+        self.__params_list.append(param)
+
+        return
+
+    def __on_param_changed(self, name: str):
+        """Callback attached to every parameter : configure() right away, or once at the end of the current batch."""
+
+        self.__changed.add(name)
+
+        # invalidate the quantities derived from the parameter
+        for attr in self._derived.get(name, ()):
+            self.__dict__.pop(attr, None)
+
+        if self.__batch_depth == 0:
+            self.__configure()
+
+        return
+
+    def __configure(self):
+        try:
+            self.configure()
+        finally:
+            self.__changed.clear()
+        return
+
+    @property
+    def changed_params(self) -> frozenset:
+        """Names of the parameters changed since the last configure(), typically read from configure() for incremental updates."""
+        return frozenset(self.__changed)
+
+    @contextmanager
+    def batch_update(self):
+        """Context in which parameter changes are collected : configure() is called once on exit, if any parameter changed.
+
+        Example:
+            with module.batch_update():
+                module.set_param("gain", -6.0)
+                module.set_param("cutoff", 1000.0)
+        """
+
+        self.__batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.__batch_depth -= 1
+            if self.__batch_depth == 0 and self.__changed:
+                self.__configure()
+
+        return
+
+    def set_params(self, params: dict):
+        """Set several parameters at once, configure() is called only once.
+
+        Args:
+            params (dict): values of the parameters, by name.
+        """
+
+        with self.batch_update():
+            for name, val in params.items():
+                self.set_param(name, val)
+
+        return
+
+    def post_params(self, params: dict):
+        """Post parameter updates from a control thread, applied together at the start of the next block processed through the module call.
+
+        Posting never blocks nor touches the state used by process() : updates go through a queue (appends and pops of a deque are atomic) drained by the processing thread. Names and datatypes are checked right away, in the calling thread.
+
+        Args:
+            params (dict): values of the parameters, by name.
+        """
+
+        for name, val in params.items():
+            index = self.__params.get(name)
+            if index is None:
+                raise ValueError(
+                    "DSPModule POST : no parameter found with the name <%s>" % name
+                )
+
+            var = self.__params_list[index]._var
+            if not var.accepts(val):
+                raise ValueError(
+                    "DSPModule POST : the candidate value for <%s> has improper type, expected %s but got %s."
+                    % (name, var._dtype, type(val))
+                )
+
+        self.__pending.append(dict(params))
+
+        return
 
+    def post_param(self, name: str, val):
+        """Post a single parameter update from a control thread, see post_params()."""
+        self.post_params({name: val})
         return
 
+    def apply_pending_params(self):
+        """Apply the parameter updates posted since the last block, configure() is called once at most.
+
+        Called by the processing thread only (single consumer). Updates posted meanwhile are left for the next block : producers posting faster than the blocks are processed cannot hold the processing thread.
+        """
+
+        pending = self.__pending
+        if not pending:
+            return
+
+        with self.batch_update():
+            for _ in range(len(pending)):
+                for name, val in pending.popleft().items():
+                    self.set_param(name, val)
+
+        return
+
+    def __call__(self, *args, **kwds):
+        """Process a block of data : pending parameter updates are applied atomically, then process() is run."""
+
+        if self.__pending:
+            self.apply_pending_params()
+
+        return self.process(*args, **kwds)
+
+    def automate(self, name: str, mode: int = DSPAutomation.LINEAR) -> DSPAutomation:
+        """Automation lane of a parameter, created on first call.
+
+        Args:
+            name (str): name of the parameter.
+            mode (int, optional): interpolation of a new lane (DSPAutomation.LINEAR, DSPAutomation.EXPONENTIAL). Defaults to LINEAR.
+
+        Returns:
+            DSPAutomation: lane of the parameter.
+        """
+
+        lane = self.__lanes.get(name)
+        if lane is None:
+            index = self.__params.get(name)
+            if index is None:
+                raise ValueError("DSPModule AUTOMATION : no parameter <%s>" % name)
+            lane = self.__lanes[name] = DSPAutomation(self.__params_list[index], mode)
+
+        return lane
+
+    def automation(self, name: str) -> DSPAutomation:
+        """Automation lane of a parameter, None if the parameter is not automated."""
+        return self.__lanes.get(name)
+
+    def control(self, name: str, n: int) -> np.ndarray:
+        """Per-sample values of a parameter for the next n samples, to be called from process() for audio-rate modulation.
+
+        Automated parameters follow their lane (see automate()), the others are constant.
+
+        Args:
+            name (str): name of the parameter.
+            n (int): number of samples.
+
+        Returns:
+            np.ndarray: values of the parameter, one per sample ((items, samples) for vector parameters).
+        """
+
+        lane = self.__lanes.get(name)
+        if lane is not None:
+            return lane.next(n)
+
+        val = self.get_param(name)
+        if isinstance(val, np.ndarray):
+            return np.repeat(val[:, None], n, axis=1)
+        return np.full(n, val)
+
+    @property
+    def parameters(self) -> list:
+        """Parameters of the module, in the order they were added."""
+        return list(self.__params_list)
+
+    def param_index(self, name: str):
+        """Integer handle of a parameter, for set_param_by_id() and get_param_by_id() on hot paths.
+
+        Args:
+            name (str): name of the parameter.
+
+        Returns:
+            int: position of the parameter in the module, None if not found.
+        """
+
+        index = self.__params.get(name)
+        if index is None:
+            print("no parameter found with the given name")
+
+        return index
+
     def set_param(self, name: str, val):
 
-        for p in self.__params:
-            if p._name == name:
-                p.val = val
-                return
+        index = self.__params.get(name)
+        if index is None:
+            print("no parameter found with the given name")
+            return
 
-        print("no parameter found with the given name")
+        self.__params_list[index].val = val
 
         pass
 
     def get_param(self, name: str):
 
-        for p in self.__params:
-            if p._name == name:
-                return p.val
+        index = self.__params.get(name)
+        if index is None:
+            print("no parameter found with the given name")
+            return
 
-        print("no parameter found with the given name")
+        return self.__params_list[index].val
+
+    def get_params(self) -> dict:
+        """Values of all the parameters, by name : the state needed to rebuild the module (see set_params()).
+
+        Returns:
+            dict: values of the parameters, in the order they were added.
+        """
+        return {name: self.__params_list[i].val for name, i in self.__params.items()}
+
+    def set_param_by_id(self, index: int, val):
+        self.__params_list[index].val = val
+        return
+
+    def get_param_by_id(self, index: int):
+        return self.__params_list[index].val
+
+    def add_input(self, input: DSPInputPort):
+
+        # check that the input does not exist yet
+        if input._name in self.__inputs:
+            print("input with same name already exists, dismissing")
+            return
+
+        # add to list of inputs
+        self.__inputs[input._name] = input
 
         pass
 
-    # def add_input(self, input : DSPModuleIO):
+    def add_output(self, output: DSPOutputPort):
 
-    #     # check that the input does not exist yet
-    #     for i in self.__inputs:
-    #         if i._name == input._name:
-    #             print("input with same name already exists, dismissing")
-    #             return
+        # check that the output does not exist yet
+        if output._name in self.__outputs:
+            print("output with same name already exists, dismissing")
+            return
 
-    #     # add to list of inputs
-    #     self.__inputs.append(input)
+        # add to list of ouputs
+        self.__outputs[output._name] = output
 
-    #     pass
+        pass
 
-    # def add_output(self, output : DSPModuleIO):
+    def input(self, name: str) -> DSPInputPort:
+        return self.__inputs[name]
 
-    #     # check that the output does not exist yet
-    #     for i in self.__outputs:
-    #         if i._name == output._name:
-    #             print("output with same name already exists, dismissing")
-    #             return
+    def output(self, name: str) -> DSPOutputPort:
+        return self.__outputs[name]
 
-    #     # add to list of ouputs
-    #     self.__outputs.append(output)
+    @property
+    def inputs(self) -> list:
+        return list(self.__inputs.values())
 
-    #     pass
+    @property
+    def outputs(self) -> list:
+        return list(self.__outputs.values())
 
     def process(self, *args, **kwds):
         # actual signal processing
         raise NotImplementedError("process method must be implemented.")
 
+    def prepare(
+        self, block_size: int, dtype: np.dtype = np.float64, channels: int = None
+    ):
+        """Set the processing format and preallocate the output buffer, before streaming.
+
+        Modules override it (calling super()) to preallocate their own scratch buffers and states. Output ports are allocated with the block size in place of their unknown (None) dimensions, or with output_shape() if they do not declare a shape.
+
+        With <channels>, blocks are (channels, samples) arrays processed at once by the same instance : per-channel parameters (DSPVectorVariable) are resized to the number of channels, modules keep one state per channel.
+
+        Args:
+            block_size (int): number of samples per block.
+            dtype (np.dtype, optional): datatype of the samples. Defaults to np.float64.
+            channels (int, optional): number of channels, None for single signals (1-D blocks). Defaults to None.
+        """
+
+        self._block_size = block_size
+        self._sample_dtype = np.dtype(dtype)
+        self._channels = channels
+
+        # derived quantities may depend on the format
+        for attrs in self._derived.values():
+            for attr in attrs:
+                self.__dict__.pop(attr, None)
+
+        # one value per channel for vectorized parameters
+        if channels is not None:
+            with self.batch_update():
+                for param in self.__params_list:
+                    var = param._var
+                    if isinstance(var, DSPVectorVariable) and len(var) != channels:
+                        var.resize(channels)
+                        self.__on_param_changed(param._name)
+
+        # output ports own the buffers, the first one is the output of process_block()
+        for port in self.__outputs.values():
+            if port.shape is None:
+                shape = self.output_shape()
+            else:
+                shape = tuple(block_size if d is None else d for d in port.shape)
+            port.allocate(shape, self._sample_dtype)
+
+        if self.__outputs:
+            self._out = next(iter(self.__outputs.values())).data
+        else:
+            self._out = np.zeros(self.output_shape(), dtype=self._sample_dtype)
+
+        return
+
+    @property
+    def channels(self) -> int:
+        """Number of channels processed at once, None for single signals."""
+        return self._channels
+
+    def output_shape(self) -> tuple:
+        """Shape of the output buffer of a block, one sample per input sample by default."""
+        if self._channels is None:
+            return (self._block_size,)
+        return (self._channels, self._block_size)
+
+    def process_into(self, inputs, out):
+        """Process a block of data and write the result into <out>, without allocating memory.
+
+        The default implementation falls back on process() and copies its result : modules override it to work in place.
+
+        Args:
+            inputs (np.ndarray): block of data.
+            out (np.ndarray): buffer receiving the result.
+        """
+        out[...] = self.process(inputs)
+        return
+
+    def process_block(self, inputs) -> np.ndarray:
+        """Process a block of data into the preallocated output buffer of the module (see prepare()).
+
+        Pending parameter updates are applied first, as with the module call. The returned buffer is owned by the module and overwritten by the next block : copy it if needed.
+
+        Args:
+            inputs (np.ndarray): block of data, up to block_size samples along the last axis.
+
+        Returns:
+            np.ndarray: output buffer (or a view on it for a shorter last block).
+        """
+
+        if self._out is None:
+            raise ValueError(
+                "DSPModule BLOCK : the module must be prepared before processing blocks"
+            )
+
+        if self.__pending:
+            self.apply_pending_params()
+
+        out = self._out
+        if inputs.shape[-1] != self._block_size:
+            out = out[..., : inputs.shape[-1]]
+
+        self.process_into(inputs, out)
+
+        return out
+
     def configure(self):
         # update internals based on parameters update, called everytime a parameter is changed
         raise NotImplementedError("config method must be implemented.")
 
 
+class DSPSignalModule(DSPModule):
+    """Template class for modules processing one signal, with an "in" and an "out" port.
+
+    Blocks are passed as arrays (module(x), process(x)), or read from the "in" port and written into the buffer of the "out" port when the module is called without arguments, as DSPGraph.process() does.
+    """
+
+    def __init__(self, name: str = ""):
+        super().__init__(name)
+
+        self.add_input(DSPInputPort("in"))
+        self.add_output(DSPOutputPort("out"))
+
+        pass
+
+    def __call__(self, *args, **kwds):
+        """Process a block of data, from the ports without arguments (see process_block())."""
+
+        if args or kwds:
+            return super().__call__(*args, **kwds)
+
+        inputs = self.input("in").data
+        if inputs is None:
+            raise ValueError(
+                "DSPModule <%s> PORTS : the input <in> is neither connected nor fed"
+                % self._name
+            )
+
+        return self.process_block(inputs)
+
+
 # class SimpleDSPModule(DSPModule):
 
 #     def __init__(self, name =""):
@@ -123,8 +678,8 @@ class DSPModule:
 #         self.add_parameter( DSPModuleParameterFloat(name = "threshold", units = "Hz", minv = 0.0, maxv = 1000.0) )
 
 #         # # create inputs and outputs
-#         # self.add_input( DSPModuleIOFloat("in") )
-#         # self.add_output( DSPModuleIOFloat("out") )
+#         # self.add_input( DSPInputPort("in", float) )
+#         # self.add_output( DSPOutputPort("out", float) )
 
 #         pass
 
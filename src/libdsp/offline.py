@@ -0,0 +1,222 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+from libdsp.streaming import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+"""
+
+OFFLINE batch processing runs the same chain of DSPModules over many signals with a pool of worker processes.
+
+Modules are not pickled : workers receive the class, name, processing format (see DSPModule.prepare()) and parameter values (get_params()) of the modules once, and rebuild a fresh chain for each signal so that no state leaks from one signal to the next. Signals go through shared memory, workers read their input and write their output in place instead of pickling arrays back and forth.
+
+"""
+
+# modules of the chain, as rebuilt in the current worker process
+_worker_specs = None
+
+
+def _module_spec(module: DSPModule) -> tuple:
+    """State needed to rebuild a module in another process : processing format (None if not prepared) included, per-channel parameters depend on it."""
+
+    fmt = None
+    if module._block_size is not None:
+        fmt = (module._block_size, module._sample_dtype, module.channels)
+
+    return (type(module), module.name, fmt, module.get_params())
+
+
+def _init_worker(specs: list):
+    """Memorize the chain of modules, once per worker process."""
+
+    global _worker_specs
+    _worker_specs = specs
+
+    return
+
+
+def _build_chain() -> list:
+    """Rebuild the chain of modules of the worker."""
+
+    chain = []
+    for cls, name, fmt, params in _worker_specs:
+        module = cls(name)
+        if fmt is not None:
+            module.prepare(*fmt)
+        module.set_params(params)
+        chain.append(module)
+
+    return chain
+
+
+def _process_shared(src: str, dst: str, shape: tuple, dtype: str, block_size: int):
+    """Process one signal from shared memory to shared memory, in a worker process."""
+
+    t = time.perf_counter()
+
+    shm_in = shared_memory.SharedMemory(name=src)
+    shm_out = shared_memory.SharedMemory(name=dst)
+    try:
+        _process_chain(
+            np.ndarray(shape, dtype=dtype, buffer=shm_in.buf),
+            np.ndarray(shape, dtype=dtype, buffer=shm_out.buf),
+            block_size,
+        )
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+    return os.getpid(), shape[-1], time.perf_counter() - t
+
+
+def _process_chain(x: np.ndarray, y: np.ndarray, block_size: int):
+    """Run the chain of modules of the worker on <x>, result written in <y>."""
+
+    chain = _build_chain()
+
+    # offline : the whole signal at once
+    if block_size is None:
+        for module in chain:
+            x = module(x)
+        y[...] = x
+        return
+
+    # streaming : block by block through the whole chain
+    blocks = iter([x])
+    for module in chain:
+        blocks = stream(module, blocks, block_size)
+
+    i = 0
+    for block in blocks:
+        y[..., i : i + block.shape[-1]] = block
+        i += block.shape[-1]
+
+    return
+
+
+class DSPBatchRunner:
+    """Runs a chain of DSPModules over many signals, on a pool of worker processes.
+
+    The chain must preserve the shape of the signals (samples along the last axis), outputs are cast to the datatype of the inputs. Each module class must be importable by the workers and buildable from its name only, prepared modules are prepared again with the same format, then the parameters are restored with set_params().
+    """
+
+    def __init__(
+        self,
+        modules: list,
+        max_workers: int = None,
+        block_size: int = None,
+    ):
+        """Initialisation of the runner.
+
+        Args:
+            modules (list): chain of DSPModules, their current parameter values are used.
+            max_workers (int, optional): number of worker processes. Defaults to None (number of cores).
+            block_size (int, optional): stream signals by blocks of this size, None to process them as a whole. Defaults to None.
+        """
+        self._specs = [_module_spec(m) for m in modules]
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._block_size = block_size
+        self._stats = {}  # pid -> [samples, seconds]
+
+        return
+
+    @property
+    def stats(self) -> dict:
+        """Throughput of each worker process.
+
+        Returns:
+            dict: {pid: {"samples": ..., "seconds": ..., "samples_per_second": ...}}
+        """
+        return {
+            pid: {
+                "samples": samples,
+                "seconds": seconds,
+                "samples_per_second": samples / seconds if seconds > 0 else 0.0,
+            }
+            for pid, (samples, seconds) in self._stats.items()
+        }
+
+    def run(self, signals) -> list:
+        """Process signals.
+
+        At most two signals per worker are held in shared memory at once, so that long iterables (eg. files loaded lazily by a generator) do not fill the memory.
+
+        Args:
+            signals (iterable): numpy arrays, samples along the last axis.
+
+        Returns:
+            list: processed signals, in the order of the inputs.
+        """
+
+        results = {}
+        pending = {}  # future -> (index, input memory, output memory, shape, dtype)
+        self._stats = {}
+
+        with ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            initializer=_init_worker,
+            initargs=(self._specs,),
+        ) as pool:
+            try:
+                self._submit(pool, signals, pending, results)
+                while pending:
+                    self._collect(pending, results)
+            finally:
+                # release the shared memory of jobs left behind by an error
+                for _, shm_in, shm_out, _, _ in pending.values():
+                    for shm in (shm_in, shm_out):
+                        shm.close()
+                        shm.unlink()
+
+        return [results[i] for i in range(len(results))]
+
+    def _submit(self, pool, signals, pending: dict, results: dict):
+        """Copy the signals in shared memory and submit the jobs, as workers get available."""
+
+        for index, signal in enumerate(signals):
+            if len(pending) >= 2 * self._max_workers:
+                self._collect(pending, results, FIRST_COMPLETED)
+
+            signal = np.asarray(signal)
+            nbytes = max(signal.nbytes, 1)
+            shm_in = shared_memory.SharedMemory(create=True, size=nbytes)
+            shm_out = shared_memory.SharedMemory(create=True, size=nbytes)
+            np.ndarray(signal.shape, signal.dtype, buffer=shm_in.buf)[...] = signal
+
+            future = pool.submit(
+                _process_shared,
+                shm_in.name,
+                shm_out.name,
+                signal.shape,
+                signal.dtype.str,
+                self._block_size,
+            )
+            pending[future] = (index, shm_in, shm_out, signal.shape, signal.dtype)
+
+        return
+
+    def _collect(
+        self, pending: dict, results: dict, return_when: str = "ALL_COMPLETED"
+    ):
+        """Gather finished jobs : copy the outputs out of shared memory and release it."""
+
+        done, _ = wait(list(pending), return_when=return_when)
+        for future in done:
+            index, shm_in, shm_out, shape, dtype = pending.pop(future)
+            try:
+                pid, samples, seconds = future.result()
+                results[index] = np.ndarray(shape, dtype, buffer=shm_out.buf).copy()
+                stats = self._stats.setdefault(pid, [0, 0.0])
+                stats[0] += samples
+                stats[1] += seconds
+            finally:
+                for shm in (shm_in, shm_out):
+                    shm.close()
+                    shm.unlink()
+
+        return
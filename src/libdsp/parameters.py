@@ -6,51 +6,14 @@ __author__ = "Rémy VINCENT"
 __copyright__ = "Aaah"
 __license__ = "Copyright 2022"
 
-# --- data frames transported from plugins to plugins (inputs, outputs)
-# ? can it be achieved with only outputs to avoid memory doubles?
-
-# class PluginIO:
-#     def __init__(self, name : str = ""):
-#         self._name = name # name of the variable
-#         self._data = None # allocated memory to store data
-#         self._dims = [] # dimensions of the data
-#         self._dtype = None # datatype
-#         return
-
-#     @property
-#     def data(self):
-#         return self._data
-
-#     @data.setter
-#     def data(self, v):
-
-#         # memorize the value if the type matches
-#         self._data = v
-
-#         # ? alternative : let the connector check once and for all the compatibility of the types?
-#         # ? alternative : cast anytime
-#         # ? alternative : check datatype and set value if types matches
-
-#         # ? check the dimensions
-
-#         # ? inform that new data has been loaded?
-
-#         pass
-
-# class PluginIOFloat(PluginIO):
-#     def __init__(self, name: str = ""):
-#         super().__init__(name)
-
-#         # set the type to a float
-#         self._dtype = type(0.0)
-
-#         # set the value
-#         self.data = float(0.0)
-
-#         return
+# --- plugin parameters
 
 
-# --- plugin parameters
+def _differs(a, b) -> bool:
+    """Compare values of parameters, scalars or arrays."""
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return not np.array_equal(a, b)
+    return a != b
 
 
 class DSPModuleParameter:
@@ -60,6 +23,8 @@ class DSPModuleParameter:
     - their attributes are exhaustive enough for automated GUI generation.
     """
 
+    __slots__ = ("_name", "_description", "_callbacks", "_var")
+
     def __init__(self, name: str, var: DSPVariable, descp: str = ""):
         """Initialisation of a DSPModuleParameter.
 
@@ -116,11 +81,22 @@ class DSPModuleParameter:
         self._var.val = v
 
         # callbacks on value change
-        if ref_v != self.val:
+        if _differs(ref_v, self.val):
             for cb in self._callbacks:
                 cb()
         pass
 
+    def quantize_many(self, values) -> np.ndarray:
+        """Sanitize a whole array of candidate values (eg. an automation curve) according to the variable definition, without changing the value of the parameter.
+
+        Args:
+            values (array_like): candidate values.
+
+        Returns:
+            np.ndarray: sanitized values.
+        """
+        return self._var.quantize_many(values)
+
 
 # class DSPModuleParameterFloat(DSPModuleParameter):
 #     """
@@ -237,3 +213,502 @@ class DSPModuleParameter:
 #             for cb in self._callbacks:
 #                 cb()
 #         pass
+
+
+# --- banks of parameters
+
+
+class DSPBankVariable(DSPVariable):
+    """
+    View on one entry of a DSPParameterBank : it behaves like a ranged DSPVariable but its value and status live in the arrays of the bank.
+    """
+
+    __slots__ = ("_bank", "_index")
+
+    def __init__(
+        self,
+        bank,
+        index: int,
+        dtype: np.dtype,
+        range: list,
+    ) -> None:
+        """Initialisation of the view, the entry <index> must already be allocated in the bank.
+
+        Args:
+            bank (DSPParameterBank): bank storing the value.
+            index (int): position of the entry in the bank.
+            dtype (np.dtype): data type allowed.
+            range (list): range of the variable (min, step, max, (default)).
+        """
+        self._bank = bank
+        self._index = index
+        super().__init__(dtype, DSPVariableStatus.DSP_VAR_DYNAMIC, range)
+
+        return
+
+    def __repr__(self) -> str:
+        return "(%s, %s, %s)" % (str(self.val), str(self._dtype), str(self.status))
+
+    @property
+    def val(self):
+        return self._dtype(self._bank._values[self._index])
+
+    @val.setter
+    def val(self, v):
+
+        # handle datatype mismatch
+        if not isinstance(v, self._dtype):
+            raise ValueError(
+                "DSPVariable value SETTER : the candidate variable has improper type, expected %s but got %s."
+                % (self._dtype, type(v))
+            )
+
+        bank = self._bank
+        i = self._index
+
+        # enable setter for dynamic variables only
+        if bank._status[i] != DSPVariableStatus.DSP_VAR_DYNAMIC.value:
+            return
+
+        x = None
+        if self._fast and type(v) is self._dtype:
+            try:
+                x = self._quantize_scalar(v)
+            except (ValueError, OverflowError):
+                pass  # nan or inf, let numpy handle it
+        if x is None:
+            x = self._quantize(v)
+
+        # flag the entry as dirty on change only
+        if bank._values[i] != x:
+            bank._values[i] = x
+            bank._dirty[i] = True
+
+        return
+
+    def apply_many(self, values) -> np.ndarray:
+        values = self.quantize_many(values)
+        if values.size:
+            self.val = self._dtype(values.flat[-1])
+        return values
+
+    @property
+    def status(self):
+        return DSPVariableStatus(self._bank._status[self._index])
+
+    @status.setter
+    def status(self, s: DSPVariableStatus):
+        self._bank._status[self._index] = s.value
+        pass
+
+
+class DSPParameterBank:
+    """
+    Struct-of-arrays storage for large numbers of ranged numerical parameters :
+    - values, ranges, status and dirty flags are stored in contiguous numpy arrays;
+    - each entry is still handed out as a DSPModuleParameter (view on the bank) for individual access;
+    - snapshots, bulk updates and diffs of whole presets are single array operations.
+
+    Values are stored as float64, integer parameters are thus exact up to 2**53.
+    """
+
+    def __init__(self, capacity: int = 64):
+        """Initialisation of an empty bank.
+
+        Args:
+            capacity (int, optional): number of entries preallocated, grows when needed. Defaults to 64.
+        """
+        self._count = 0  # number of entries in use
+        self._params = {}  # name -> DSPModuleParameter, in index order
+        self._names = []  # index -> name
+
+        # struct of arrays
+        self._values = np.zeros(capacity, dtype=np.float64)
+        self._minv = np.zeros(capacity, dtype=np.float64)
+        self._stepv = np.ones(capacity, dtype=np.float64)
+        self._maxv = np.zeros(capacity, dtype=np.float64)
+        self._default = np.zeros(capacity, dtype=np.float64)
+        self._status = np.zeros(capacity, dtype=np.int8)
+        self._dirty = np.zeros(capacity, dtype=bool)
+
+        return
+
+    def __repr__(self) -> str:
+        return "DSPParameterBank (%d parameters)" % self._count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._params
+
+    def __getitem__(self, name: str) -> DSPModuleParameter:
+        return self._params[name]
+
+    def __iter__(self):
+        return iter(self._params.values())
+
+    def _grow(self):
+        """Double the capacity of the arrays."""
+
+        capacity = max(2 * len(self._values), 1)
+        for attr in (
+            "_values",
+            "_minv",
+            "_stepv",
+            "_maxv",
+            "_default",
+            "_status",
+            "_dirty",
+        ):
+            old = getattr(self, attr)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: self._count] = old[: self._count]
+            setattr(self, attr, new)
+
+        return
+
+    def add(
+        self,
+        name: str,
+        dtype: np.dtype,
+        range: list,
+        status: DSPVariableStatus = DSPVariableStatus.DSP_VAR_DYNAMIC,
+        descp: str = "",
+    ) -> DSPModuleParameter:
+        """Add a ranged numerical parameter to the bank.
+
+        Args:
+            name (str): name of the parameter, unique in the bank.
+            dtype (np.dtype): numerical data type.
+            range (list): range of the parameter (min, step, max, (default)).
+            status (DSPVariableStatus, optional): can the value be edited. Defaults to DSP_VAR_DYNAMIC.
+            descp (str, optional): quick description of the parameter for hints. Defaults to "".
+
+        Returns:
+            DSPModuleParameter: parameter viewing the new entry of the bank.
+        """
+
+        if name in self._params:
+            raise ValueError(
+                "DSPParameterBank ADD : parameter with name <%s> already exists" % name
+            )
+
+        if range is None or dtype in (bool, str):
+            raise ValueError(
+                "DSPParameterBank ADD : only ranged numerical parameters can be stored, got %s"
+                % dtype
+            )
+
+        if self._count == len(self._values):
+            self._grow()
+
+        # the value is initialised to the default even for constant parameters
+        i = self._count
+        self._status[i] = DSPVariableStatus.DSP_VAR_DYNAMIC.value
+        var = DSPBankVariable(self, i, dtype, range)
+        self._minv[i], self._stepv[i], self._maxv[i], self._default[i] = var.range
+        self._status[i] = status.value
+        self._dirty[i] = False
+
+        param = DSPModuleParameter(name, var, descp)
+        self._params[name] = param
+        self._names.append(name)
+        self._count += 1
+
+        return param
+
+    def index(self, name: str) -> int:
+        """Position of a parameter in the arrays of the bank."""
+        return self._params[name]._var._index
+
+    @property
+    def names(self) -> list:
+        return list(self._names)
+
+    @property
+    def values(self) -> np.ndarray:
+        """Read-only view on the current values."""
+        v = self._values[: self._count]
+        v.flags.writeable = False
+        return v
+
+    @property
+    def status(self) -> np.ndarray:
+        """Read-only view on the status (DSPVariableStatus values)."""
+        s = self._status[: self._count]
+        s.flags.writeable = False
+        return s
+
+    @property
+    def dirty(self) -> np.ndarray:
+        """Read-only view on the dirty flags (entries changed since the last clear_dirty())."""
+        d = self._dirty[: self._count]
+        d.flags.writeable = False
+        return d
+
+    def clear_dirty(self):
+        self._dirty[: self._count] = False
+        return
+
+    def snapshot(self) -> np.ndarray:
+        """Copy of the current values, eg. to store a preset.
+
+        Returns:
+            np.ndarray: values of all the parameters, in index order.
+        """
+        return self._values[: self._count].copy()
+
+    def quantize(self, values) -> np.ndarray:
+        """Round each candidate value with the step of its parameter and clip it to its bounds, in one vectorized pass.
+
+        Args:
+            values (array_like): one candidate value per parameter, in index order.
+
+        Returns:
+            np.ndarray: sanitized values.
+        """
+
+        n = self._count
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (n,):
+            raise ValueError(
+                "DSPParameterBank QUANTIZE : expected %d values but got shape %s"
+                % (n, values.shape)
+            )
+
+        values = np.round(values / self._stepv[:n]) * self._stepv[:n]
+        return np.clip(values, self._minv[:n], self._maxv[:n])
+
+    def load(self, values, mask=None) -> np.ndarray:
+        """Bulk-set the values of the parameters (eg. recall a preset) :
+        - values are rounded and clipped like with the setter of each parameter
+        - constant parameters are left untouched
+        - changed parameters are flagged as dirty
+
+        Callbacks attached to the parameters are not triggered, use the returned mask or the dirty flags to react to the changes.
+
+        Args:
+            values (array_like): one candidate value per parameter, in index order.
+            mask (array_like, optional): boolean mask of the parameters to update. Defaults to None (all of them).
+
+        Returns:
+            np.ndarray: boolean mask of the parameters whose value changed.
+        """
+
+        n = self._count
+        values = self.quantize(values)
+
+        # enable update for dynamic parameters only
+        update = self._status[:n] == DSPVariableStatus.DSP_VAR_DYNAMIC.value
+        if mask is not None:
+            update &= np.asarray(mask, dtype=bool)
+
+        changed = update & (values != self._values[:n])
+        self._values[:n][changed] = values[changed]
+        self._dirty[:n] |= changed
+
+        return changed
+
+    def reset(self) -> np.ndarray:
+        """Bulk-set all the dynamic parameters to their default value.
+
+        Returns:
+            np.ndarray: boolean mask of the parameters whose value changed.
+        """
+        return self.load(self._default[: self._count])
+
+    def diff(self, preset, reference=None) -> np.ndarray:
+        """Compare a preset to the current values (or to another preset).
+
+        Args:
+            preset (array_like): values, in index order.
+            reference (array_like, optional): values to compare with. Defaults to None (current values).
+
+        Returns:
+            np.ndarray: boolean mask of the parameters that differ.
+        """
+        if reference is None:
+            reference = self._values[: self._count]
+        return np.asarray(preset) != np.asarray(reference)
+
+
+# --- automation of parameters
+
+
+class DSPAutomation:
+    """
+    Automation lane of a numerical DSPModuleParameter, scalar or vector (DSPVectorVariable, one value per channel) :
+    - breakpoints (time in samples, value) describe the curve, values are held before the first and after the last breakpoint;
+    - the curve is rendered block by block as a control vector in one vectorized call, sanitized by the variable of the parameter (step, bounds);
+    - the parameter itself follows the curve at block rate, it holds the last value of each rendered block.
+
+    Vector parameters are rendered as (items, samples) arrays : a breakpoint holds one value per item, or a single value applied to every item.
+    """
+
+    # interpolation between breakpoints
+    LINEAR = 0
+    EXPONENTIAL = 1  # geometric, linear between values of opposite signs or zero
+
+    def __init__(self, param: DSPModuleParameter, mode: int = LINEAR):
+        """Initialisation of the lane.
+
+        Args:
+            param (DSPModuleParameter): automated parameter, numerical.
+            mode (int, optional): interpolation between breakpoints (LINEAR, EXPONENTIAL). Defaults to LINEAR.
+        """
+
+        val = np.asarray(param.val)
+        if val.dtype.kind not in "iuf" or val.ndim > 1:
+            raise ValueError(
+                "DSPAutomation : parameter <%s> is not a numerical scalar or vector"
+                % param._name
+            )
+
+        self._param = param
+        self._mode = mode
+        self._vector = val.ndim == 1  # one value per item of a DSPVectorVariable
+        self._times = np.empty(0, dtype=np.int64)  # sorted times of the breakpoints
+        # values of the breakpoints, (breakpoints, 1 or items) for vectors
+        self._values = np.empty((0, 1) if self._vector else 0)
+        self._position = 0  # time of the next rendered sample
+
+        return
+
+    def __repr__(self) -> str:
+        return "DSPAutomation <%s> (%d breakpoints, position %d)" % (
+            self._param._name,
+            len(self._times),
+            self._position,
+        )
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def add(self, time: int, value):
+        """Add a breakpoint, replacing any breakpoint at the same time.
+
+        Args:
+            time (int): time in samples.
+            value: value of the parameter at that time.
+        """
+        self.add_many([time], [value])
+        return
+
+    def add_many(self, times, values):
+        """Add breakpoints, replacing any breakpoint at the same times.
+
+        Args:
+            times (array_like): times in samples.
+            values (array_like): values of the parameter at those times.
+        """
+
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if times.ndim != 1 or values.shape[:1] != times.shape:
+            raise ValueError(
+                "DSPAutomation : %d times but %d values" % (times.size, len(values))
+            )
+
+        # vectors : one value per item or for all the items, both kinds of breakpoints as wide
+        previous = self._values
+        if self._vector:
+            values = values.reshape(len(times), -1)
+            width = max(values.shape[1], previous.shape[1])
+            values = np.broadcast_to(values, (len(values), width))
+            previous = np.broadcast_to(previous, (len(previous), width))
+        elif values.ndim != 1:
+            raise ValueError(
+                "DSPAutomation : parameter <%s> takes scalar values" % self._param._name
+            )
+
+        # the new breakpoints win on equal times : unique() keeps the first occurrence
+        times = np.concatenate([times[::-1], self._times])
+        values = np.concatenate([values[::-1], previous])
+        self._times, index = np.unique(times, return_index=True)
+        self._values = values[index]
+
+        return
+
+    def clear(self):
+        """Remove all the breakpoints, the parameter keeps its current value."""
+        self._times = np.empty(0, dtype=np.int64)
+        self._values = np.empty((0, 1) if self._vector else 0)
+        return
+
+    @property
+    def breakpoints(self) -> tuple:
+        """(times, values) of the breakpoints, sorted by time."""
+        return self._times.copy(), self._values.copy()
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    def seek(self, position: int):
+        """Move the time of the next rendered sample (eg. transport relocation)."""
+        self._position = position
+        return
+
+    def render(self, start: int, n: int) -> np.ndarray:
+        """Control vector of the parameter over n samples, without changing the position nor the parameter.
+
+        Args:
+            start (int): time of the first sample.
+            n (int): number of samples.
+
+        Returns:
+            np.ndarray: sanitized values of the parameter, one per sample ((items, samples) for vectors).
+        """
+
+        if len(self._times) == 0:
+            values = np.asarray(self._param.val, dtype=np.float64)[..., None]
+        elif len(self._times) == 1:
+            values = self._values[0][..., None]
+        else:
+            t = np.arange(start, start + n)
+
+            # segment of each sample, and position within the segment
+            seg = np.searchsorted(self._times, t, side="right") - 1
+            seg = np.clip(seg, 0, len(self._times) - 2)
+            t0, t1 = self._times[seg], self._times[seg + 1]
+            v0, v1 = self._values[seg].T, self._values[seg + 1].T
+            frac = np.clip((t - t0) / (t1 - t0), 0.0, 1.0)
+
+            values = v0 + frac * (v1 - v0)
+            if self._mode == DSPAutomation.EXPONENTIAL:
+                geometric = v0 * v1 > 0
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    ratio = np.where(geometric, v1 / v0, 1.0)
+                values = np.where(geometric, v0 * ratio**frac, values)
+
+        # one row per item for vectors
+        shape = (len(self._param.val), n) if self._vector else (n,)
+        values = np.array(np.broadcast_to(values, shape))
+
+        # integer parameters are rounded before being sanitized
+        if np.asarray(self._param.val).dtype.kind in "iu":
+            values = np.round(values).astype(np.int64)
+
+        return self._param.quantize_many(values)
+
+    def next(self, n: int) -> np.ndarray:
+        """Control vector for the next n samples : the position moves forward and the parameter takes the last value.
+
+        Args:
+            n (int): number of samples.
+
+        Returns:
+            np.ndarray: sanitized values of the parameter, one per sample.
+        """
+
+        values = self.render(self._position, n)
+        self._position += n
+
+        if n and len(self._times):
+            if self._vector:
+                self._param.val = values[:, -1]
+            else:
+                self._param.val = self._param._var._dtype(values[-1])
+
+        return values
@@ -0,0 +1,236 @@
+import numpy as np
+
+from libdsp.variables import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+"""
+
+SIGNALS are data frames transported from modules to modules through ports.
+
+Only outputs own memory : an output port allocates the buffer the module writes into, and the input ports connected to it hold numpy views on that very buffer. Chaining modules never copies sample data.
+
+Datatypes and shapes are checked once, when connecting ports or allocating buffers, never when processing blocks.
+
+Ports also carry capabilities : variables describing the formats they can handle (sample rate, block size, number of channels, datatype), negotiated once for a whole graph (see DSPGraph.negotiate()).
+
+"""
+
+# capabilities of the ports, with the datatype of their variables
+CAPABILITIES = {"samplerate": float, "blocksize": int, "channels": int, "dtype": str}
+
+
+def _compatible_shapes(a, b) -> bool:
+    """Shapes are compatible when they have the same number of dimensions and agree on every known (not None) dimension."""
+    if a is None or b is None:
+        return True
+    if len(a) != len(b):
+        return False
+    return all(x is None or y is None or x == y for x, y in zip(a, b))
+
+
+class DSPPort:
+    """Template class for inputs and outputs of DSPModules."""
+
+    def __init__(
+        self, name: str, dtype: np.dtype = None, shape: tuple = None, caps: dict = None
+    ):
+        """Initialisation of a port.
+
+        Args:
+            name (str): name of the port.
+            dtype (np.dtype, optional): datatype of the samples, None to follow the module. Defaults to None.
+            shape (tuple, optional): shape of a block, None for dimensions set at allocation (the last one is the block size). Defaults to None (any shape).
+            caps (dict, optional): capabilities of the port, DSPVariables by name (see CAPABILITIES), constrained by a range or a set. Defaults to None (any format, the datatype of the port if declared).
+        """
+        self._name = name  # name of the port
+        self._dtype = None if dtype is None else np.dtype(dtype)  # datatype
+        self._shape = None if shape is None else tuple(shape)  # dimensions
+        self._data = None  # samples of the current block
+
+        # capabilities, unconstrained by default
+        caps = {} if caps is None else dict(caps)
+        for cap in caps:
+            if cap not in CAPABILITIES:
+                raise ValueError(
+                    "DSPPort <%s> CAPS : unknown capability <%s>, expected one of %s"
+                    % (name, cap, list(CAPABILITIES))
+                )
+        if self._dtype is not None and "dtype" not in caps:
+            caps["dtype"] = DSPVariable(str, set=(self._dtype.name,))
+        self._caps = {
+            cap: caps[cap] if cap in caps else DSPVariable(dtype)
+            for cap, dtype in CAPABILITIES.items()
+        }
+
+        return
+
+    def __repr__(self) -> str:
+        return "%s (%s, %s)" % (self._name, str(self._dtype), str(self._shape))
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def caps(self) -> dict:
+        """Capabilities of the port, DSPVariables by name : locked to the agreed values once negotiated."""
+        return self._caps
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data
+
+    def _check(self, data: np.ndarray, context: str):
+        """Check the datatype and shape of a buffer against the declaration of the port."""
+
+        if self._dtype is not None and data.dtype != self._dtype:
+            raise ValueError(
+                "DSPPort <%s> %s : mismatch of types, expected %s but got %s."
+                % (self._name, context, self._dtype, data.dtype)
+            )
+
+        if not _compatible_shapes(self._shape, data.shape):
+            raise ValueError(
+                "DSPPort <%s> %s : mismatch of shapes, expected %s but got %s."
+                % (self._name, context, self._shape, data.shape)
+            )
+
+        return
+
+
+class DSPOutputPort(DSPPort):
+    """Output of a DSPModule : owns the buffer the module writes into."""
+
+    def __init__(
+        self, name: str, dtype: np.dtype = None, shape: tuple = None, caps: dict = None
+    ):
+        super().__init__(name, dtype, shape, caps)
+        self._sinks = []  # connected input ports
+
+        return
+
+    @property
+    def sinks(self) -> list:
+        return list(self._sinks)
+
+    def allocate(self, shape: tuple, dtype: np.dtype = None):
+        """Allocate the buffer of the port, connected inputs are bound to it.
+
+        Args:
+            shape (tuple): shape of a block.
+            dtype (np.dtype, optional): datatype, used if the port does not declare one. Defaults to None.
+        """
+
+        if dtype is None and self._dtype is None:
+            raise ValueError(
+                "DSPPort <%s> ALLOCATE : no datatype declared nor given" % self._name
+            )
+
+        data = np.zeros(shape, dtype=dtype if self._dtype is None else self._dtype)
+        self._check(data, "ALLOCATE")
+        self._data = data
+
+        for sink in self._sinks:
+            sink._bind()
+
+        return
+
+
+class DSPInputPort(DSPPort):
+    """Input of a DSPModule : a view on the buffer of the connected output, or a buffer fed by the user when not connected."""
+
+    def __init__(
+        self, name: str, dtype: np.dtype = None, shape: tuple = None, caps: dict = None
+    ):
+        super().__init__(name, dtype, shape, caps)
+        self._source = None  # connected output port
+
+        return
+
+    @property
+    def source(self) -> DSPOutputPort:
+        return self._source
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data
+
+    @data.setter
+    def data(self, v: np.ndarray):
+        """Feed an unconnected input, the array is referenced and not copied."""
+
+        if self._source is not None:
+            raise ValueError(
+                "DSPPort <%s> SETTER : input is connected to <%s>, it cannot be fed"
+                % (self._name, self._source._name)
+            )
+
+        self._check(v, "SETTER")
+        self._data = v
+
+        pass
+
+    def connect(self, source: DSPOutputPort):
+        """Connect the input to an output, datatypes and shapes are checked once and for all.
+
+        Args:
+            source (DSPOutputPort): output to read from.
+        """
+
+        if self._source is not None:
+            raise ValueError(
+                "DSPPort <%s> CONNECT : already connected to <%s>"
+                % (self._name, self._source._name)
+            )
+
+        if (
+            self._dtype is not None
+            and source._dtype is not None
+            and self._dtype != source._dtype
+        ):
+            raise ValueError(
+                "DSPPort <%s> CONNECT : mismatch of types with <%s>, %s and %s."
+                % (self._name, source._name, self._dtype, source._dtype)
+            )
+
+        if not _compatible_shapes(self._shape, source._shape):
+            raise ValueError(
+                "DSPPort <%s> CONNECT : mismatch of shapes with <%s>, %s and %s."
+                % (self._name, source._name, self._shape, source._shape)
+            )
+
+        self._source = source
+        source._sinks.append(self)
+        self._bind()
+
+        return
+
+    def disconnect(self):
+        if self._source is not None:
+            self._source._sinks.remove(self)
+        self._source = None
+        self._data = None
+        return
+
+    def _bind(self):
+        """Hold a view on the buffer of the connected output."""
+
+        data = self._source._data
+        if data is not None:
+            self._check(data, "CONNECT")
+            data = data.view()
+
+        self._data = data
+
+        return
@@ -0,0 +1,516 @@
+import asyncio
+
+import numpy as np
+
+from libdsp.modules import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+"""
+
+STREAMING runs a DSPModule frame by frame over signals of arbitrary length.
+
+The source is any iterable (list, generator, file reader...) of numpy arrays of any size, samples along the last axis. It is cut into fixed-size blocks that are passed in turn to the module, the same module instance is used all along so that its internal state is carried over from one block to the next. Output blocks are yielded lazily : memory usage does not depend on the length of the signal.
+
+In asyncio applications, astream() runs the module in an executor so that processing never blocks the event loop.
+
+Between threads (capture, processing, playback), samples go through a DSPRingBuffer : a preallocated circular buffer written by one thread and read by another one, without locks nor per-block allocations. Runners read windows of any size and hop from it.
+
+"""
+
+
+class DSPRingBuffer:
+    """Single-producer single-consumer ring buffer of samples, preallocated.
+
+    The producer only moves the write counter and the consumer only moves the read counter, both after the data is in place : one thread may write while another one reads, without locks. Readers and writers get views on the buffer (two segments when wrapping around) to avoid copies.
+
+    Writing more samples than there is space for drops the extra samples (overrun), reading more samples than available returns nothing (underrun) : both are counted.
+    """
+
+    def __init__(
+        self, capacity: int, channels: int = None, dtype: np.dtype = np.float64
+    ):
+        """Initialisation of the buffer.
+
+        Args:
+            capacity (int): number of samples held at most.
+            channels (int, optional): number of channels, None for single signals. Defaults to None.
+            dtype (np.dtype, optional): datatype of the samples. Defaults to np.float64.
+        """
+
+        if capacity < 1:
+            raise ValueError(
+                "DSPRingBuffer : capacity must be positive, got %d" % capacity
+            )
+
+        shape = (capacity,) if channels is None else (channels, capacity)
+        self._buffer = np.zeros(shape, dtype=dtype)
+        self._channels = shape[:-1]  # leading dimensions of the blocks
+        self._capacity = capacity
+        self._written = 0  # samples written since the start, moved by the producer only
+        self._consumed = 0  # samples read since the start, moved by the consumer only
+        self._overruns = 0  # writes truncated for lack of space
+        self._underruns = 0  # reads refused for lack of samples
+        self._scratch = {}  # size -> contiguous copy of wrapping windows
+
+        return
+
+    def __repr__(self) -> str:
+        return "DSPRingBuffer (%d/%d samples, %d overruns, %d underruns)" % (
+            self.available,
+            self._capacity,
+            self._overruns,
+            self._underruns,
+        )
+
+    def __len__(self) -> int:
+        return self.available
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def available(self) -> int:
+        """Number of samples that can be read."""
+        return self._written - self._consumed
+
+    @property
+    def space(self) -> int:
+        """Number of samples that can be written."""
+        return self._capacity - (self._written - self._consumed)
+
+    @property
+    def written(self) -> int:
+        """Number of samples written since the start."""
+        return self._written
+
+    @property
+    def consumed(self) -> int:
+        """Number of samples read since the start."""
+        return self._consumed
+
+    @property
+    def overruns(self) -> int:
+        return self._overruns
+
+    @property
+    def underruns(self) -> int:
+        return self._underruns
+
+    def _segments(self, start: int, n: int) -> tuple:
+        """Views on n samples from the absolute position <start>, one or two segments."""
+        i = start % self._capacity
+        if i + n <= self._capacity:
+            return (self._buffer[..., i : i + n],)
+        return (self._buffer[..., i:], self._buffer[..., : i + n - self._capacity])
+
+    # --- producer side
+
+    def writable(self, n: int) -> tuple:
+        """Views on the space for the next n samples (one or two segments), to be filled then committed with commit().
+
+        Args:
+            n (int): number of samples, at most space.
+
+        Returns:
+            tuple: views on the buffer.
+        """
+        if n > self.space:
+            raise ValueError(
+                "DSPRingBuffer WRITE : %d samples requested but only %d free"
+                % (n, self.space)
+            )
+        return self._segments(self._written, n)
+
+    def commit(self, n: int):
+        """Publish n samples filled through writable()."""
+        self._written += n
+        return
+
+    def write(self, block: np.ndarray) -> int:
+        """Copy a block of samples into the buffer, the samples that do not fit are dropped (overrun).
+
+        Args:
+            block (np.ndarray): samples along the last axis.
+
+        Returns:
+            int: number of samples written.
+        """
+
+        buffer = self._buffer
+        if block.shape[:-1] != self._channels:
+            raise ValueError(
+                "DSPRingBuffer WRITE : mismatch of shapes, expected %s channels but got %s."
+                % (self._channels, block.shape[:-1])
+            )
+
+        n = block.shape[-1]
+        written, capacity = self._written, self._capacity
+        space = capacity - (written - self._consumed)
+        if n > space:
+            self._overruns += 1
+            n = space
+
+        # one or two segments, the counter is moved once the data is in place
+        i = written % capacity
+        if i + n <= capacity:
+            buffer[..., i : i + n] = block[..., :n]
+        else:
+            k = capacity - i
+            buffer[..., i:] = block[..., :k]
+            buffer[..., : n - k] = block[..., k:n]
+
+        self._written = written + n
+
+        return n
+
+    # --- consumer side
+
+    def readable(self, n: int) -> tuple:
+        """Views on the next n samples (one or two segments), released with advance().
+
+        Args:
+            n (int): number of samples, at most available.
+
+        Returns:
+            tuple: views on the buffer.
+        """
+        if n > self.available:
+            raise ValueError(
+                "DSPRingBuffer READ : %d samples requested but only %d available"
+                % (n, self.available)
+            )
+        return self._segments(self._consumed, n)
+
+    def peek(self, n: int) -> np.ndarray:
+        """The next n samples as a single array, without releasing them (see advance()).
+
+        A view on the buffer when the samples are contiguous, otherwise a copy into a scratch array reused by the next calls : the result is valid until the next read.
+
+        Args:
+            n (int): number of samples.
+
+        Returns:
+            np.ndarray: samples, None if less than n samples are available (underrun).
+        """
+
+        if n > self.available:
+            self._underruns += 1
+            return None
+
+        segments = self._segments(self._consumed, n)
+        if len(segments) == 1:
+            return segments[0]
+
+        scratch = self._scratch.get(n)
+        if scratch is None:
+            scratch = self._scratch[n] = np.empty(
+                self._channels + (n,), dtype=self._buffer.dtype
+            )
+        k = segments[0].shape[-1]
+        scratch[..., :k] = segments[0]
+        scratch[..., k:] = segments[1]
+
+        return scratch
+
+    def advance(self, n: int):
+        """Release the next n samples, their space is given back to the producer."""
+        self._consumed += min(n, self.available)
+        return
+
+    def read(self, n: int, out: np.ndarray = None) -> np.ndarray:
+        """Copy and release the next n samples.
+
+        Args:
+            n (int): number of samples.
+            out (np.ndarray, optional): array receiving the samples. Defaults to None (new array).
+
+        Returns:
+            np.ndarray: samples, None if less than n samples are available (underrun).
+        """
+
+        if n > self._written - self._consumed:
+            self._underruns += 1
+            return None
+
+        buffer, capacity, consumed = self._buffer, self._capacity, self._consumed
+        if out is None:
+            out = np.empty(self._channels + (n,), dtype=buffer.dtype)
+
+        i = consumed % capacity
+        if i + n <= capacity:
+            out[...] = buffer[..., i : i + n]
+        else:
+            k = capacity - i
+            out[..., :k] = buffer[..., i:]
+            out[..., k:] = buffer[..., : n - k]
+
+        self._consumed = consumed + n
+
+        return out
+
+    def clear(self):
+        """Drop all the samples and reset the counters, while no thread is using the buffer."""
+        self._written = 0
+        self._consumed = 0
+        self._overruns = 0
+        self._underruns = 0
+        return
+
+
+class DSPStreamRunner:
+    """Feeds a DSPModule with fixed-size blocks cut from an iterable of arrays, or from a DSPRingBuffer.
+
+    With a hop, blocks are windows of block_size samples starting every hop samples (overlapping when hop < block_size, eg. spectral analysis).
+    """
+
+    def __init__(
+        self, module: DSPModule, block_size: int, pad: bool = True, hop: int = None
+    ):
+        """Initialisation of the runner.
+
+        Args:
+            module (DSPModule): module processing the blocks (called as module(block)).
+            block_size (int): number of samples per block.
+            pad (bool, optional): the last incomplete block is zero-padded and the output trimmed, otherwise it is passed as is. Defaults to True.
+            hop (int, optional): number of samples between the starts of two blocks. Defaults to None (block_size).
+        """
+
+        if block_size < 1 or (hop is not None and hop < 1):
+            raise ValueError(
+                "DSPStreamRunner : block size and hop must be positive, got %d and %s"
+                % (block_size, hop)
+            )
+
+        self._module = module
+        self._block_size = block_size
+        self._pad = pad
+        self._hop = block_size if hop is None else hop
+        self._covered = 0  # end of the last window read from a ring buffer
+        self._skip = 0  # samples to release before the start of the next window
+
+        return
+
+    def __repr__(self) -> str:
+        return "DSPStreamRunner (block size %d, hop %d)" % (
+            self._block_size,
+            self._hop,
+        )
+
+    @property
+    def block_size(self) -> int:
+        return self._block_size
+
+    @property
+    def hop(self) -> int:
+        return self._hop
+
+    def drain(self, ring: DSPRingBuffer):
+        """Process all the windows available in a ring buffer, typically on the consumer thread.
+
+        Windows are read in place (no copy unless they wrap around the buffer), their samples are released once processed.
+
+        Args:
+            ring (DSPRingBuffer): buffer filled by a producer.
+
+        Yields:
+            output of the module for each window.
+        """
+
+        module = self._module
+        n, hop = self._block_size, self._hop
+
+        while True:
+            # samples between two spaced windows (hop > block size) are skipped as they come
+            self._release(ring)
+            if self._skip or ring.available < n:
+                return
+
+            block = ring.peek(n)
+            out = module(block)
+
+            # the samples are given back to the producer
+            if isinstance(out, np.ndarray) and np.may_share_memory(out, block):
+                out = out.copy()
+
+            self._covered = ring.consumed + n
+            self._skip = hop
+            self._release(ring)
+            yield out
+
+    def _release(self, ring: DSPRingBuffer):
+        """Give back to the producer the samples before the start of the next window, as far as available."""
+
+        skipped = min(self._skip, ring.available)
+        ring.advance(skipped)
+        self._skip -= skipped
+
+        return
+
+    def run(self, source):
+        """Process a stream.
+
+        Args:
+            source (iterable): arrays of any length, samples along the last axis.
+
+        Yields:
+            output of the module for each block.
+        """
+
+        if self._hop != self._block_size:
+            yield from self._run_windows(source)
+            return
+
+        module = self._module
+        n = self._block_size
+        pending = []  # chunks not processed yet
+        count = 0  # number of samples not processed yet
+
+        for chunk in source:
+            chunk = np.asarray(chunk)
+            pending.append(chunk)
+            count += chunk.shape[-1]
+
+            if count < n:
+                continue
+
+            # blocks are views on the chunk when the source is already aligned on blocks
+            data = pending[0] if len(pending) == 1 else np.concatenate(pending, axis=-1)
+            stop = count - count % n
+            for i in range(0, stop, n):
+                yield module(data[..., i : i + n])
+
+            pending = [data[..., stop:]] if stop < count else []
+            count -= stop
+
+        # last incomplete block
+        if count:
+            data = pending[0] if len(pending) == 1 else np.concatenate(pending, axis=-1)
+
+            if not self._pad:
+                yield module(data)
+                return
+
+            block = np.zeros(data.shape[:-1] + (n,), dtype=data.dtype)
+            block[..., :count] = data
+            out = module(block)
+
+            # trim outputs that are sample-aligned with the input
+            if isinstance(out, np.ndarray) and out.ndim and out.shape[-1] == n:
+                out = out[..., :count]
+            yield out
+
+        return
+
+    def _run_windows(self, source):
+        """Process a stream by overlapping or spaced windows, through a ring buffer."""
+
+        module = self._module
+        n = self._block_size
+        ring = None
+        self._covered = 0
+        self._skip = 0
+
+        for chunk in source:
+            chunk = np.asarray(chunk)
+            if ring is None:
+                channels = chunk.shape[0] if chunk.ndim == 2 else None
+                ring = DSPRingBuffer(2 * max(n, self._hop), channels, chunk.dtype)
+
+            # as much as fits, then the windows it completes
+            i = 0
+            while i < chunk.shape[-1]:
+                i += ring.write(chunk[..., i : i + ring.space])
+                yield from self.drain(ring)
+
+        # samples never covered by a window : last window padded or passed as is
+        if ring is None or not ring.available or ring.written <= self._covered:
+            return
+
+        data = ring.read(min(ring.available, n))
+        if not self._pad:
+            yield module(data)
+            return
+
+        block = np.zeros(data.shape[:-1] + (n,), dtype=data.dtype)
+        block[..., : data.shape[-1]] = data
+        yield module(block)
+
+        return
+
+
+def stream(module: DSPModule, source, block_size: int, pad: bool = True):
+    """Process a stream with a DSPModule, see DSPStreamRunner.
+
+    Args:
+        module (DSPModule): module processing the blocks.
+        source (iterable): arrays of any length, samples along the last axis.
+        block_size (int): number of samples per block.
+        pad (bool, optional): zero-pad the last incomplete block. Defaults to True.
+
+    Returns:
+        generator: output of the module for each block.
+    """
+    return DSPStreamRunner(module, block_size, pad).run(source)
+
+
+async def astream(module: DSPModule, frames, executor=None, max_pending: int = 4):
+    """Process a stream of frames with a DSPModule from an asyncio application.
+
+    Frames are processed in order, one at a time, in an executor (threads by default) : the event loop stays free for I/O and other streams. At most <max_pending> frames wait for processing, the source is not read further until the processing catches up (backpressure).
+
+    Example:
+        async for out in astream(module, frames):
+            ...
+
+    Args:
+        module (DSPModule): module processing the frames (called as module(frame)).
+        frames (iterable or async iterable): frames to process.
+        executor (concurrent.futures.Executor, optional): executor running the module. Defaults to None (default executor of the loop).
+        max_pending (int, optional): number of frames read in advance. Defaults to 4.
+
+    Yields:
+        output of the module for each frame.
+    """
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_pending)
+    end = object()
+
+    async def feed():
+        cancelled = False
+        try:
+            if hasattr(frames, "__aiter__"):
+                async for frame in frames:
+                    await queue.put(frame)
+            else:
+                for frame in frames:
+                    await queue.put(frame)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # nobody waits for the end of the stream once cancelled, the queue may be full
+            if not cancelled:
+                await queue.put(end)
+
+    feeder = asyncio.ensure_future(feed())
+
+    try:
+        while True:
+            frame = await queue.get()
+            if frame is end:
+                break
+            yield await loop.run_in_executor(executor, module, frame)
+
+        # errors raised by the source
+        await feeder
+    finally:
+        # consumer gone (early break, error) : the feeder is over before the stream closes
+        feeder.cancel()
+        await asyncio.gather(feeder, return_exceptions=True)
+
+    return
@@ -1,3 +1,4 @@
+import math
 from enum import Enum
 
 import numpy as np
@@ -35,23 +36,75 @@ class DSPVariableStatus(Enum):
 
 
 class DSPVariable:
+
+    # fixed layout, no per-instance __dict__ : variables are instantiated by the thousands
+    __slots__ = (
+        "_dtype",
+        "_val",
+        "_status",
+        "_ranged",
+        "_minv",
+        "_stepv",
+        "_maxv",
+        "_default",
+        "_fast",
+        "_set",
+    )
+
     def __init__(
         self,
         dtype: np.dtype,
         status: DSPVariableStatus = DSPVariableStatus.DSP_VAR_DYNAMIC,
         range: list = None,
+        set: list = None,
     ) -> None:
         self._dtype = dtype  # data type allowed, unique for each variable
         self._val = None  # the value of the variable
         self._status = status  # can the value be edited
-        self._range = None  # ranged numerical values
-        self._set = None  # set of allowed values (numbers, strings)
+        self._ranged = False  # ranged numerical values
+        self._minv = None  # lower bound of the range
+        self._stepv = None  # resolution of the range
+        self._maxv = None  # upper bound of the range
+        self._default = None  # default value of the range
+        self._fast = False  # scalar fast path enabled (python int/float ranges)
+        self._set = None  # set of allowed values : sorted array (numbers) or value -> index (strings)
 
         # handle booleans as special case
         if self._dtype == bool:
             self._val = False
             return
 
+        # handle set of values
+        if set is not None:
+
+            # raise error if range is not None
+            if range is not None:
+                raise ValueError(
+                    "DSPVariable SET : conflict with RANGE also defined, but cannot be used at the same time"
+                )
+
+            # check datatype in the set
+            if len(set) == 0:
+                raise ValueError("DSPVariable SET : expected at least one value")
+            for e in set:
+                if not isinstance(e, self._dtype):
+                    raise ValueError(
+                        "DSPVariable SET : mismatch of types, expected %s but got %s."
+                        % (self._dtype, type(e))
+                    )
+
+            # strings are looked up in a dict, numbers in a sorted array
+            if self._dtype == str:
+                self._set = {e: i for i, e in enumerate(dict.fromkeys(set))}
+            else:
+                self._set = np.unique(np.asarray(set, dtype=np.dtype(self._dtype)))
+
+            # the first value is the default one
+            self._default = set[0]
+            self.val = self._default
+
+            return
+
         # handle numerical range
         if range is not None:
 
@@ -61,14 +114,6 @@ class DSPVariable:
                     "DSPVariable RANGE : not compatible with datatype <string>, expect numerical datatype"
                 )
 
-            # raise error if set is not None
-            if self._set is not None:
-                raise ValueError(
-                    "DSPVariable RANGE : conflict with SET also defined, but cannot be used at the same time"
-                )
-
-            self._range = {}
-
             # check datatype in the range list
             for e in range:
                 if not isinstance(e, self._dtype):
@@ -81,27 +126,27 @@ class DSPVariable:
             if len(range) < 3 or len(range) > 4:
                 raise ValueError(
                     "DSPVariable RANGE : expected 3 or 4 parameters to describe the range (min, step, max, (default)) but got %d"
-                    % len(status)
+                    % len(range)
                 )
 
-            if len(range) >= 3:
-                self._range["minv"] = range[0]
-                self._range["stepv"] = range[1]
-                self._range["maxv"] = range[2]
-                self._range["default"] = self._range["minv"]
-
-            if len(range) == 4:
-                self._range["default"] = range[3]
+            self._ranged = True
+            self._minv = range[0]
+            self._stepv = range[1]
+            self._maxv = range[2]
+            self._default = range[3] if len(range) == 4 else range[0]
 
             # raise exception if minv > maxv
-            if self._range["minv"] > self._range["maxv"]:
+            if self._minv > self._maxv:
                 raise ValueError(
                     "DSPVariable RANGE : minv (%s) > maxv (%s)"
-                    % (str(self._range["minv"], self._range["maxv"]))
+                    % (str(self._minv), str(self._maxv))
                 )
 
+            # python numbers can be quantized without numpy
+            self._fast = self._dtype in (int, float)
+
             # initialise value
-            self.val = self._range["default"]
+            self.val = self._default
 
         pass
 
@@ -126,18 +171,21 @@ class DSPVariable:
         # enable setter for dynamic variables only
         if self._status == DSPVariableStatus.DSP_VAR_DYNAMIC:
 
-            # handle numerical ranged variables
-            if self._range is not None:
-
-                # round with given accuracy
-                self._val = np.round(v / self._range["stepv"]) * self._range["stepv"]
-
-                # apply boundaries to the candidate value
-                self._val = np.clip(self._val, self._range["minv"], self._range["maxv"])
+            # handle sets : strings must belong to it, numbers snap to the nearest value
+            if self._set is not None:
+                self._val = self._snap(v)
+                return
 
-                # make sure to preserv data type (above operations switch to float64)
-                self._val = self._dtype(self._val)
+            # handle numerical ranged variables, plain python numbers first
+            if self._fast and type(v) is self._dtype:
+                try:
+                    self._val = self._quantize_scalar(v)
+                    return
+                except (ValueError, OverflowError):
+                    pass  # nan or inf, let numpy handle it
 
+            if self._ranged:
+                self._val = self._quantize(v)
                 return
 
             # by default, accept value
@@ -145,6 +193,159 @@ class DSPVariable:
 
         return
 
+    def accepts(self, v) -> bool:
+        """Check the datatype of a candidate value, without setting it."""
+        return isinstance(v, self._dtype)
+
+    def contains(self, v) -> bool:
+        """Check that a candidate value belongs to the set of the variable (always True without set).
+
+        Strings are looked up in a dict, numbers by binary search in the sorted set.
+        """
+        if self._set is None:
+            return True
+        if isinstance(self._set, dict):
+            return v in self._set
+        i = np.searchsorted(self._set, v)
+        return bool(i < len(self._set) and self._set[i] == v)
+
+    def _snap(self, v):
+        """Nearest allowed value of the set, raise ValueError for strings out of the set."""
+
+        if isinstance(self._set, dict):
+            if v not in self._set:
+                raise ValueError(
+                    "DSPVariable SET : <%s> is not one of the allowed values %s"
+                    % (v, list(self._set))
+                )
+            return v
+
+        return self._dtype(self._snap_many(np.asarray(v)))
+
+    def _snap_many(self, values: np.ndarray) -> np.ndarray:
+        """Nearest allowed values of the numerical set (the lowest one when halfway)."""
+
+        s = self._set
+        if len(s) == 1:
+            return np.full(values.shape, s[0])
+
+        # neighbours in the sorted set, candidates beyond the bounds snap to them
+        i = np.clip(np.searchsorted(s, values), 1, len(s) - 1)
+        lo, hi = s[i - 1], s[i]
+
+        # distances in float64, small integers would wrap around in their own datatype
+        v = np.asarray(values, dtype=np.float64)
+        return np.where(v - lo.astype(np.float64) <= hi.astype(np.float64) - v, lo, hi)
+
+    def _quantize(self, v):
+        """Round and clip a candidate value using numpy (any numerical datatype)."""
+
+        # round with given accuracy
+        x = np.round(v / self._stepv) * self._stepv
+
+        # apply boundaries to the candidate value
+        x = np.clip(x, self._minv, self._maxv)
+
+        # make sure to preserv data type (above operations switch to float64)
+        return self._dtype(x)
+
+    def _quantize_scalar(self, v):
+        """Round and clip a python int/float without numpy, bit-identical to _quantize().
+
+        Raises ValueError or OverflowError for nan and inf values.
+        """
+        minv, stepv, maxv = self._minv, self._stepv, self._maxv
+
+        # numpy works in float64 and rounds half to even, like round() ; copysign keeps the sign of zero
+        q = float(v) / stepv
+        x = math.copysign(float(round(q)), q) * stepv
+
+        # np.clip() keeps the bound when equal (signed zeros), so does max()/min() with the bound first
+        return self._dtype(min(maxv, max(minv, x)))
+
+    def quantize_many(self, values) -> np.ndarray:
+        """Sanitize a whole array of candidate values in one vectorized pass :
+        - check the datatype of the array against the datatype of the variable
+        - round with the step accuracy and clip to the bounds (ranged variables only)
+        - snap to the nearest allowed value (numerical sets), check membership (string sets)
+        - cast to the datatype of the variable
+
+        The value of the variable itself is left untouched.
+
+        Args:
+            values (array_like): candidate values.
+
+        Returns:
+            np.ndarray: sanitized values, same shape as the input.
+        """
+
+        values = np.asarray(values)
+        dtype = np.dtype(self._dtype)
+
+        # handle datatype mismatch (same kind of numbers, strings or booleans)
+        if values.dtype.kind != dtype.kind:
+            raise ValueError(
+                "DSPVariable QUANTIZE : the candidate array has improper type, expected %s but got %s."
+                % (self._dtype, values.dtype)
+            )
+
+        # handle sets, same operations as the scalar setter ; strings as wide as the longest allowed value
+        if isinstance(self._set, dict):
+            dtype = np.dtype("U%d" % max(len(e) for e in self._set))
+            allowed = np.isin(values, list(self._set))
+            if not np.all(allowed):
+                raise ValueError(
+                    "DSPVariable SET : %s are not allowed values %s"
+                    % (np.unique(values[~allowed]).tolist(), list(self._set))
+                )
+        elif self._set is not None:
+            values = self._snap_many(values)
+
+        # handle numerical ranged variables, same operations as the scalar setter
+        if self._ranged:
+            values = np.round(values / self._stepv) * self._stepv
+            values = np.clip(values, self._minv, self._maxv)
+
+        return np.asarray(values).astype(dtype, copy=False)
+
+    def apply_many(self, values) -> np.ndarray:
+        """Sanitize an array of candidate values and apply the last one to the variable.
+
+        Typical use is an automation curve : the whole curve is sanitized at once and the variable ends up holding the final point, as if each value had been assigned in turn through the setter.
+
+        Args:
+            values (array_like): candidate values.
+
+        Returns:
+            np.ndarray: sanitized values, same shape as the input.
+        """
+
+        values = self.quantize_many(values)
+
+        # enable setter for dynamic variables only
+        if values.size and self._status == DSPVariableStatus.DSP_VAR_DYNAMIC:
+            self._val = self._dtype(values.flat[-1])
+
+        return values
+
+    @property
+    def range(self):
+        """Range of the variable as a (minv, stepv, maxv, default) tuple, None if not ranged."""
+        if not self._ranged:
+            return None
+        return (self._minv, self._stepv, self._maxv, self._default)
+
+    @property
+    def set(self):
+        """Allowed values of the variable, sorted for numbers and in declaration order for strings, None without set."""
+        if self._set is None:
+            return None
+        return (
+            tuple(self._set)
+            if isinstance(self._set, dict)
+            else tuple(self._set.tolist())
+        )
+
     @property
     def status(self):
         return self._status
@@ -156,3 +357,104 @@ class DSPVariable:
 
 
 # class DSPNumber(DSPVariable):
+
+
+class DSPVectorVariable(DSPVariable):
+    """
+    Vector of values sharing the definition of a DSPVariable (datatype, status, range), typically one value per channel.
+
+    The value is a numpy array, candidates are sanitized in one vectorized pass. Scalar candidates are applied to every item.
+    """
+
+    __slots__ = ("_size",)
+
+    def __init__(
+        self,
+        dtype: np.dtype,
+        size: int = 1,
+        status: DSPVariableStatus = DSPVariableStatus.DSP_VAR_DYNAMIC,
+        range: list = None,
+        set: list = None,
+    ) -> None:
+        self._size = size  # number of items
+        super().__init__(dtype, status, range, set)
+
+        # constant or unconstrained variables start with the default or neutral value of the datatype
+        if not isinstance(self._val, np.ndarray):
+            fill = self._dtype() if self._default is None else self._default
+            self._val = self.quantize_many(
+                np.full(size, fill, dtype=np.dtype(self._dtype))
+            )
+
+        pass
+
+    def __repr__(self) -> str:
+        return "(%s, %s, %s)" % (str(self._val), str(self._dtype), str(self._status))
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def val(self) -> np.ndarray:
+        return self._val
+
+    @val.setter
+    def val(self, v):
+
+        # enable setter for dynamic variables only
+        if self._status != DSPVariableStatus.DSP_VAR_DYNAMIC:
+            return
+
+        # scalar candidates are sanitized once and applied to all the items
+        if not isinstance(v, np.ndarray):
+            if not isinstance(v, self._dtype):
+                raise ValueError(
+                    "DSPVariable value SETTER : the candidate variable has improper type, expected %s but got %s."
+                    % (self._dtype, type(v))
+                )
+            v = np.asarray(v, dtype=np.dtype(self._dtype))
+
+        values = self.quantize_many(v)
+        if values.shape not in ((), (self._size,)):
+            raise ValueError(
+                "DSPVariable value SETTER : expected %d values but got shape %s."
+                % (self._size, values.shape)
+            )
+
+        # always a new array, so that the previous value can be compared to
+        self._val = np.array(np.broadcast_to(values, (self._size,)))
+
+        return
+
+    def accepts(self, v) -> bool:
+        if isinstance(v, np.ndarray):
+            return v.dtype.kind == np.dtype(self._dtype).kind
+        return isinstance(v, self._dtype)
+
+    def set_item(self, index: int, v):
+        """Set the value of a single item.
+
+        Args:
+            index (int): position of the item.
+            v: candidate value.
+        """
+        values = self._val.copy()
+        values[index] = v
+        self.val = values
+        return
+
+    def resize(self, size: int):
+        """Change the number of items : existing items are kept, new ones take the default value (the first item if unconstrained)."""
+
+        if size == self._size:
+            return
+
+        fill = self._val[0] if self._default is None else self._default
+        values = np.full(size, fill, dtype=self._val.dtype)
+        n = min(size, self._size)
+        values[:n] = self._val[:n]
+
+        self._size = size
+        self._val = values
+
+        return
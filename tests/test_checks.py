@@ -0,0 +1,135 @@
+import pytest as pytest
+
+from libdsp.checks import *
+from libdsp.graph import *
+from libdsp.library import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] allocations : in-place modules pass, allocating modules are reported
+- [x] promotions : float32 blocks kept by the library modules, promoting modules are reported
+- [x] promotions : modules of a graph run through their ports, sources included
+
+"""
+
+
+class ScaleDSPModule(DSPModule):
+    def configure(self):
+        pass
+
+    def process(self, x):
+        return 0.5 * x
+
+
+class InPlaceScaleDSPModule(ScaleDSPModule):
+    def process_into(self, inputs, out):
+        np.multiply(inputs, 0.5, out=out)
+        pass
+
+
+def test_checks_allocations():
+    """in-place modules pass, allocating modules are reported"""
+
+    x = np.ones(256)
+
+    module = InPlaceScaleDSPModule()
+    module.prepare(256)
+    assert_no_allocations(module, x)
+
+    module = ScaleDSPModule()
+    module.prepare(256)
+    assert measure_block_allocations(module, x) >= x.nbytes
+    with pytest.raises(AssertionError):
+        assert_no_allocations(module, x)
+
+    pass
+
+
+class PromotingDSPModule(ScaleDSPModule):
+    def process(self, x):
+        return x * np.array([0.5])
+
+
+def test_checks_promotions():
+    """float32 blocks stay float32"""
+
+    x = np.ones(64, dtype=np.float32)
+    assert_no_promotion(ScaleDSPModule(), x)
+    with pytest.raises(AssertionError):
+        assert_no_promotion(PromotingDSPModule(), x)
+
+    library = [
+        DSPGain(gain=-6.0),
+        DSPBiquad(stages=2),
+        DSPFIRFilter(taps=np.hanning(32)),
+        DSPConvolver(ir=np.hanning(300)),
+    ]
+    promoting = PromotingDSPModule()
+    for channels in (None, 2):
+        promotions = find_promotions(library + [promoting], 64, channels=channels)
+        assert promotions == [(promoting, np.dtype(np.float64))]
+
+    pass
+
+
+class NoiseDSPModule(DSPModule):
+    """source writing into its output port"""
+
+    def __init__(self, name="", dtype=None):
+        super().__init__(name)
+        self.add_output(DSPOutputPort("out", dtype=dtype))
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self):
+        out = self.output("out").data
+        out[...] = np.random.standard_normal(out.shape)
+        pass
+
+
+class ScalePortsDSPModule(DSPModule):
+    """scales its input, computed in float64 and cast back into the output buffer"""
+
+    def __init__(self, name=""):
+        super().__init__(name)
+        self.add_input(DSPInputPort("in"))
+        self.add_output(DSPOutputPort("out"))
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self):
+        self.output("out").data[...] = self.input("in").data * np.array([0.5])
+        pass
+
+
+def test_checks_promotions_graph():
+    """modules of a graph, through their ports"""
+
+    graph = DSPGraph()
+    a = graph.add_module(NoiseDSPModule("a"))
+    b = graph.add_module(ScalePortsDSPModule("b"))
+    c = graph.add_module(NoiseDSPModule("c", dtype=np.float64))
+    d = graph.add_module(ScalePortsDSPModule("d"))
+    e = graph.add_module(ScalePortsDSPModule("e"))
+    graph.connect(a, "out", b, "in")
+    graph.connect(c, "out", d, "in")
+
+    # float64 buffer of <c> reported, <d> reads it through its input and writes float32
+    assert find_promotions(graph.modules, 64) == [(c, np.dtype(np.float64))]
+    assert b.output("out").data.dtype == np.float32
+    assert e.input("in").data.shape == (64,)
+
+    # promotions within process() are cast back into the buffers and do not show
+    assert find_promotions([e], 32, channels=2) == []
+    assert e.output("out").data.shape == (2, 32)
+
+    pass
@@ -0,0 +1,132 @@
+import wave
+
+import pytest as pytest
+
+from libdsp.files import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] raw : blocks are views on the mapped file, round trip through a sink
+- [x] wav : read/write files compatible with the standard wave module
+- [x] process_file : chain of modules from file to file
+- [x] errors : unsupported formats, overflow of the sink
+
+"""
+
+
+class GainFileDSPModule(DSPModule):
+    def configure(self):
+        pass
+
+    def process(self, x):
+        return 0.5 * x
+
+
+def write_wav_int16(path, x, samplerate=8000):
+    """x : (channels, samples) in int16"""
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(x.shape[0])
+        f.setsampwidth(2)
+        f.setframerate(samplerate)
+        f.writeframes(x.T.astype("<i2").tobytes())
+
+
+def read_wav_int16(path):
+    with wave.open(str(path), "rb") as f:
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2")
+        return data.reshape(-1, f.getnchannels()).T, f.getframerate()
+
+
+def test_files_raw(tmp_path):
+    """blocks are views on the mapped file, round trip through a sink"""
+
+    x = np.random.standard_normal((2, 1000)).astype(np.float32)
+    path = tmp_path / "in.raw"
+    x.T.tofile(path)
+
+    source = DSPFileSource(path, np.float32, channels=2)
+    assert len(source) == 1000
+
+    blocks = list(source.blocks(256))
+    assert [b.shape for b in blocks] == [(2, 256)] * 3 + [(2, 232)]
+    assert all(isinstance(b.base, np.ndarray) for b in blocks)
+    assert np.array_equal(np.concatenate(blocks, axis=-1), x)
+
+    with DSPFileSink(tmp_path / "out.raw", len(source), np.float32, 2) as sink:
+        for b in source.blocks(300):
+            sink.write(b)
+        assert sink.position == 1000
+
+    y = np.fromfile(tmp_path / "out.raw", dtype=np.float32).reshape(-1, 2).T
+    assert np.array_equal(x, y)
+
+    pass
+
+
+def test_files_wav(tmp_path):
+    """read/write files compatible with the standard wave module"""
+
+    x = np.random.randint(-(2**15), 2**15, (2, 500)).astype(np.int16)
+    write_wav_int16(tmp_path / "in.wav", x, 44100)
+
+    source = DSPFileSource.wav(tmp_path / "in.wav")
+    assert (len(source), source.channels, source.samplerate) == (500, 2, 44100)
+    assert source.dtype == np.int16
+
+    y = np.concatenate(list(source.blocks(128)), axis=-1)
+    assert np.array_equal(x, y)
+
+    # float conversion
+    y = np.concatenate(list(source.blocks(128, as_float=True)), axis=-1)
+    assert np.allclose(y, x / 2**15)
+
+    # int16 sink from float blocks
+    sink = DSPFileSink.wav(tmp_path / "out.wav", 500, 44100, 2, np.int16)
+    for b in source.blocks(100, as_float=True):
+        sink.write(b)
+    sink.close()
+    z, samplerate = read_wav_int16(tmp_path / "out.wav")
+    assert samplerate == 44100
+    assert np.array_equal(x, z)
+
+    pass
+
+
+def test_files_process(tmp_path):
+    """chain of modules from file to file"""
+
+    x = np.random.randint(-(2**14), 2**14, (1, 3000)).astype(np.int16)
+    write_wav_int16(tmp_path / "in.wav", x)
+
+    source = DSPFileSource.wav(tmp_path / "in.wav")
+    sink = DSPFileSink.wav(tmp_path / "out.wav", len(source), 8000, 1, np.float32)
+    chain = [GainFileDSPModule(), GainFileDSPModule()]
+    process_file(chain, source, sink, block_size=512)
+
+    y = np.concatenate(list(DSPFileSource.wav(tmp_path / "out.wav").blocks(1000)))
+    assert y.dtype == np.float32
+    assert np.allclose(y, 0.25 * x[0] / 2**15)
+
+    pass
+
+
+def test_files_errors(tmp_path):
+    """unsupported formats, overflow of the sink"""
+
+    with pytest.raises(ValueError):
+        DSPFileSink.wav(tmp_path / "out.wav", 10, 8000, 1, np.int64)
+
+    (tmp_path / "not.wav").write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        DSPFileSource.wav(tmp_path / "not.wav")
+
+    sink = DSPFileSink(tmp_path / "out.raw", 10, np.float32)
+    with pytest.raises(ValueError):
+        sink.write(np.zeros(11, dtype=np.float32))
+
+    pass
@@ -0,0 +1,427 @@
+import time
+
+import pytest as pytest
+
+from libdsp.graph import *
+from libdsp.library import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] order : topological, whatever the order of registration
+- [x] order : cycles are detected
+- [x] process : blocks flow through the graph
+- [x] connect : modules must be registered
+- [x] levels : independent modules grouped together
+- [x] executor : same results as the sequential processing
+- [x] executor : errors raised once all the modules of the level are over
+- [x] executor : graph modified after the first block
+- [x] negotiate : common values locked, modules prepared with them
+- [x] negotiate : conflicts detected, converted capabilities kept apart
+- [x] negotiate : ranges agreeing on a common multiple of their steps
+- [x] negotiate : float32 where all the modules support it, float64 elsewhere
+- [x] library : modules of the library processed through their ports, in float32
+
+"""
+
+
+class AddPortsDSPModule(DSPModule):
+    """sums its inputs and adds an offset"""
+
+    def __init__(self, name="", n_inputs=1, offset=0.0):
+        super().__init__(name)
+        self._offset = offset
+        for i in range(n_inputs):
+            self.add_input(DSPInputPort("in%d" % i))
+        self.add_output(DSPOutputPort("out"))
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self):
+        out = self.output("out").data
+        out[...] = self._offset
+        for port in self.inputs:
+            out += port.data
+        pass
+
+
+def test_graph_order():
+    """topological order, whatever the order of registration"""
+
+    graph = DSPGraph()
+    mix = graph.add_module(AddPortsDSPModule("mix", n_inputs=2))
+    b = graph.add_module(AddPortsDSPModule("b"))
+    a = graph.add_module(AddPortsDSPModule("a"))
+    graph.add_module(a)
+
+    graph.connect(a, "out", b, "in0")
+    graph.connect(a, "out", mix, "in0")
+    graph.connect(b, "out", mix, "in1")
+
+    assert graph.order == [a, b, mix]
+    assert len(graph.modules) == 3
+
+    pass
+
+
+def test_graph_cycles():
+    """cycles are detected"""
+
+    graph = DSPGraph()
+    a = graph.add_module(AddPortsDSPModule("a"))
+    b = graph.add_module(AddPortsDSPModule("b"))
+    c = graph.add_module(AddPortsDSPModule("c"))
+    graph.connect(a, "out", b, "in0")
+    graph.connect(b, "out", c, "in0")
+    graph.connect(c, "out", a, "in0")
+
+    with pytest.raises(ValueError):
+        graph.compile()
+
+    pass
+
+
+def test_graph_process():
+    """blocks flow through the graph"""
+
+    graph = DSPGraph()
+    a = graph.add_module(AddPortsDSPModule("a", offset=1.0))
+    b = graph.add_module(AddPortsDSPModule("b", offset=10.0))
+    mix = graph.add_module(AddPortsDSPModule("mix", n_inputs=2, offset=100.0))
+    graph.connect(a, "out", b, "in0")
+    graph.connect(a, "out", mix, "in0")
+    graph.connect(b, "out", mix, "in1")
+    graph.prepare(16)
+
+    x = np.zeros(16)
+    a.input("in0").data = x
+    for i in range(4):
+        x[:] = i
+        graph.process()
+        assert np.allclose(mix.output("out").data, 2 * (i + 1) + 110.0)
+
+    pass
+
+
+def test_graph_connect():
+    """modules must be registered"""
+
+    graph = DSPGraph()
+    a = graph.add_module(AddPortsDSPModule("a"))
+    with pytest.raises(Exception):
+        graph.connect(a, "out", AddPortsDSPModule("b"), "in0")
+
+    pass
+
+
+def build_filter_bank(n_channels=8):
+    graph = DSPGraph()
+    src = graph.add_module(AddPortsDSPModule("src", offset=1.0))
+    mix = graph.add_module(AddPortsDSPModule("mix", n_inputs=n_channels))
+    for i in range(n_channels):
+        ch = graph.add_module(AddPortsDSPModule("ch%d" % i, offset=float(i)))
+        graph.connect(src, "out", ch, "in0")
+        graph.connect(ch, "out", mix, "in%d" % i)
+    return graph, src, mix
+
+
+def test_graph_levels():
+    """independent modules grouped together"""
+
+    graph, src, mix = build_filter_bank(4)
+    levels = graph.levels
+    assert levels[0] == [src]
+    assert [m.name for m in levels[1]] == ["ch0", "ch1", "ch2", "ch3"]
+    assert levels[2] == [mix]
+
+    pass
+
+
+def test_graph_executor():
+    """same results as the sequential processing"""
+
+    graph, src, mix = build_filter_bank(8)
+    graph.prepare(64)
+    x = np.zeros(64)
+    src.input("in0").data = x
+
+    with DSPGraphExecutor(graph, max_workers=4) as executor:
+        for i in range(10):
+            x[:] = i
+            executor.process()
+            y = mix.output("out").data.copy()
+            graph.process()
+            assert np.allclose(y, mix.output("out").data)
+            assert np.allclose(y, 8 * (i + 1) + sum(range(8)))
+
+    pass
+
+
+def test_graph_executor_modified():
+    """graph modified after the first block"""
+
+    graph = DSPGraph()
+    a = graph.add_module(AddPortsDSPModule("a", offset=1.0))
+    a.input("in0").data = np.zeros(8)
+    graph.prepare(8)
+
+    with DSPGraphExecutor(graph, max_workers=2) as executor:
+        executor.process()
+        assert np.allclose(a.output("out").data, 1.0)
+        assert graph.levels == [[a]]
+
+        b = graph.add_module(AddPortsDSPModule("b", offset=5.0))
+        graph.connect(a, "out", b, "in0")
+        assert graph.levels == [[a], [b]]
+        graph.prepare(8)
+        executor.process()
+        assert np.allclose(b.output("out").data, 6.0)
+
+    pass
+
+
+class FailingDSPModule(AddPortsDSPModule):
+    def process(self):
+        raise RuntimeError("module failure")
+
+
+class SlowDSPModule(AddPortsDSPModule):
+    def process(self):
+        time.sleep(0.05)
+        self.done = True
+        pass
+
+
+def test_graph_executor_errors():
+    """errors raised once all the modules of the level are over"""
+
+    for first in (True, False):
+        graph = DSPGraph()
+        failing, slow = FailingDSPModule("failing"), SlowDSPModule("slow")
+        modules = [failing, slow] if first else [slow, failing]
+        for module in modules:
+            graph.add_module(module)
+            module.input("in0").data = np.zeros(8)
+        graph.prepare(8)
+
+        with DSPGraphExecutor(graph, max_workers=2) as executor:
+            with pytest.raises(RuntimeError):
+                executor.process()
+            assert slow.done
+
+    pass
+
+
+class CapsDSPModule(AddPortsDSPModule):
+    """ports with capabilities, and a sample rate parameter"""
+
+    def __init__(self, name="", caps_in=None, caps_out=None):
+        DSPModule.__init__(self, name)
+        self._offset = 0.0
+        self.add_input(DSPInputPort("in0", caps=caps_in))
+        self.add_output(DSPOutputPort("out", caps=caps_out))
+        self.add_parameter(
+            DSPModuleParameter(
+                "samplerate", DSPVariable(float, range=(1.0, 1.0, 192000.0, 8000.0))
+            )
+        )
+        pass
+
+
+class ResamplerDSPModule(CapsDSPModule):
+    converts = ("samplerate",)
+
+
+def test_graph_negotiate():
+    graph = DSPGraph()
+    a = graph.add_module(
+        CapsDSPModule(
+            "a", caps_out={"samplerate": DSPVariable(float, set=(44100.0, 48000.0))}
+        )
+    )
+    b = graph.add_module(
+        CapsDSPModule(
+            "b",
+            caps_in={"samplerate": DSPVariable(float, range=(8000.0, 4000.0, 96000.0))},
+            caps_out={"dtype": DSPVariable(str, set=("float32", "float64"))},
+        )
+    )
+    c = graph.add_module(CapsDSPModule("c", caps_in={"channels": DSPVariable(int)}))
+    graph.connect(a, "out", b, "in0")
+    graph.connect(b, "out", c, "in0")
+
+    # 44100 is not on the steps of <b>, the preferred datatype is allowed
+    graph.negotiate(samplerate=44100.0, blocksize=32, channels=2, dtype=np.float32)
+    for module in (a, b, c):
+        assert graph.format(module) == {
+            "samplerate": 48000.0,
+            "blocksize": 32,
+            "channels": 2,
+            "dtype": "float32",
+        }
+        assert module.get_param("samplerate") == 48000.0
+        assert module.output("out").data.shape == (2, 32)
+        assert module.output("out").data.dtype == np.float32
+
+    # agreed values locked, until the next negotiation
+    cap = b.input("in0").caps["samplerate"]
+    assert cap.status == DSPVariableStatus.DSP_VAR_CONSTANT
+    cap.val = 96000.0
+    assert cap.val == 48000.0
+    graph.negotiate(blocksize=16)
+    assert graph.format(c)["channels"] is None
+    assert c.output("out").data.shape == (16,)
+
+
+def test_graph_negotiate_conflicts():
+    graph = DSPGraph()
+    a = graph.add_module(
+        CapsDSPModule("a", caps_out={"samplerate": DSPVariable(float, set=(44100.0,))})
+    )
+    b = graph.add_module(
+        ResamplerDSPModule(
+            "b",
+            caps_in={"samplerate": DSPVariable(float, set=(44100.0, 48000.0))},
+            caps_out={"samplerate": DSPVariable(float, set=(96000.0,))},
+        )
+    )
+    c = graph.add_module(CapsDSPModule("c"))
+    graph.connect(a, "out", b, "in0")
+    graph.connect(b, "out", c, "in0")
+
+    # the resampler keeps its input and output rates apart
+    graph.negotiate(blocksize=8)
+    assert graph.format(a)["samplerate"] == 44100.0
+    assert b.input("in0").caps["samplerate"].val == 44100.0
+    assert graph.format(b)["samplerate"] == graph.format(c)["samplerate"] == 96000.0
+
+    # no block size, no common value
+    with pytest.raises(ValueError):
+        graph.negotiate()
+    d = graph.add_module(
+        CapsDSPModule("d", caps_in={"samplerate": DSPVariable(float, set=(8000.0,))})
+    )
+    graph.connect(c, "out", d, "in0")
+    with pytest.raises(ValueError):
+        graph.negotiate(blocksize=8)
+
+
+def test_graph_negotiate_ranges():
+    def ranged(*ranges):
+        graph = DSPGraph()
+        modules = [
+            graph.add_module(
+                CapsDSPModule(caps_in={"blocksize": DSPVariable(int, range=r)})
+            )
+            for r in ranges
+        ]
+        for source, sink in zip(modules, modules[1:]):
+            graph.connect(source, "out", sink, "in0")
+        return graph, modules
+
+    # multiples of 3 and 2 : the first one within both ranges, kept by both variables
+    graph, modules = ranged((0, 3, 30), (1, 2, 31))
+    graph.negotiate()
+    assert [graph.format(m)["blocksize"] for m in modules] == [6, 6]
+    assert modules[1].input("in0").caps["blocksize"].val == 6
+
+    # fractional steps, 1.2 is on the steps of 0.3, 0.2 and 0.4
+    graph = DSPGraph()
+    caps = [(0.0, 0.3, 3.0), (0.25, 0.2, 3.0), (1.0, 0.4, 2.1)]
+    modules = [
+        graph.add_module(
+            CapsDSPModule(caps_in={"samplerate": DSPVariable(float, range=r)})
+        )
+        for r in caps
+    ]
+    for source, sink in zip(modules, modules[1:]):
+        graph.connect(source, "out", sink, "in0")
+    graph.negotiate(blocksize=8)
+    assert graph.format(modules[0])["samplerate"] == pytest.approx(1.2)
+
+    # no common multiple within the overlap
+    graph, modules = ranged((2, 4, 10), (1, 3, 5))
+    with pytest.raises(ValueError):
+        graph.negotiate()
+
+
+def test_graph_negotiate_large():
+    graph = DSPGraph()
+    previous = None
+    for i in range(2000):
+        caps = {"blocksize": DSPVariable(int, range=(32, 32, 1024, 64))}
+        module = graph.add_module(CapsDSPModule(caps_in=caps if i % 10 == 0 else None))
+        if previous is not None:
+            graph.connect(previous, "out", module, "in0")
+        previous = module
+
+    # timing in benchmarks/bench_graph.py
+    graph.negotiate(blocksize=100)
+    assert graph.format(previous)["blocksize"] == 64
+
+
+class DoubleDSPModule(CapsDSPModule):
+    dtypes = ("float64",)
+
+
+class SingleDSPModule(CapsDSPModule):
+    dtypes = ("float32", "float64")
+
+
+def test_graph_negotiate_precision():
+    graph = DSPGraph()
+    a = graph.add_module(SingleDSPModule("a"))
+    b = graph.add_module(SingleDSPModule("b"))
+    c = graph.add_module(SingleDSPModule("c"))
+    d = graph.add_module(DoubleDSPModule("d"))
+    graph.connect(a, "out", b, "in0")
+    graph.connect(c, "out", d, "in0")
+
+    graph.negotiate(blocksize=16, dtype=np.float32)
+    assert [graph.format(m)["dtype"] for m in (a, b, c, d)] == [
+        "float32",
+        "float32",
+        "float64",
+        "float64",
+    ]
+    assert b.output("out").data.dtype == np.float32
+    assert d.input("in0").data.dtype == np.float64
+
+    # no datatype in common
+    e = graph.add_module(
+        CapsDSPModule("e", caps_in={"dtype": DSPVariable(str, set=("float32",))})
+    )
+    graph.connect(d, "out", e, "in0")
+    with pytest.raises(ValueError):
+        graph.negotiate(blocksize=16, dtype=np.float32)
+
+
+def test_graph_library_float32():
+    graph = DSPGraph()
+    gain = graph.add_module(DSPGain("gain", gain=-6.0))
+    biquad = graph.add_module(DSPBiquad("biquad", cutoff=2000.0, stages=2))
+    graph.connect(gain, "out", biquad, "in")
+
+    graph.negotiate(blocksize=64, channels=2, dtype=np.float32)
+    assert graph.format(biquad)["dtype"] == "float32"
+
+    x = np.random.standard_normal((2, 64 * 8))
+    y = []
+    for i in range(0, x.shape[-1], 64):
+        gain.input("in").data = x[:, i : i + 64].astype(np.float32)
+        graph.process()
+        assert biquad.output("out").data.dtype == np.float32
+        y.append(biquad.output("out").data.copy())
+
+    ref = DSPBiquad(cutoff=2000.0, stages=2)(DSPGain(gain=-6.0)(x))
+    assert np.allclose(np.concatenate(y, axis=-1), ref, atol=1e-4)
+
+    # inputs neither connected nor fed
+    with pytest.raises(ValueError):
+        DSPGain()()
@@ -0,0 +1,244 @@
+import pytest as pytest
+
+from libdsp.checks import *
+from libdsp.library import *
+from libdsp.streaming import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] gain : dB to linear, one value per channel
+- [x] gain : automated gain, per-sample ramps with process() and process_block()
+- [x] biquad : same output as the sample-by-sample difference equation, whatever the block size
+- [x] biquad : state kept from block to block, one state per channel
+- [x] biquad : matrices shared through the coefficient cache
+- [x] fir : same output as a direct convolution, streamed block by block
+- [x] convolver : same output as a direct convolution, long impulse responses
+- [x] convolver : partitions follow the block size of prepare()
+- [x] convolver : blocks not aligned on the partitions, module not prepared
+- [x] float32 : blocks processed and returned in single precision
+- [x] in place : process_block() same as process(), gain and biquad without allocating memory
+
+"""
+
+
+def almost_equal(x, y, threshold=0.0001):
+    return np.all(np.abs(x - y) < threshold)
+
+
+def direct_biquad(b, a, x, stages=1):
+    """sample-by-sample transposed direct form II"""
+    for _ in range(stages):
+        y = np.zeros_like(x)
+        s1 = s2 = 0.0
+        for n, v in enumerate(x):
+            y[n] = b[0] * v + s1
+            s1 = b[1] * v - a[1] * y[n] + s2
+            s2 = b[2] * v - a[2] * y[n]
+        x = y
+    return x
+
+
+def stream_blocks(module, x, block_size):
+    return np.concatenate(
+        [module(x[..., i : i + block_size]) for i in range(0, x.shape[-1], block_size)],
+        axis=-1,
+    )
+
+
+def test_gain():
+    gain = DSPGain(gain=-6.0)
+    assert almost_equal(gain(np.ones(4)), 10 ** (-6.0 / 20))
+
+    gain.prepare(8, channels=2)
+    gain.set_param("gain", np.array([0.0, 20.0]))
+    y = gain.process_block(np.ones((2, 8)))
+    assert almost_equal(y[0], 1.0) and almost_equal(y[1], 10.0)
+
+    # no allocation per block, whatever the number of channels
+    for channels in (None, 8):
+        gain.prepare(1024, channels=channels)
+        shape = (1024,) if channels is None else (channels, 1024)
+        assert_no_allocations(gain, np.ones(shape))
+
+
+def test_gain_automation():
+    # single signal, ramp from -20 to 0 dB over the block
+    gain = DSPGain(gain=-20.0)
+    gain.automate("gain").add_many([0, 4], [-20.0, 0.0])
+    y = gain(np.ones(6))
+    assert almost_equal(y, 10 ** (np.array([-20, -15, -10, -5, 0, 0]) / 20))
+    assert np.array_equal(gain.get_param("gain"), [0.0])
+
+    # one ramp per channel, in place and in single precision
+    gain = DSPGain()
+    gain.prepare(4, channels=2, dtype=np.float32)
+    gain.automate("gain").add_many([0, 8], [[0.0, 0.0], [-8.0, 8.0]])
+    y = np.concatenate(
+        [gain.process_block(np.ones((2, 4), np.float32)).copy() for _ in range(2)],
+        axis=-1,
+    )
+    assert y.dtype == np.float32
+    assert almost_equal(y[0], 10 ** (-np.arange(8) / 20))
+    assert almost_equal(y[1], 10 ** (np.arange(8) / 20))
+    assert np.array_equal(gain.get_param("gain"), [-7.0, 7.0])
+
+
+@pytest.mark.parametrize("kind", [0, 1, 2, 3])
+@pytest.mark.parametrize("block_size", [1, 37, 64, 200])
+def test_biquad(kind, block_size):
+    biquad = DSPBiquad(kind=kind, cutoff=800.0, q=2.0, gain=6.0, stages=2)
+    b, a = biquad.coefficients()
+
+    x = np.random.standard_normal(500)
+    assert almost_equal(stream_blocks(biquad, x, block_size), direct_biquad(b, a, x, 2))
+
+
+def test_biquad_channels():
+    biquad = DSPBiquad(cutoff=2000.0)
+    b, a = biquad.coefficients()
+    biquad.prepare(32, channels=2)
+
+    x = np.random.standard_normal((2, 256))
+    y = np.concatenate(
+        [biquad.process_block(x[:, i : i + 32]).copy() for i in range(0, 256, 32)],
+        axis=-1,
+    )
+    assert almost_equal(y[0], direct_biquad(b, a, x[0]))
+    assert almost_equal(y[1], direct_biquad(b, a, x[1]))
+
+    # new coefficients, state of the cascade reset
+    biquad.set_param("stages", 3)
+    biquad.reset()
+    b, a = biquad.coefficients()
+    assert almost_equal(biquad(x), np.array([direct_biquad(b, a, c, 3) for c in x]))
+
+
+def test_biquad_cache():
+    DSPBiquad.cache.clear()
+    biquad = DSPBiquad(cutoff=500.0)
+    other = DSPBiquad(cutoff=500.0)
+    assert other._mats[np.dtype(np.float64)] is biquad._mats[np.dtype(np.float64)]
+
+    for cutoff in [1000.0, 500.0, 1000.0, 500.0]:
+        biquad.set_param("cutoff", cutoff)
+    assert (DSPBiquad.cache.misses, DSPBiquad.cache.hits) == (2, 4)
+
+    # matrices depend on the chunk size as well
+    x = np.random.standard_normal(100)
+    ref = DSPBiquad(cutoff=500.0)(x)
+    chunk = DSPBiquad.CHUNK
+    try:
+        DSPBiquad.CHUNK = 16
+        other = DSPBiquad(cutoff=500.0)
+        assert (
+            other._mats[np.dtype(np.float64)] is not biquad._mats[np.dtype(np.float64)]
+        )
+        assert almost_equal(other(x), ref)
+    finally:
+        DSPBiquad.CHUNK = chunk
+
+
+@pytest.mark.parametrize("block_size", [16, 100, 1000])
+def test_fir(block_size):
+    taps = np.random.standard_normal(129)
+    fir = DSPFIRFilter(taps=taps)
+
+    x = np.random.standard_normal((2, 1000))
+    ref = np.array([np.convolve(c, taps)[:1000] for c in x])
+    assert almost_equal(stream_blocks(fir, x, block_size), ref)
+
+    # identity by default
+    assert almost_equal(DSPFIRFilter()(x[0]), x[0])
+
+
+def test_convolver():
+    ir = np.random.standard_normal(3000)
+    x = np.random.standard_normal((2, 2048))
+    ref = np.array([np.convolve(c, ir)[:2048] for c in x])
+
+    # whole signal at once, then streamed
+    assert almost_equal(DSPConvolver(ir=ir, partition=128)(x), ref)
+    convolver = DSPConvolver(ir=ir, partition=128)
+    y = np.concatenate(
+        list(stream(convolver, [x[:, :1000], x[:, 1000:]], 128)), axis=-1
+    )
+    assert almost_equal(y, ref)
+
+    # identity by default, shorter last block
+    assert almost_equal(DSPConvolver(partition=64)(x[0, :100]), x[0, :100])
+
+
+@pytest.mark.parametrize("block_size", [1, 100, 300])
+def test_convolver_blocks(block_size):
+    ir = np.random.standard_normal(1000)
+    x = np.random.standard_normal((2, 2000))
+    ref = np.array([np.convolve(c, ir)[:2000] for c in x])
+
+    # not prepared : the partition stays at 128, whatever the block size
+    convolver = DSPConvolver(ir=ir, partition=128)
+    assert almost_equal(stream_blocks(convolver, x, block_size), ref)
+    assert convolver.partition == 128
+
+
+def test_convolver_prepare():
+    ir = np.random.standard_normal(1000)
+    convolver = DSPConvolver(ir=ir)
+    convolver.prepare(64, channels=2)
+    assert convolver.partition == 64
+
+    x = np.random.standard_normal((2, 640))
+    y = np.concatenate(
+        [convolver.process_block(x[:, i : i + 64]).copy() for i in range(0, 640, 64)],
+        axis=-1,
+    )
+    assert almost_equal(y, np.array([np.convolve(c, ir)[:640] for c in x]))
+
+    # new impulse response, state cleared
+    convolver.set_param("ir", np.array([0.0, 2.0]))
+    assert almost_equal(convolver.process_block(x[:, :64])[:, 1:], 2 * x[:, :63])
+
+
+def test_float32():
+    x = np.random.standard_normal((2, 256))
+    for module in [
+        DSPGain(gain=-6.0),
+        DSPBiquad(stages=2),
+        DSPFIRFilter(taps=np.hanning(32)),
+        DSPConvolver(ir=np.hanning(300), partition=64),
+    ]:
+        ref = module(x)
+        if hasattr(module, "reset"):
+            module.reset()
+        y = module(x.astype(np.float32))
+        assert y.dtype == np.float32
+        assert almost_equal(y, ref, 0.001)
+
+    gain = DSPGain(gain=-6.0)
+    gain.prepare(256, np.float32, 2)
+    assert gain.process_block(x.astype(np.float32)).dtype == np.float32
+
+
+@pytest.mark.parametrize("channels", [None, 4])
+def test_process_block(channels):
+    shape = (256,) if channels is None else (channels, 256)
+    x = np.random.standard_normal((4,) + shape)
+    for module in [
+        DSPGain(gain=-6.0),
+        DSPBiquad(stages=2),
+        DSPFIRFilter(taps=np.hanning(32)),
+        DSPConvolver(ir=np.hanning(300)),
+    ]:
+        module.prepare(256, channels=channels)
+        y = [module.process_block(block).copy() for block in x]
+        module.prepare(256, channels=channels)
+        assert almost_equal(np.array(y), np.array([module(block) for block in x]))
+
+    # whole chunks filtered in place, python objects of the chunk loop only (views, slices)
+    biquad = DSPBiquad(stages=3)
+    biquad.prepare(1024, np.float32, channels)
+    assert_no_allocations(biquad, x[0].astype(np.float32), tolerance=512)
@@ -0,0 +1,537 @@
+import threading
+import time
+
+import pytest as pytest
+
+from libdsp.modules import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] parameters : add, get/set by name
+- [x] parameters : duplicated names are dismissed
+- [x] parameters : integer handles
+- [x] parameters : configure() called on change
+- [x] parameters : batched updates, configure() called once with the changed names
+- [x] derived quantities : lazy, memoized, invalidated by their parameters only
+- [x] posted updates : applied at the start of the next block, from several threads
+- [x] posted updates : the ones posted while applying are left for the next block
+- [x] preallocated buffers : process_block() into the output buffer
+- [x] channels : (channels, samples) blocks, per-channel parameters and states
+- [x] coefficient cache : keyed on quantized values, least recently used dropped, hits/misses counted
+- [x] coefficient cache : keyed on the class of the module and a context, shared between threads
+- [x] automation : per-sample control vectors in process(), parameters follow at block rate
+
+"""
+
+
+def almost_equal(x, y, tol=0.0000001):
+    return True if np.abs(x - y) < tol else False
+
+
+class GainDSPModule(DSPModule):
+    def __init__(self, name=""):
+
+        super().__init__(name)
+
+        self._configure_calls = 0
+        self._changed = []
+
+        # create parameters for the module
+        self.add_parameter(
+            DSPModuleParameter(
+                name="gain", var=DSPVariable(float, range=(-60.0, 0.1, 12.0, 0.0))
+            )
+        )
+        self.add_parameter(
+            DSPModuleParameter(
+                name="threshold", var=DSPVariable(float, range=(0.0, 1.0, 1000.0))
+            )
+        )
+
+        self.configure()
+
+        pass
+
+    def configure(self):
+
+        self._configure_calls += 1
+        self._changed.append(self.changed_params)
+
+        # internal variables computed based on parameters
+        self._gain_lin = 10 ** (self.get_param("gain") / 20)
+
+        pass
+
+    def process(self, x):
+        return x * self._gain_lin
+
+
+def test_modules_parameters_1():
+    """add, get/set by name"""
+
+    module = GainDSPModule()
+    assert [p._name for p in module.parameters] == ["gain", "threshold"]
+
+    module.set_param("gain", -6.0)
+    assert almost_equal(module.get_param("gain"), -6.0)
+    assert almost_equal(module.process(1.0), 10 ** (-6.0 / 20))
+
+    # unknown names are reported, not raised
+    assert module.get_param("unknown") is None
+    module.set_param("unknown", 1.0)
+
+    pass
+
+
+def test_modules_parameters_2():
+    """duplicated names are dismissed"""
+
+    module = GainDSPModule()
+    module.add_parameter(
+        DSPModuleParameter(name="gain", var=DSPVariable(float, range=(0.0, 1.0, 2.0)))
+    )
+    assert len(module.parameters) == 2
+    assert almost_equal(module.get_param("gain"), 0.0)
+
+    pass
+
+
+def test_modules_parameters_3():
+    """integer handles"""
+
+    module = GainDSPModule()
+    gain_id = module.param_index("gain")
+    threshold_id = module.param_index("threshold")
+    assert (gain_id, threshold_id) == (0, 1)
+    assert module.param_index("unknown") is None
+
+    module.set_param_by_id(threshold_id, 500.0)
+    assert almost_equal(module.get_param("threshold"), 500.0)
+    assert almost_equal(module.get_param_by_id(threshold_id), 500.0)
+
+    pass
+
+
+def test_modules_configure():
+    """configure() called on change only"""
+
+    module = GainDSPModule()
+    calls = module._configure_calls
+
+    module.set_param("gain", -3.0)
+    assert module._configure_calls == calls + 1
+
+    module.set_param("gain", -3.0)
+    assert module._configure_calls == calls + 1
+
+    pass
+
+
+def test_modules_batch_update():
+    """batched updates, configure() called once with the changed names"""
+
+    module = GainDSPModule()
+    calls = module._configure_calls
+
+    with module.batch_update():
+        module.set_param("gain", -3.0)
+        module.set_param("threshold", 10.0)
+        module.set_param("gain", -6.0)
+
+        # nested batches are merged
+        with module.batch_update():
+            module.set_param("threshold", 20.0)
+
+        assert module._configure_calls == calls
+
+    assert module._configure_calls == calls + 1
+    assert module._changed[-1] == {"gain", "threshold"}
+    assert almost_equal(module.process(1.0), 10 ** (-6.0 / 20))
+    assert module.changed_params == set()
+
+    # single change
+    module.set_param("threshold", 30.0)
+    assert module._changed[-1] == {"threshold"}
+
+    # no change, no configure
+    module.set_params({"gain": -6.0, "threshold": 30.0})
+    assert module._configure_calls == calls + 2
+
+    module.set_params({"gain": 0.0, "threshold": 0.0})
+    assert module._configure_calls == calls + 3
+    assert module._changed[-1] == {"gain", "threshold"}
+
+    pass
+
+
+class FilterDSPModule(DSPModule):
+    def __init__(self, name=""):
+
+        super().__init__(name)
+
+        self.calls = {"gain": 0, "coefs": 0}
+
+        self.add_parameter(
+            DSPModuleParameter(
+                name="gain", var=DSPVariable(float, range=(-60.0, 0.1, 12.0, 0.0))
+            )
+        )
+        self.add_parameter(
+            DSPModuleParameter(
+                name="cutoff", var=DSPVariable(float, range=(20.0, 1.0, 20000.0))
+            )
+        )
+        self.add_parameter(
+            DSPModuleParameter(
+                name="q", var=DSPVariable(float, range=(0.1, 0.1, 10.0, 0.7))
+            )
+        )
+
+        pass
+
+    @derived("gain")
+    def _gain_lin(self):
+        self.calls["gain"] += 1
+        return 10 ** (self.get_param("gain") / 20)
+
+    @derived("cutoff", "q")
+    def _coefs(self):
+        self.calls["coefs"] += 1
+        return (self.get_param("cutoff"), self.get_param("q"))
+
+    def configure(self):
+        pass
+
+    def process(self, x):
+        return x * self._gain_lin
+
+
+def test_modules_derived():
+    """derived quantities : lazy, memoized, invalidated by their parameters only"""
+
+    module = FilterDSPModule()
+    assert module.calls == {"gain": 0, "coefs": 0}
+
+    # lazy and memoized
+    assert almost_equal(module._gain_lin, 1.0)
+    assert almost_equal(module._gain_lin, 1.0)
+    module._coefs
+    assert module.calls == {"gain": 1, "coefs": 1}
+
+    # invalidated by its own parameters only
+    module.set_param("gain", -20.0)
+    module._coefs
+    assert almost_equal(module._gain_lin, 0.1)
+    assert module.calls == {"gain": 2, "coefs": 1}
+
+    module.set_param("q", 2.0)
+    module._gain_lin
+    assert module._coefs == (20.0, 2.0)
+    assert module.calls == {"gain": 2, "coefs": 2}
+
+    # unchanged value, no invalidation
+    module.set_param("q", 2.0)
+    module._coefs
+    assert module.calls == {"gain": 2, "coefs": 2}
+
+    # instances do not share their values
+    other = FilterDSPModule()
+    assert almost_equal(other._gain_lin, 1.0)
+    assert almost_equal(module._gain_lin, 0.1)
+
+    pass
+
+
+class RecorderDSPModule(GainDSPModule):
+    """records the parameters seen at both ends of each block"""
+
+    def process(self, x):
+        start = (self.get_param("gain"), self.get_param("threshold"), self._gain_lin)
+        time.sleep(0.0001)
+        end = (self.get_param("gain"), self.get_param("threshold"), self._gain_lin)
+        return start, end
+
+
+def test_modules_post_params():
+    """posted updates : applied at the start of the next block"""
+
+    module = GainDSPModule()
+    module.post_param("gain", -20.0)
+    module.post_params({"gain": -6.0, "threshold": 10.0})
+    assert almost_equal(module.get_param("gain"), 0.0)
+
+    calls = module._configure_calls
+    y = module(1.0)
+    assert almost_equal(y, 10 ** (-6.0 / 20))
+    assert almost_equal(module.get_param("threshold"), 10.0)
+    assert module._configure_calls == calls + 1
+
+    # errors are raised in the posting thread
+    with pytest.raises(Exception):
+        module.post_param("unknown", 1.0)
+    with pytest.raises(Exception):
+        module.post_param("gain", "loud")
+
+    pass
+
+
+class ChattyGainDSPModule(GainDSPModule):
+    """posts an update while each one is applied, like a producer faster than the blocks"""
+
+    def set_param(self, name, val):
+        super().set_param(name, val)
+        self.post_param("threshold", float(len(self._changed)))
+        pass
+
+
+def test_modules_post_params_bounded():
+    """posted updates : the ones posted while applying are left for the next block"""
+
+    module = ChattyGainDSPModule()
+    module.post_param("gain", -6.0)
+    module(1.0)
+    assert almost_equal(module.get_param("gain"), -6.0)
+    assert len(module._DSPModule__pending) == 1
+
+    for _ in range(3):
+        module(1.0)
+        assert len(module._DSPModule__pending) == 1
+
+    pass
+
+
+def test_modules_post_params_stress():
+    """posted updates : hammered from several threads while processing"""
+
+    module = RecorderDSPModule()
+    n_posts = 2000
+    last = {}
+
+    def producer(name, values):
+        for v in values:
+            module.post_param(name, v)
+        last[name] = values[-1]
+
+    threads = [
+        threading.Thread(
+            target=producer,
+            args=("gain", [float(v) for v in np.random.randint(-60, 12, n_posts)]),
+        ),
+        threading.Thread(
+            target=producer,
+            args=("threshold", [float(v) for v in np.random.randint(0, 1000, n_posts)]),
+        ),
+    ]
+    for t in threads:
+        t.start()
+
+    blocks = 0
+    while any(t.is_alive() for t in threads):
+        start, end = module(None)
+        assert start == end
+        blocks += 1
+
+    for t in threads:
+        t.join()
+
+    start, end = module(None)
+    assert start == end
+    assert almost_equal(module.get_param("gain"), last["gain"])
+    assert almost_equal(module.get_param("threshold"), last["threshold"])
+
+    # configure() runs at most once per block
+    assert module._configure_calls <= blocks + 2
+
+    pass
+
+
+class InPlaceGainDSPModule(GainDSPModule):
+    def process_into(self, inputs, out):
+        np.multiply(inputs, self._gain_lin, out=out)
+        pass
+
+
+def test_modules_process_block():
+    """preallocated buffers : process_block() into the output buffer"""
+
+    x = np.random.uniform(-1.0, 1.0, 64)
+
+    for module in (GainDSPModule(), InPlaceGainDSPModule()):
+
+        # not prepared
+        with pytest.raises(Exception):
+            module.process_block(x)
+
+        module.prepare(block_size=64, dtype=np.float32)
+        module.post_param("gain", -20.0)
+        y = module.process_block(x)
+        assert y.dtype == np.float32
+        assert np.allclose(y, 0.1 * x)
+
+        # same buffer from block to block, views for shorter blocks
+        assert module.process_block(x) is y
+        z = module.process_block(x[:10])
+        assert z.shape == (10,)
+        assert np.shares_memory(z, y)
+
+    pass
+
+
+class MultiChannelDSPModule(DSPModule):
+    """per-channel gain followed by a running sum, one state per channel"""
+
+    def __init__(self, name=""):
+        super().__init__(name)
+        self.add_parameter(
+            DSPModuleParameter(
+                name="gain",
+                var=DSPVectorVariable(float, range=(0.0, 0.1, 10.0, 1.0)),
+            )
+        )
+        self._state = np.zeros((1, 1))
+        pass
+
+    def prepare(self, block_size, dtype=np.float64, channels=None):
+        super().prepare(block_size, dtype, channels)
+        self._state = np.zeros((channels or 1, 1), dtype=dtype)
+        pass
+
+    def configure(self):
+        self._gain = self.get_param("gain")[:, None]
+        pass
+
+    def process_into(self, inputs, out):
+        np.multiply(inputs, self._gain, out=out)
+        np.cumsum(out, axis=-1, out=out)
+        out += self._state
+        self._state[:, 0] = out[:, -1]
+        pass
+
+
+def test_modules_channels():
+    """(channels, samples) blocks, per-channel parameters and states"""
+
+    module = MultiChannelDSPModule()
+    module.prepare(block_size=32, channels=4)
+    assert module.channels == 4
+    assert module.get_param("gain").shape == (4,)
+    assert module.output_shape() == (4, 32)
+
+    gains = np.array([0.0, 1.0, 2.0, 3.0])
+    module.set_param("gain", gains)
+    module.post_param("gain", gains)
+
+    x = np.random.standard_normal((4, 320))
+    y = np.concatenate(
+        [module.process_block(x[:, i : i + 32]).copy() for i in range(0, 320, 32)],
+        axis=-1,
+    )
+    assert np.allclose(y, np.cumsum(gains[:, None] * x, axis=-1))
+
+    pass
+
+
+def test_modules_coefficient_cache():
+    cache = DSPCoefficientCache(maxsize=2)
+    module = GainDSPModule()
+    computed = []
+
+    def compute():
+        computed.append(module.get_param("gain"))
+        return 10 ** (module.get_param("gain") / 20)
+
+    # values quantized by the variable share the same entry
+    module.set_param("gain", -6.0)
+    assert almost_equal(cache.get(module, compute), 10 ** (-6.0 / 20))
+    module.set_param("gain", -6.01)
+    cache.get(module, compute)
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+
+    # sweeping back and forth hits the cache
+    for gain in [0.0, -6.0, 0.0, -6.0]:
+        module.set_param("gain", gain)
+        cache.get(module, compute)
+    assert computed == [-6.0, 0.0]
+    assert (cache.hits, cache.misses) == (4, 2)
+
+    # least recently used entry dropped, keys restricted to some parameters
+    module.set_param("gain", 3.0)
+    cache.get(module, compute)
+    assert len(cache) == 2
+    module.set_param("threshold", 10.0)
+    assert cache.key(module, ["gain"]) == (GainDSPModule, 3.0)
+    module.set_param("gain", 0.0)
+    cache.get(module, compute)
+    assert computed == [-6.0, 0.0, 3.0, 0.0]
+
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+
+def test_modules_coefficient_cache_shared():
+    cache = DSPCoefficientCache(maxsize=16)
+
+    # same values of parameters, different classes or contexts
+    module, ramp = GainDSPModule(), RampGainDSPModule()
+    assert cache.get(module, lambda: "gain") == "gain"
+    assert cache.get(ramp, lambda: "ramp") == "ramp"
+    assert cache.get(module, lambda: "chunk", context=(64,)) == "chunk"
+    assert cache.get(module, lambda: "other") == "gain"
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.key(module, ["gain"], context=(64,)) == (GainDSPModule, 64, 0.0)
+
+    # modules configured on several threads, one entry kept per key
+    cache.clear()
+    results = []
+
+    def configure():
+        module = GainDSPModule()
+        for i in range(200):
+            module.set_param("gain", float(i % 8))
+            results.append((i % 8, cache.get(module, lambda: object())))
+
+    threads = [threading.Thread(target=configure) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) == 8 and cache.hits + cache.misses == 800
+    for gain in range(8):
+        assert len({id(coefs) for g, coefs in results if g == gain}) == 1
+
+    pass
+
+
+class RampGainDSPModule(GainDSPModule):
+    """gain modulated per sample"""
+
+    def process(self, x):
+        return x * 10 ** (self.control("gain", x.shape[-1]) / 20)
+
+
+def test_modules_automation():
+    module = RampGainDSPModule()
+    assert module.automation("gain") is None
+
+    # constant without lane
+    assert np.array_equal(module(np.ones(4)), np.ones(4))
+
+    lane = module.automate("gain")
+    assert module.automate("gain") is lane
+    lane.add_many([0, 6], [0.0, -6.0])
+
+    y = np.concatenate([module(np.ones(4)) for _ in range(3)])
+    assert np.allclose(y, 10 ** (np.minimum(np.arange(12), 6) * -1.0 / 20))
+
+    # configure() at block rate, with the last value of each block
+    assert module.get_param("gain") == -6.0
+    assert module._configure_calls == 3
+
+    with pytest.raises(ValueError):
+        module.automate("unknown")
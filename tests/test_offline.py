@@ -0,0 +1,112 @@
+import pytest as pytest
+
+from libdsp.library import *
+from libdsp.offline import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] batch : same results as processing in the main process, in order
+- [x] batch : modules rebuilt from their parameters
+- [x] batch : prepared modules rebuilt with their format, per-channel parameters
+- [x] batch : streamed by blocks, one state per signal
+- [x] stats : samples per second per worker
+
+"""
+
+
+class GainOfflineDSPModule(DSPModule):
+    def __init__(self, name=""):
+        super().__init__(name)
+        self.add_parameter(
+            DSPModuleParameter(
+                name="gain", var=DSPVariable(float, range=(-60.0, 0.1, 12.0, 0.0))
+            )
+        )
+        self.configure()
+        pass
+
+    def configure(self):
+        self._gain_lin = 10 ** (self.get_param("gain") / 20)
+        pass
+
+    def process(self, x):
+        return x * self._gain_lin
+
+
+class CumSumOfflineDSPModule(DSPModule):
+    def __init__(self, name=""):
+        super().__init__(name)
+        self._acc = 0.0
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self, x):
+        y = self._acc + np.cumsum(x, axis=-1)
+        self._acc = y[..., -1:]
+        return y
+
+
+def test_offline_batch():
+    """same results as processing in the main process, in order"""
+
+    rng = np.random.default_rng(0)
+    signals = [rng.standard_normal(int(n)) for n in rng.integers(100, 5000, 12)]
+    signals.append(rng.standard_normal((2, 300)).astype(np.float32))
+
+    gain = GainOfflineDSPModule("gain")
+    gain.set_param("gain", -20.0)
+
+    runner = DSPBatchRunner([gain, gain], max_workers=2)
+    results = runner.run(iter(signals))
+
+    assert len(results) == len(signals)
+    for x, y in zip(signals, results):
+        assert y.shape == x.shape
+        assert y.dtype == x.dtype
+        assert np.allclose(y, 0.01 * x, atol=1e-6)
+
+    # throughput per worker
+    stats = runner.stats
+    assert 1 <= len(stats) <= 2
+    assert sum(s["samples"] for s in stats.values()) == sum(
+        x.shape[-1] for x in signals
+    )
+    assert all(s["samples_per_second"] > 0 for s in stats.values())
+
+    pass
+
+
+def test_offline_batch_streaming():
+    """streamed by blocks, one state per signal"""
+
+    signals = [np.ones(1000), np.ones(10)]
+
+    runner = DSPBatchRunner([CumSumOfflineDSPModule()], max_workers=1, block_size=64)
+    results = runner.run(signals)
+    assert np.allclose(results[0], np.arange(1, 1001))
+    assert np.allclose(results[1], np.arange(1, 11))
+
+    pass
+
+
+def test_offline_batch_channels():
+    """prepared modules rebuilt with their format, per-channel parameters"""
+
+    gain = DSPGain("gain")
+    gain.prepare(256, channels=2)
+    gain.set_param("gain", np.array([-20.0, 0.0]))
+
+    signals = [np.ones((2, 1000)), np.ones((2, 10))]
+    for block_size in (None, 256):
+        runner = DSPBatchRunner([gain], max_workers=1, block_size=block_size)
+        for y in runner.run(signals):
+            assert np.allclose(y[0], 0.1) and np.allclose(y[1], 1.0)
+
+    pass
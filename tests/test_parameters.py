@@ -13,13 +13,18 @@ __license__ = "Copyright 2022"
 
 - [x] set/get the status (lock/unlock)
 - [x] number/range : get/set the value (int, bool, float)
-- [ ] number/set : get/set the value (int, bool, float)
+- [x] number/set : get/set the value (int, float)
 - [ ] str/format : get/set the value
-- [ ] str/set : get/set the value
+- [x] str/set : get/set the value
 
 - [ ] callback : check call
 - [ ] callback : only if value is different
 
+- [x] automation : breakpoints, linear/exponential control vectors sanitized by the variable
+- [x] automation : parameter follows the lane at block rate
+- [x] automation : numpy datatypes (float32, int16) kept by the parameter
+- [x] automation : vector parameters, one row per item, scalar breakpoints applied to every item
+
 TODO FOR SIGNALS :
 - [ ] link parameters : change value
 - [ ] link parameters : lock value from direct setter
@@ -77,6 +82,22 @@ def test_parameters_number_boolean():
     pass
 
 
+def test_parameters_sets():
+    calls = []
+    rate = DSPModuleParameter("samplerate", DSPVariable(int, set=(44100, 48000)))
+    rate._callbacks.append(lambda: calls.append(rate.val))
+
+    rate.val = 47000
+    rate.val = 48001
+    assert rate.val == 48000 and calls == [48000]
+
+    kind = DSPModuleParameter("kind", DSPVariable(str, set=("lowpass", "highpass")))
+    kind.val = "highpass"
+    assert kind.val == "highpass"
+    with pytest.raises(ValueError):
+        kind.val = "notch"
+
+
 def test_parameters_status():
     """lock/unlock the update of the parameter value"""
     param = DSPModuleParameter(name="param1", var=DSPVariable(bool))
@@ -88,3 +109,149 @@ def test_parameters_status():
     assert param.status == DSPVariableStatus.DSP_VAR_DYNAMIC
 
     pass
+
+
+def test_parameters_bank_views():
+    """parameters of a bank behave like regular parameters"""
+
+    bank = DSPParameterBank(capacity=1)
+    gain = bank.add("gain", float, (0.0, 0.1, 1.0, 0.5))
+    freq = bank.add("freq", int, (20, 1, 20000, 1000))
+
+    assert isinstance(gain, DSPModuleParameter)
+    assert len(bank) == 2
+    assert bank["freq"] is freq
+    assert bank.index("freq") == 1
+    assert not bank.dirty.any()
+
+    # values are stored in the bank, with the datatype of the parameter preserved
+    gain.val = 0.73
+    assert almost_equal(gain.val, 0.7)
+    assert almost_equal(bank.values[0], 0.7)
+    assert isinstance(freq.val, int)
+    assert bank.dirty.tolist() == [True, False]
+
+    # callbacks
+    calls = []
+    freq._callbacks.append(lambda: calls.append(freq.val))
+    freq.val = 440
+    freq.val = 440
+    assert calls == [440]
+
+    # status
+    freq.lock()
+    assert freq.status == DSPVariableStatus.DSP_VAR_CONSTANT
+    freq.val = 880
+    assert freq.val == 440
+
+    # duplicated names
+    with pytest.raises(Exception):
+        bank.add("gain", float, (0.0, 0.1, 1.0))
+
+    pass
+
+
+def test_parameters_bank_presets():
+    """snapshot, bulk-set and diff of presets"""
+
+    bank = DSPParameterBank()
+    for i in range(100):
+        bank.add("param%d" % i, float, (0.0, 0.1, 1.0, 0.0))
+    bank["param3"].lock()
+
+    preset = np.random.uniform(-1.0, 2.0, 100)
+    changed = bank.load(preset)
+
+    # same sanitization as the scalar setter, constant parameter untouched
+    var = DSPVariable(float, range=(0.0, 0.1, 1.0, 0.0))
+    for i, p in enumerate(bank):
+        if i == 3:
+            assert p.val == 0.0
+            assert not changed[i]
+            continue
+        var.val = float(preset[i])
+        assert p.val == var.val
+    assert (bank.dirty == changed).all()
+
+    # snapshot and diff
+    snapshot = bank.snapshot()
+    assert not bank.diff(snapshot).any()
+    bank.clear_dirty()
+    bank.reset()
+    assert (bank.diff(snapshot) == bank.dirty).all()
+    assert (bank.values == 0.0).all()
+
+    pass
+
+
+def test_parameters_automation():
+    param = DSPModuleParameter("freq", DSPVariable(float, range=(10.0, 0.5, 1000.0)))
+    lane = DSPAutomation(param)
+
+    # linear ramp, sanitized, values held before/after the breakpoints
+    lane.add_many([4, 12], [100.0, 104.0])
+    values = lane.render(0, 16)
+    assert np.array_equal(values[:5], [100.0] * 5)
+    assert np.array_equal(values[5:8], [100.5, 101.0, 101.5])
+    assert np.array_equal(values[12:], [104.0] * 4)
+
+    # breakpoints replaced at equal times, bounds applied
+    lane.add(12, 5000.0)
+    assert lane.render(12, 1)[0] == 1000.0
+    assert len(lane) == 2
+
+    # exponential ramp
+    lane = DSPAutomation(param, DSPAutomation.EXPONENTIAL)
+    lane.add_many([0, 4], [100.0, 400.0])
+    assert np.array_equal(lane.render(0, 5), [100.0, 141.5, 200.0, 283.0, 400.0])
+
+    # parameter follows the lane block by block
+    calls = []
+    param._callbacks.append(lambda: calls.append(param.val))
+    lane.next(2)
+    lane.next(4)
+    assert lane.position == 6 and calls == [141.5, 400.0]
+
+    # integer and non numerical parameters
+    lane = DSPAutomation(DSPModuleParameter("n", DSPVariable(int, range=(0, 2, 10))))
+    lane.add_many([0, 10], [0, 10])
+    assert np.array_equal(lane.render(0, 5), [0, 0, 2, 4, 4])
+    with pytest.raises(ValueError):
+        DSPAutomation(DSPModuleParameter("b", DSPVariable(bool)))
+
+    # numpy datatypes, the parameter keeps the datatype of its variable
+    for dtype, step, end in [(np.float32, 0.5, 1.5), (np.int16, 1, 300)]:
+        bounds = tuple(dtype(v) for v in (0, step, 1000))
+        param = DSPModuleParameter("x", DSPVariable(dtype, range=bounds))
+        lane = DSPAutomation(param)
+        lane.add_many([0, 4], [0, end])
+        values = lane.next(8)
+        assert values.dtype == dtype and values[-1] == end
+        assert param.val == end and isinstance(param.val, dtype)
+
+
+def test_parameters_automation_vector():
+    var = DSPVectorVariable(float, size=2, range=(-10.0, 0.5, 10.0, 0.0))
+    param = DSPModuleParameter("gain", var)
+    lane = DSPAutomation(param)
+
+    # constant lane, one row per item
+    assert np.array_equal(lane.render(0, 3), np.zeros((2, 3)))
+
+    # scalar breakpoints applied to every item, mixed with per-item breakpoints
+    lane.add_many([0, 4], [0.0, 4.0])
+    lane.add(8, np.array([8.0, -4.0]))
+    values = lane.render(0, 10)
+    assert values.shape == (2, 10)
+    assert np.array_equal(values[0], [0, 1, 2, 3, 4, 5, 6, 7, 8, 8])
+    assert np.array_equal(values[1], [0, 1, 2, 3, 4, 2, 0, -2, -4, -4])
+
+    # the parameter follows the lane, bounds applied per item
+    lane.next(9)
+    assert np.array_equal(param.val, [8.0, -4.0])
+    lane.add(12, np.array([20.0, -20.0]))
+    assert np.array_equal(lane.render(12, 1)[:, 0], [10.0, -10.0])
+
+    # wrong number of values
+    with pytest.raises(ValueError):
+        lane.add_many([0, 4], [[0.0, 1.0, 2.0]])
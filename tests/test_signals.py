@@ -0,0 +1,131 @@
+import pytest as pytest
+
+from libdsp.modules import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] connection : inputs are views on the buffer of outputs (no copy)
+- [x] connection : dtype/shape mismatches raised when connecting
+- [x] connection : re-allocation of the output is followed by inputs
+- [x] feed : unconnected inputs reference user data
+- [x] modules : chain of modules through ports
+
+"""
+
+
+def test_signals_connection_views():
+    """inputs are views on the buffer of outputs"""
+
+    out = DSPOutputPort("out", np.float32)
+    out.allocate((2, 64))
+
+    a = DSPInputPort("a", np.float32, shape=(2, None))
+    b = DSPInputPort("b")
+    a.connect(out)
+    b.connect(out)
+    assert out.sinks == [a, b]
+
+    out.data[...] = 1.0
+    assert np.shares_memory(a.data, out.data)
+    assert (a.data == 1.0).all() and (b.data == 1.0).all()
+
+    # re-allocation
+    out.allocate((2, 128))
+    assert a.data.shape == (2, 128)
+    assert np.shares_memory(b.data, out.data)
+
+    # inputs cannot be fed once connected, nor connected twice
+    with pytest.raises(Exception):
+        a.data = np.zeros((2, 128), dtype=np.float32)
+    with pytest.raises(Exception):
+        a.connect(out)
+
+    a.disconnect()
+    assert out.sinks == [b]
+    assert a.data is None
+
+    pass
+
+
+def test_signals_connection_checks():
+    """dtype/shape mismatches raised when connecting"""
+
+    out = DSPOutputPort("out", np.float32, shape=(2, None))
+
+    with pytest.raises(Exception):
+        DSPInputPort("in", np.float64).connect(out)
+
+    with pytest.raises(Exception):
+        DSPInputPort("in", shape=(3, None)).connect(out)
+
+    with pytest.raises(Exception):
+        DSPInputPort("in", shape=(None,)).connect(out)
+
+    with pytest.raises(Exception):
+        out.allocate((3, 64))
+
+    # checked when the buffer is allocated after connection
+    out = DSPOutputPort("out", np.float32)
+    DSPInputPort("in", shape=(None,)).connect(out)
+    with pytest.raises(Exception):
+        out.allocate((2, 64))
+
+    pass
+
+
+def test_signals_feed():
+    """unconnected inputs reference user data"""
+
+    x = np.zeros(64)
+    port = DSPInputPort("in", np.float64)
+    port.data = x
+    assert port.data is x
+
+    with pytest.raises(Exception):
+        port.data = np.zeros(64, dtype=np.int16)
+
+    pass
+
+
+class ScalePortsDSPModule(DSPModule):
+    def __init__(self, name="", factor=2.0):
+        super().__init__(name)
+        self._factor = factor
+        self.add_input(DSPInputPort("in"))
+        self.add_output(DSPOutputPort("out"))
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self):
+        np.multiply(self.input("in").data, self._factor, out=self.output("out").data)
+        pass
+
+
+def test_signals_modules():
+    """chain of modules through ports"""
+
+    first = ScalePortsDSPModule("first", 2.0)
+    second = ScalePortsDSPModule("second", 3.0)
+    second.input("in").connect(first.output("out"))
+
+    # duplicated names are dismissed
+    first.add_output(DSPOutputPort("out"))
+    assert len(first.outputs) == 1
+
+    first.prepare(32, np.float32)
+    second.prepare(32, np.float32)
+    assert first.output("out").data.dtype == np.float32
+
+    first.input("in").data = np.ones(32, dtype=np.float32)
+    first()
+    second()
+    assert np.allclose(second.output("out").data, 6.0)
+
+    pass
@@ -0,0 +1,383 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest as pytest
+
+from libdsp.streaming import *
+
+__author__ = "Rémy VINCENT"
+__copyright__ = "Aaah"
+__license__ = "Copyright 2022"
+
+
+"""
+
+- [x] blocks : fixed size whatever the size of the source chunks
+- [x] blocks : last block padded or passed as is
+- [x] state : carried over from one block to the next
+- [x] lazy : generators in, generators out
+- [x] asyncio : frames from a socket, backpressure, errors
+- [x] asyncio : early break, no task left behind
+- [x] ring buffer : wraparound views, overrun/underrun counters
+- [x] ring buffer : producer and consumer threads
+- [x] windows : block size and hop of any size, from a source or a ring buffer
+
+"""
+
+
+class CumSumDSPModule(DSPModule):
+    """running sum, its state is carried over from block to block"""
+
+    def __init__(self, name=""):
+        super().__init__(name)
+        self.sizes = []
+        self._acc = 0.0
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self, x):
+        self.sizes.append(x.shape[-1])
+        y = self._acc + np.cumsum(x, axis=-1)
+        self._acc = y[..., -1:]
+        return y
+
+
+class IdentityDSPModule(DSPModule):
+    """returns its input, a view on the data it was given"""
+
+    def configure(self):
+        pass
+
+    def process(self, x):
+        return x
+
+
+def random_chunks(x, rng):
+    i = 0
+    while i < x.shape[-1]:
+        n = int(rng.integers(0, 200))
+        yield x[..., i : i + n]
+        i += n
+
+
+def test_streaming_blocks():
+    """fixed size blocks, state carried over"""
+
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(10000)
+
+    module = CumSumDSPModule()
+    y = np.concatenate(list(stream(module, random_chunks(x, rng), block_size=64)))
+
+    assert y.shape == x.shape
+    assert np.allclose(y, np.cumsum(x))
+    assert set(module.sizes) == {64}
+
+    pass
+
+
+def test_streaming_last_block():
+    """last block padded or passed as is"""
+
+    x = np.arange(100, dtype=float)
+
+    module = CumSumDSPModule()
+    runner = DSPStreamRunner(module, block_size=32, pad=False)
+    y = np.concatenate(list(runner.run([x])))
+    assert np.allclose(y, np.cumsum(x))
+    assert module.sizes == [32, 32, 32, 4]
+
+    with pytest.raises(Exception):
+        DSPStreamRunner(module, block_size=0)
+
+    pass
+
+
+def test_streaming_multichannel():
+    """samples along the last axis"""
+
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((3, 1000))
+
+    module = CumSumDSPModule()
+    y = np.concatenate(
+        list(stream(module, random_chunks(x, rng), block_size=50)), axis=-1
+    )
+    assert np.allclose(y, np.cumsum(x, axis=-1))
+
+    pass
+
+
+def test_streaming_lazy():
+    """generators in, generators out"""
+
+    def source():
+        while True:
+            yield np.ones(10)
+
+    module = CumSumDSPModule()
+    out = stream(module, source(), block_size=16)
+    for i, y in zip(range(1000), out):
+        assert y[-1] == 16 * (i + 1)
+
+    pass
+
+
+class HalfDSPModule(DSPModule):
+    def __init__(self, name="", delay=0.0):
+        super().__init__(name)
+        self._delay = delay
+        pass
+
+    def configure(self):
+        pass
+
+    def process(self, x):
+        time.sleep(self._delay)
+        return 0.5 * x
+
+
+def test_streaming_async_socket():
+    """asyncio : frames read from a socket, processed in order"""
+
+    frame_size = 256
+    x = np.random.standard_normal(frame_size * 50).astype(np.float32)
+
+    async def frames(reader):
+        while True:
+            try:
+                data = await reader.readexactly(4 * frame_size)
+            except asyncio.IncompleteReadError:
+                return
+            yield np.frombuffer(data, dtype=np.float32)
+
+    async def main():
+        client, server = socket.socketpair()
+        reader, client_writer = await asyncio.open_connection(sock=client)
+        _, writer = await asyncio.open_connection(sock=server)
+
+        async def send():
+            for i in range(0, x.size, 1000):
+                writer.write(x[i : i + 1000].tobytes())
+                await writer.drain()
+            writer.close()
+
+        sender = asyncio.ensure_future(send())
+        out = [y async for y in astream(HalfDSPModule(), frames(reader))]
+        await sender
+        client_writer.close()
+        return out
+
+    out = asyncio.run(main())
+    assert len(out) == 50
+    assert np.allclose(np.concatenate(out), 0.5 * x)
+
+    pass
+
+
+def test_streaming_async_backpressure():
+    """asyncio : the source is not read ahead more than max_pending frames"""
+
+    pulled = []
+
+    def source():
+        for i in range(20):
+            pulled.append(i)
+            yield np.full(4, float(i))
+
+    async def main():
+        ahead = []
+        i = 0
+        async for y in astream(HalfDSPModule(delay=0.002), source(), max_pending=2):
+            assert y[0] == 0.5 * i
+            ahead.append(len(pulled) - i)
+            i += 1
+        return ahead
+
+    ahead = asyncio.run(main())
+    assert max(ahead) <= 2 + 2
+
+    pass
+
+
+def test_streaming_async_errors():
+    """asyncio : errors of the source are raised"""
+
+    def source():
+        yield np.zeros(4)
+        raise RuntimeError("source failure")
+
+    async def main():
+        return [y async for y in astream(HalfDSPModule(), source())]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+    pass
+
+
+def test_streaming_async_early_break():
+    """asyncio : the consumer stops early, the feeder blocked on a full queue is cleaned up"""
+
+    def source():
+        while True:
+            yield np.zeros(4)
+
+    async def main():
+        frames = astream(HalfDSPModule(), source(), max_pending=1)
+        count = 0
+        async for _ in frames:
+            count += 1
+            if count == 3:
+                break
+        await frames.aclose()
+
+        return [
+            task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+        ]
+
+    assert asyncio.run(main()) == []
+
+    pass
+
+
+def test_streaming_ring_buffer():
+    ring = DSPRingBuffer(8, channels=2)
+    x = np.arange(24.0).reshape(2, 12)
+
+    assert ring.write(x[:, :6]) == 6
+    assert np.array_equal(ring.read(4), x[:, :4])
+
+    # wraparound : two segments, views on the buffer
+    segments = ring.writable(5)
+    assert [s.shape[-1] for s in segments] == [2, 3]
+    assert all(np.shares_memory(s, ring._buffer) for s in segments)
+    segments[0][...] = x[:, 6:8]
+    segments[1][...] = x[:, 8:11]
+    ring.commit(5)
+    assert ring.available == 7 and ring.space == 1
+
+    # peek : copy of wrapping samples, view otherwise
+    assert np.array_equal(ring.peek(7), x[:, 4:11])
+    assert not np.shares_memory(ring.peek(7), ring._buffer)
+    ring.advance(4)
+    assert np.shares_memory(ring.peek(3), ring._buffer)
+    assert np.array_equal(np.concatenate(ring.readable(3), axis=-1), x[:, 8:11])
+
+    # overrun : extra samples dropped, underrun : nothing read
+    assert ring.write(x) == 5
+    assert ring.overruns == 1
+    assert ring.read(9) is None and ring.peek(9) is None
+    assert ring.underruns == 2
+    assert np.array_equal(ring.read(8), np.concatenate([x[:, 8:11], x[:, :5]], axis=-1))
+
+    with pytest.raises(ValueError):
+        ring.write(np.zeros(4))
+    with pytest.raises(ValueError):
+        ring.readable(1)
+
+
+def test_streaming_ring_buffer_threads():
+    """samples go through in order, whatever the sizes of writes and reads"""
+
+    ring = DSPRingBuffer(64)
+    x = np.arange(20000.0)
+    received = []
+
+    def produce():
+        rng = np.random.default_rng(0)
+        i = 0
+        while i < len(x):
+            i += ring.write(x[i : i + rng.integers(1, 48)])
+            time.sleep(0)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+
+    rng = np.random.default_rng(1)
+    count = 0
+    while count < len(x):
+        block = ring.read(int(rng.integers(1, 48)))
+        if block is None:
+            time.sleep(0)
+            continue
+        received.append(block)
+        count += len(block)
+
+    producer.join()
+    assert np.array_equal(np.concatenate(received), x)
+
+
+@pytest.mark.parametrize(
+    "block_size,hop", [(8, 4), (8, 3), (4, 6), (5, 5), (4, 10), (3, 7), (2, 13)]
+)
+def test_streaming_windows(block_size, hop):
+    x = np.arange(50.0)
+    runner = DSPStreamRunner(IdentityDSPModule(), block_size, hop=hop)
+    windows = list(runner.run([x[:7], x[7:30], x[30:]]))
+
+    # windows start every hop samples, the last one padded if it starts within the signal
+    starts = list(range(0, len(x) - block_size + 1, hop))
+    if starts[-1] + max(block_size, hop) < len(x):
+        starts.append(starts[-1] + hop)
+    assert len(windows) == len(starts)
+    for start, window in zip(starts, windows):
+        ref = np.zeros(block_size)
+        ref[: len(x[start : start + block_size])] = x[start : start + block_size]
+        assert np.array_equal(window, ref)
+
+    # last window passed as is, never longer than the block size
+    runner = DSPStreamRunner(IdentityDSPModule(), block_size, pad=False, hop=hop)
+    windows = list(runner.run([x[:7], x[7:30], x[30:]]))
+    assert len(windows) == len(starts)
+    assert all(len(window) <= block_size for window in windows)
+    assert np.array_equal(windows[-1], x[starts[-1] : starts[-1] + block_size])
+
+
+def test_streaming_windows_spaced_ring():
+    """spaced windows (hop > block size), samples trickling into a small ring buffer"""
+
+    ring = DSPRingBuffer(8)
+    runner = DSPStreamRunner(IdentityDSPModule(), 4, hop=10)
+    x = np.arange(60.0)
+
+    windows = []
+    for i in range(0, len(x), 3):
+        assert ring.write(x[i : i + 3]) == len(x[i : i + 3])
+        windows.extend(runner.drain(ring))
+
+    assert len(windows) == 6
+    for i, window in enumerate(windows):
+        assert np.array_equal(window, x[10 * i : 10 * i + 4])
+    assert ring.available == 0
+
+
+def test_streaming_windows_ring():
+    """windows read by a consumer thread, from a ring buffer fed by a producer"""
+
+    ring = DSPRingBuffer(32, channels=2)
+    runner = DSPStreamRunner(IdentityDSPModule(), 16, hop=8)
+    x = np.random.standard_normal((2, 8 * 50 + 8))
+
+    def produce():
+        i = 0
+        while i < x.shape[-1]:
+            i += ring.write(x[:, i : i + 5])
+            time.sleep(0)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+
+    windows = []
+    while len(windows) < 50:
+        windows.extend(runner.drain(ring))
+        time.sleep(0)
+    producer.join()
+
+    for i, window in enumerate(windows):
+        assert np.array_equal(window, x[:, 8 * i : 8 * i + 16])
+    assert ring.underruns == 0
@@ -20,12 +20,14 @@ __license__ = "Copyright 2022"
 - [x] number/string: conflict if string + range
 - [x] number/range: check preservation of format after roundings (int, floats)
 
-- [ ] number/set: in/out of set
+- [x] number/set: in/out of set, snapping to the nearest value
+- [x] number/set: batch snapping (quantize_many)
+- [x] number/set: snapping of small integers (uint8/int8), no wrap around
 
 - [ ] bool : set with range and check that it is ignored
 
 - [ ] string/format: in/out format
-- [ ] string/set: in/out set
+- [x] string/set: in/out set
 """
 
 
@@ -255,3 +257,206 @@ def test_variable_number_range_string_conflict():
 
     with pytest.raises(Exception):
         var = DSPVariable(dtype=str, range=(0.0, 0.1, 1.0, 2.0))
+
+
+def test_variable_number_range_quantize_many():
+    """vectorized roundings and bounds, identical to the scalar setter"""
+
+    var = DSPVariable(dtype=float, range=(0.0, 0.1, 1.0, 0.0))
+    candidates = np.random.uniform(-0.5, 1.5, 1000)
+
+    values = var.quantize_many(candidates)
+    assert values.shape == candidates.shape
+    assert values.dtype == np.float64
+
+    for c, v in zip(candidates, values):
+        var.val = float(c)
+        assert var.val == v
+
+    # the value of the variable is left untouched
+    var.val = 0.5
+    var.quantize_many(candidates)
+    assert almost_equal(var.val, 0.5)
+
+    # check for ints
+    var = DSPVariable(dtype=int, range=(0, 3, 100, 3))
+    values = var.quantize_many([-4, 37, 101, 200])
+    assert values.tolist() == [0, 36, 100, 100]
+    assert values.dtype.kind == "i"
+
+    # type conflict
+    with pytest.raises(Exception):
+        var.quantize_many(np.array([0.5, 1.5]))
+
+
+def test_variable_number_range_apply_many():
+    """vectorized setter keeps the last value"""
+
+    var = DSPVariable(dtype=float, range=(0.0, 0.1, 1.0, 0.0))
+    values = var.apply_many(np.linspace(0.0, 2.0, 50))
+    assert almost_equal(values[-1], 1.0)
+    assert almost_equal(var.val, 1.0)
+    assert isinstance(var.val, float)
+
+    # constant variables are not changed
+    var.status = DSPVariableStatus.DSP_VAR_CONSTANT
+    var.apply_many(np.zeros(10))
+    assert almost_equal(var.val, 1.0)
+
+
+def test_variable_number_range_fast_path():
+    """scalar fast path is bit-identical to the numpy implementation"""
+
+    for dtype, range in (
+        (float, (0.0, 0.1, 1.0)),
+        (float, (-1.0, 0.1, -0.0)),
+        (float, (-5.0, 0.25, 5.0)),
+        (int, (-50, 7, 50)),
+    ):
+        var = DSPVariable(dtype=dtype, range=range)
+        if dtype == float:
+            candidates = np.random.uniform(-10.0, 10.0, 1000).tolist() + [-0.04, -0.0]
+        else:
+            candidates = np.random.randint(-100, 100, 1000).tolist()
+
+        for c in candidates:
+            ref = var._quantize(c)
+            var.val = c
+            assert type(var.val) is type(ref)
+            assert np.copysign(1.0, var.val) == np.copysign(1.0, ref)
+            assert var.val == ref
+
+    # non finite values fall back to numpy
+    var = DSPVariable(dtype=float, range=(0.0, 0.1, 1.0))
+    var.val = float("inf")
+    assert var.val == 1.0
+
+
+def test_variable_range_layout():
+    """range stored as fixed attributes, no per-instance dict"""
+
+    var = DSPVariable(dtype=float, range=(0.0, 0.1, 1.0, 0.5))
+    assert var.range == (0.0, 0.1, 1.0, 0.5)
+    assert not hasattr(var, "__dict__")
+
+    # default value is the lower bound
+    var = DSPVariable(dtype=int, range=(2, 1, 10))
+    assert var.range == (2, 1, 10, 2)
+
+    # not ranged
+    var = DSPVariable(dtype=str)
+    assert var.range is None
+
+
+def test_variable_vector():
+    """vector of values, one per channel"""
+
+    var = DSPVectorVariable(dtype=float, size=4, range=(0.0, 0.1, 1.0, 0.5))
+    assert np.allclose(var.val, 0.5)
+    assert len(var) == 4
+
+    # scalar applied to every item
+    var.val = 0.33
+    assert np.allclose(var.val, 0.3)
+
+    # array sanitized in one pass
+    var.val = np.array([-1.0, 0.26, 0.74, 2.0])
+    assert np.allclose(var.val, [0.0, 0.3, 0.7, 1.0])
+    var.set_item(1, 0.9)
+    assert np.allclose(var.val, [0.0, 0.9, 0.7, 1.0])
+
+    # shape and type conflicts
+    with pytest.raises(Exception):
+        var.val = np.zeros(3)
+    with pytest.raises(Exception):
+        var.val = 1
+
+    # resize keeps existing items
+    var.resize(6)
+    assert np.allclose(var.val, [0.0, 0.9, 0.7, 1.0, 0.5, 0.5])
+    var.resize(2)
+    assert np.allclose(var.val, [0.0, 0.9])
+
+    # constant
+    var.status = DSPVariableStatus.DSP_VAR_CONSTANT
+    var.val = 0.1
+    assert np.allclose(var.val, [0.0, 0.9])
+
+    # not ranged
+    var = DSPVectorVariable(dtype=bool, size=3)
+    assert var.val.tolist() == [False, False, False]
+
+
+def test_variable_number_set():
+    """snapping to the nearest allowed value"""
+
+    var = DSPVariable(dtype=float, set=(48000.0, 44100.0, 96000.0, 48000.0))
+    assert var.val == 48000.0
+    assert var.set == (44100.0, 48000.0, 96000.0)
+    assert var.range is None
+
+    var.val = 50000.0
+    assert var.val == 48000.0
+    var.val = 1e9
+    assert var.val == 96000.0
+    var.val = 0.0
+    assert var.val == 44100.0 and isinstance(var.val, float)
+
+    assert var.contains(96000.0) and not var.contains(50000.0)
+
+    # batch snapping, lowest value when halfway
+    values = var.quantize_many([-1.0, 46050.0, 72000.0, 72001.0, np.inf])
+    assert np.array_equal(values, [44100.0, 44100.0, 48000.0, 96000.0, 96000.0])
+
+    with pytest.raises(ValueError):
+        DSPVariable(dtype=int, set=(1, 2.0))
+    with pytest.raises(ValueError):
+        DSPVariable(dtype=int, set=())
+
+
+def test_variable_number_set_small_int():
+    """distances to the allowed values must not wrap around"""
+
+    var = DSPVariable(dtype=np.uint8, set=(np.uint8(10), np.uint8(20)))
+    var.val = np.uint8(5)
+    assert var.val == 10 and isinstance(var.val, np.uint8)
+    var.val = np.uint8(255)
+    assert var.val == 20
+    values = var.quantize_many(np.array([0, 5, 15, 16, 255], dtype=np.uint8))
+    assert values.dtype == np.uint8
+    assert values.tolist() == [10, 10, 10, 20, 20]
+
+    var = DSPVariable(dtype=np.int8, set=(np.int8(-100), np.int8(100)))
+    var.val = np.int8(90)
+    assert var.val == 100 and isinstance(var.val, np.int8)
+    var.val = np.int8(-90)
+    assert var.val == -100
+    values = var.quantize_many(np.array([-128, -1, 0, 1, 127], dtype=np.int8))
+    assert values.tolist() == [-100, -100, -100, 100, 100]
+
+
+def test_variable_string_set():
+    """membership of strings"""
+
+    var = DSPVariable(dtype=str, set=("lowpass", "highpass", "bandpass"))
+    assert var.val == "lowpass"
+    assert var.set == ("lowpass", "highpass", "bandpass")
+
+    var.val = "bandpass"
+    assert var.val == "bandpass"
+    with pytest.raises(ValueError):
+        var.val = "notch"
+    assert var.val == "bandpass"
+    assert var.contains("highpass") and not var.contains("notch")
+
+    values = var.quantize_many(["highpass", "lowpass"])
+    assert values.tolist() == ["highpass", "lowpass"]
+    with pytest.raises(ValueError):
+        var.quantize_many(["highpass", "notch"])
+
+    # vectors, as wide as the longest allowed value
+    vec = DSPVectorVariable(str, size=2, set=("a", "bbb"))
+    vec.set_item(1, "bbb")
+    assert vec.val.tolist() == ["a", "bbb"]
+    vec.resize(3)
+    assert vec.val.tolist() == ["a", "bbb", "a"]